@@ -6,9 +6,31 @@ cdef extern from "stdlib.h":
     pass
 
 
+cdef extern from "math.h" nogil:
+    double sin(double)
+    double cos(double)
+    double atan2(double, double)
+    double fmod(double, double)
+    double sqrt(double)
+    double floor(double)
+    double ceil(double)
+    double fabs(double)
+    double fmin(double, double)
+    double fmax(double, double)
+    double HUGE_VAL
+    double M_PI
+
+
 cimport  c_numpy
-from c_numpy cimport npy_bool
+from c_numpy cimport npy_bool, npy_intp
 cimport c_python
+from libc.stdlib cimport malloc, realloc, free, qsort
+from libc.stdint cimport uint32_t, uint64_t
+from libc.string cimport memcpy, memset
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 c_numpy.import_array()
 
@@ -65,6 +87,819 @@ class BaseClassInitException(Exception):
     pass
 
 
+# Helpers for the bounding box / span computation. A span is the range
+# of the parameter t for which the point (px + t*dx, py + t*dy) may be
+# inside a region. Spans only need to be conservative: the pixels they
+# select are still tested with _inside. They are widened by a relative
+# epsilon for the rounding errors, e.g. of the rotations by multiples of
+# 90 degrees, whose sines and cosines are not exact.
+
+cdef double _SPAN_EPS = 1.e-9
+
+cdef inline double _widen_lo(double v) noexcept nogil:
+    return v - _SPAN_EPS * (fabs(v) + 1.)
+
+cdef inline double _widen_hi(double v) noexcept nogil:
+    return v + _SPAN_EPS * (fabs(v) + 1.)
+
+cdef int _span_quadratic(double a, double b, double c,
+                         double *t1, double *t2) noexcept nogil:
+    # range of t satisfying a*t**2 + b*t + c <= 0, assuming a >= 0
+    cdef double d, sd
+
+    if a == 0.:
+        if b == 0.:
+            t1[0] = -HUGE_VAL
+            t2[0] = HUGE_VAL
+            return c <= 0.
+        elif b > 0.:
+            t1[0] = -HUGE_VAL
+            t2[0] = -c / b
+        else:
+            t1[0] = -c / b
+            t2[0] = HUGE_VAL
+        return 1
+
+    d = b * b - 4. * a * c
+    if d < 0.:
+        # allow for the rounding error of a tangent line
+        if d < -1.e-9 * (b * b + fabs(4. * a * c)):
+            return 0
+        d = 0.
+
+    sd = sqrt(d)
+    t1[0] = (-b - sd) / (2. * a)
+    t2[0] = (-b + sd) / (2. * a)
+    return 1
+
+cdef int _span_slab(double p, double d, double lo, double hi,
+                    double *t1, double *t2) noexcept nogil:
+    # narrow [t1, t2] to the range of t satisfying lo <= p + t*d <= hi
+    cdef double ta, tb, eps
+
+    eps = _SPAN_EPS * (fabs(lo) + fabs(hi) + fabs(p) + 1.)
+    lo -= eps
+    hi += eps
+
+    if d == 0.:
+        return (lo <= p) & (p <= hi)
+
+    ta = (lo - p) / d
+    tb = (hi - p) / d
+    if ta > tb:
+        ta, tb = tb, ta
+
+    if ta > t1[0]:
+        t1[0] = ta
+    if tb < t2[0]:
+        t2[0] = tb
+
+    return t1[0] <= t2[0]
+
+cdef void _bbox_set_empty(double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+    x1[0] = HUGE_VAL
+    y1[0] = HUGE_VAL
+    x2[0] = -HUGE_VAL
+    y2[0] = -HUGE_VAL
+
+cdef void _bbox_set_unbounded(double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+    x1[0] = -HUGE_VAL
+    y1[0] = -HUGE_VAL
+    x2[0] = HUGE_VAL
+    y2[0] = HUGE_VAL
+
+cdef c_numpy.npy_intp _clip_index(double v, c_numpy.npy_intp lo,
+                                  c_numpy.npy_intp hi) noexcept nogil:
+    # v is clipped before the conversion so that infinities are safe
+    if v <= lo:
+        return lo
+    if v >= hi:
+        return hi
+    return <c_numpy.npy_intp> v
+
+
+# Rasterized regions are represented as runs of pixels. A _Runs holds the
+# runs of the rows y1 <= y < y2. The runs of row y are the indices
+# row[y - y1] <= k < row[y - y1 + 1], and the k-th run covers the columns
+# x[2*k] <= x < x[2*k + 1]. The runs of a row are sorted and disjoint.
+
+cdef struct _Runs:
+    npy_intp y1
+    npy_intp y2
+    npy_intp *row
+    npy_intp *x
+    npy_intp n
+    npy_intp size
+    npy_intp cur
+
+cdef int _runs_init(_Runs *r, npy_intp y1, npy_intp y2) except -1 nogil:
+    if y2 < y1:
+        y2 = y1
+
+    r.y1 = y1
+    r.y2 = y2
+    r.n = 0
+    r.size = 0
+    r.cur = 0
+    r.x = NULL
+    r.row = <npy_intp *> malloc((y2 - y1 + 1) * sizeof(npy_intp))
+    if r.row == NULL:
+        with gil:
+            raise MemoryError()
+    r.row[0] = 0
+    return 0
+
+cdef void _runs_free(_Runs *r) noexcept nogil:
+    free(r.row)
+    free(r.x)
+    r.row = NULL
+    r.x = NULL
+
+cdef int _runs_add(_Runs *r, npy_intp a, npy_intp b) except -1 nogil:
+    # append the run [a, b) to the current row. Runs must be added in
+    # order; a run touching the previous one is merged into it.
+    cdef npy_intp *x
+
+    if a >= b:
+        return 0
+
+    if (r.n > r.row[r.cur]) and (r.x[2 * r.n - 1] >= a):
+        if b > r.x[2 * r.n - 1]:
+            r.x[2 * r.n - 1] = b
+        return 0
+
+    if r.n == r.size:
+        x = <npy_intp *> realloc(r.x, 2 * (2 * r.size + 8) * sizeof(npy_intp))
+        if x == NULL:
+            with gil:
+                raise MemoryError()
+        r.x = x
+        r.size = 2 * r.size + 8
+
+    r.x[2 * r.n] = a
+    r.x[2 * r.n + 1] = b
+    r.n += 1
+    return 0
+
+cdef void _runs_end_row(_Runs *r) noexcept nogil:
+    r.cur += 1
+    r.row[r.cur] = r.n
+
+cdef int _runs_fill_row(_Runs *r, npy_intp *x, npy_intp n) except -1 nogil:
+    # add the n runs of x to the current row and end it
+    cdef npy_intp k
+
+    for k from 0 <= k < n:
+        _runs_add(r, x[2 * k], x[2 * k + 1])
+    _runs_end_row(r)
+    return 0
+
+cdef int _runs_and_row(_Runs *r, npy_intp *a, npy_intp na,
+                       npy_intp *b, npy_intp nb) except -1 nogil:
+    # add the intersection of two sorted run lists and end the row
+    cdef npy_intp i, j, lo, hi
+
+    i = 0
+    j = 0
+    while (i < na) and (j < nb):
+        lo = a[2 * i] if a[2 * i] > b[2 * j] else b[2 * j]
+        hi = a[2 * i + 1] if a[2 * i + 1] < b[2 * j + 1] else b[2 * j + 1]
+        if lo < hi:
+            _runs_add(r, lo, hi)
+        if a[2 * i + 1] < b[2 * j + 1]:
+            i += 1
+        else:
+            j += 1
+    _runs_end_row(r)
+    return 0
+
+cdef int _runs_not_row(_Runs *r, npy_intp *a, npy_intp na,
+                       npy_intp x1, npy_intp x2) except -1 nogil:
+    # add the complement of the sorted run list within [x1, x2)
+    cdef npy_intp k, start
+
+    start = x1
+    for k from 0 <= k < na:
+        _runs_add(r, start, a[2 * k])
+        start = a[2 * k + 1]
+    _runs_add(r, start, x2)
+    _runs_end_row(r)
+    return 0
+
+cdef int _cmp_run(const void *a, const void *b) noexcept nogil:
+    cdef npy_intp xa = (<npy_intp *> a)[0]
+    cdef npy_intp xb = (<npy_intp *> b)[0]
+    return (xa > xb) - (xa < xb)
+
+cdef int _runs_or_row(_Runs *r, npy_intp *x, npy_intp n) except -1 nogil:
+    # add the union of n unsorted runs (sorted in place) and end the row
+    qsort(x, n, 2 * sizeof(npy_intp), _cmp_run)
+    return _runs_fill_row(r, x, n)
+
+cdef void _runs_clear(_Runs *r) noexcept nogil:
+    # make a _Runs safe to free before it is initialized
+    r.row = NULL
+    r.x = NULL
+    r.n = 0
+
+
+# Helpers for the pixel coverage (see RegionBase.mask). A pixel is given
+# to _cover as its four corners, anticlockwise, in the coordinates of the
+# region.
+
+# The distance from the center of a pixel to its corners, rounded up.
+cdef double _PIXEL_RADIUS = 0.7072
+
+# Polygons are clipped by up to four lines with a pipeline of
+# Sutherland-Hodgman stages, each passing the points it keeps to the
+# next one, and the last accumulating the area. Each stage keeps the
+# points p with cross(d, p - l) >= 0, i.e. on the left of the line
+# through l with the direction d.
+
+cdef struct _ClipStage:
+    double lx, ly, dx, dy
+    double fx, fy, fs
+    double px, py, ps
+    int n
+
+cdef struct _Clip:
+    _ClipStage stage[4]
+    int m
+    # the area is accumulated relative to the point (ox, oy)
+    double ox, oy
+    double fx, fy, px, py
+    double area
+    int n
+
+cdef void _clip_init(_Clip *c, double ox, double oy) noexcept nogil:
+    c.m = 0
+    c.n = 0
+    c.ox = ox
+    c.oy = oy
+    c.area = 0.
+
+cdef void _clip_add_line(_Clip *c, double lx, double ly,
+                         double dx, double dy) noexcept nogil:
+    c.stage[c.m].lx = lx
+    c.stage[c.m].ly = ly
+    c.stage[c.m].dx = dx
+    c.stage[c.m].dy = dy
+    c.stage[c.m].n = 0
+    c.m += 1
+
+cdef void _clip_push(_Clip *c, int k, double x, double y) noexcept nogil:
+    cdef _ClipStage *s
+    cdef double side, t
+
+    if k == c.m:
+        x -= c.ox
+        y -= c.oy
+        if c.n == 0:
+            c.fx, c.fy = x, y
+        else:
+            c.area += c.px * y - x * c.py
+        c.px, c.py = x, y
+        c.n += 1
+        return
+
+    s = &c.stage[k]
+    side = s.dx * (y - s.ly) - s.dy * (x - s.lx)
+    if s.n == 0:
+        s.fx, s.fy, s.fs = x, y, side
+    elif (side >= 0.) != (s.ps >= 0.):
+        t = s.ps / (s.ps - side)
+        _clip_push(c, k + 1, s.px + t * (x - s.px), s.py + t * (y - s.py))
+    if side >= 0.:
+        _clip_push(c, k + 1, x, y)
+    s.px, s.py, s.ps = x, y, side
+    s.n += 1
+
+cdef double _clip_close(_Clip *c) noexcept nogil:
+    # close the polygon, and return the signed area of what is kept
+    cdef _ClipStage *s
+    cdef double t
+    cdef int k
+
+    for k from 0 <= k < c.m:
+        s = &c.stage[k]
+        if (s.n > 0) and ((s.fs >= 0.) != (s.ps >= 0.)):
+            t = s.ps / (s.ps - s.fs)
+            _clip_push(c, k + 1, s.px + t * (s.fx - s.px),
+                       s.py + t * (s.fy - s.py))
+    if c.n > 0:
+        c.area += c.px * c.fy - c.fx * c.py
+    return .5 * c.area
+
+cdef double _quad_area(double *qx, double *qy) noexcept nogil:
+    return .5 * ((qx[0] - qx[2]) * (qy[1] - qy[3]) -
+                 (qx[1] - qx[3]) * (qy[0] - qy[2]))
+
+cdef double _clip_quad(double *qx, double *qy, _Clip *c) noexcept nogil:
+    # the fraction of the quad kept by the lines of c
+    cdef int i
+    cdef double a
+
+    a = _quad_area(qx, qy)
+    if not (a > 0.):
+        return 0.
+    for i from 0 <= i < 4:
+        _clip_push(c, 0, qx[i], qy[i])
+    return _clip_close(c) / a
+
+cdef double _fraction(double v) noexcept nogil:
+    if v < 0.:
+        return 0.
+    if v > 1.:
+        return 1.
+    return v
+
+cdef double _disk_angle(double ax, double ay, double bx, double by) noexcept nogil:
+    return atan2(ax * by - ay * bx, ax * bx + ay * by)
+
+cdef double _disk_triangle_area(double ax, double ay,
+                                double bx, double by) noexcept nogil:
+    # the signed area of the triangle (0, a, b) within the unit disk
+    cdef double dx, dy, qa, qb, qc, d, t1, t2, x1, y1, x2, y2
+
+    dx = bx - ax
+    dy = by - ay
+    qa = dx * dx + dy * dy
+    if qa == 0.:
+        return 0.
+    qb = ax * dx + ay * dy
+    qc = ax * ax + ay * ay - 1.
+
+    d = qb * qb - qa * qc
+    if d <= 0.:
+        return .5 * _disk_angle(ax, ay, bx, by)
+
+    d = sqrt(d)
+    t1 = (-qb - d) / qa
+    t2 = (-qb + d) / qa
+    if (t2 <= 0.) or (t1 >= 1.):
+        return .5 * _disk_angle(ax, ay, bx, by)
+
+    if t1 < 0.:
+        t1 = 0.
+    if t2 > 1.:
+        t2 = 1.
+    x1, y1 = ax + t1 * dx, ay + t1 * dy
+    x2, y2 = ax + t2 * dx, ay + t2 * dy
+    return .5 * (_disk_angle(ax, ay, x1, y1) + (x1 * y2 - y1 * x2) +
+                 _disk_angle(x2, y2, bx, by))
+
+cdef double _disk_quad(double *qx, double *qy) noexcept nogil:
+    # the fraction of the quad within the unit disk
+    cdef int i, j
+    cdef double a, r
+
+    a = _quad_area(qx, qy)
+    if not (a > 0.):
+        return 0.
+
+    j = 0
+    for i from 0 <= i < 4:
+        if qx[i] * qx[i] + qy[i] * qy[i] > 1.:
+            break
+        j += 1
+    if j == 4:
+        # convex, and all corners inside
+        return 1.
+    if ((fmin(fmin(qx[0], qx[1]), fmin(qx[2], qx[3])) >= 1.) or
+        (fmax(fmax(qx[0], qx[1]), fmax(qx[2], qx[3])) <= -1.) or
+        (fmin(fmin(qy[0], qy[1]), fmin(qy[2], qy[3])) >= 1.) or
+        (fmax(fmax(qy[0], qy[1]), fmax(qy[2], qy[3])) <= -1.)):
+        return 0.
+
+    r = 0.
+    j = 3
+    for i from 0 <= i < 4:
+        r += _disk_triangle_area(qx[j], qy[j], qx[i], qy[i])
+        j = i
+    return _fraction(r / a)
+
+
+# Rows (or points) given to a thread at a time are at least this many,
+# and each thread gets a few chunks to even out the load.
+cdef npy_intp _MIN_ROWS_PER_CHUNK = 16
+cdef npy_intp _MIN_POINTS_PER_CHUNK = 65536
+cdef int _CHUNKS_PER_THREAD = 4
+
+
+def _chunks(npy_intp start, npy_intp stop, n_threads, npy_intp min_size):
+    """
+    Split the range [start, stop) into chunks for n_threads threads, or
+    return None if it should be done in the calling thread.
+    """
+    cdef npy_intp n, size
+
+    if n_threads is None:
+        return None
+    if n_threads < 1:
+        raise ValueError("n_threads must be a positive integer: "
+                         "%s is given" % (str(n_threads)))
+
+    n = min(n_threads * _CHUNKS_PER_THREAD, (stop - start) // min_size)
+    if (n_threads == 1) or (n <= 1):
+        return None
+
+    size = (stop - start + n - 1) // n
+    return [(i, min(i + size, stop)) for i in range(start, stop, size)]
+
+
+def _run_chunks(func, chunks, n_threads):
+    # The work of func is done without the GIL, so that the threads run
+    # in parallel. Returns the results of the chunks, in order.
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return list(executor.map(lambda c: func(*c), chunks))
+
+
+# A region tree compiled for point queries: the nodes as an array of
+# ops in prefix order, where the children of an op follow it and end is
+# the index after its subtree. Nested lists of the same kind are merged,
+# and double negations dropped. Primitives which have no op of their own
+# are called through their _inside.
+
+cdef enum:
+    _OP_OR
+    _OP_AND
+    _OP_NOT
+    _OP_ROTATE
+    _OP_TRANSLATE
+    _OP_CIRCLE
+    _OP_ELLIPSE
+    _OP_BOX
+    _OP_REGION
+
+cdef struct _Op:
+    int code
+    int end
+    double p[6]
+    void *region
+
+
+cdef class _Program:
+    cdef _Op *ops
+    cdef int n
+    cdef int size
+
+    # the regions called by _OP_REGION, kept alive with the program
+    cdef list regions
+
+    def __init__(self):
+        self.regions = []
+
+    def __dealloc__(self):
+        free(self.ops)
+
+    cdef _Op *emit(self, int code) except NULL:
+        cdef _Op *ops
+
+        if self.n == self.size:
+            ops = <_Op *> realloc(self.ops, (2 * self.size + 8) * sizeof(_Op))
+            if ops == NULL:
+                raise MemoryError()
+            self.ops = ops
+            self.size = 2 * self.size + 8
+
+        self.ops[self.n].code = code
+        self.ops[self.n].end = self.n + 1
+        self.ops[self.n].region = NULL
+        self.n += 1
+        return &self.ops[self.n - 1]
+
+    cdef int emit_region(self, RegionBase region) except -1:
+        self.regions.append(region)
+        self.emit(_OP_REGION).region = <void *> region
+        return 0
+
+    cdef int close(self, int i) except -1:
+        # the subtree of the op i ends here
+        self.ops[i].end = self.n
+        return 0
+
+
+cdef npy_bool _run_ops(_Op *ops, int i, double x, double y) noexcept nogil:
+    cdef _Op *op
+    cdef int j
+    cdef double x1, y1, x2, y2, dist2
+
+    while True:
+        op = &ops[i]
+
+        if op.code == _OP_OR:
+            j = i + 1
+            while j < op.end:
+                if _run_ops(ops, j, x, y):
+                    return 1
+                j = ops[j].end
+            return 0
+
+        elif op.code == _OP_AND:
+            j = i + 1
+            while j < op.end:
+                if not _run_ops(ops, j, x, y):
+                    return 0
+                j = ops[j].end
+            return 1
+
+        elif op.code == _OP_NOT:
+            return not _run_ops(ops, i + 1, x, y)
+
+        # the transforms and shapes below are evaluated as in the
+        # _transform and _inside of their classes.
+        elif op.code == _OP_ROTATE:
+            x1 = x - op.p[2]
+            y1 = y - op.p[3]
+
+            x2 = op.p[1] * x1 + op.p[0] * y1
+            y2 = -op.p[0] * x1 + op.p[1] * y1
+
+            x = x2 + op.p[2]
+            y = y2 + op.p[3]
+            i += 1
+
+        elif op.code == _OP_TRANSLATE:
+            x = x - op.p[0]
+            y = y - op.p[1]
+            i += 1
+
+        elif op.code == _OP_CIRCLE:
+            dist2 = ((x - op.p[0]) * op.p[2]) ** 2 + ((y - op.p[1]) * op.p[3]) ** 2
+            return (dist2 <= op.p[4])
+
+        elif op.code == _OP_ELLIPSE:
+            dist2 = op.p[2] * (x - op.p[0]) ** 2 + op.p[3] * (y - op.p[1]) ** 2
+            return (dist2 <= op.p[4])
+
+        elif op.code == _OP_BOX:
+            return (op.p[0] <= x) & (x <= op.p[1]) & (op.p[2] <= y) & (y <= op.p[3])
+
+        else:
+            return (<RegionBase> op.region)._inside(x, y)
+
+
+cdef _inside_points(_Program p, c_numpy.ndarray xa, c_numpy.ndarray ya,
+                    npy_intp stride, npy_intp offset,
+                    c_numpy.ndarray ra, npy_intp i1, npy_intp i2):
+    cdef double *xd = <double *> c_numpy.PyArray_DATA(xa)
+    cdef double *yd = <double *> c_numpy.PyArray_DATA(ya)
+    cdef npy_bool *rd = <npy_bool *> c_numpy.PyArray_DATA(ra)
+    cdef npy_intp i
+
+    with nogil:
+        for i from i1 <= i < i2:
+            rd[i] = _run_ops(p.ops, 0, xd[stride * i], yd[stride * i + offset])
+
+
+cdef _runs_of_rows(RegionBase region, npy_intp y1, npy_intp y2,
+                   npy_intp x1, npy_intp x2):
+    # the runs of the rows [y1, y2), as arrays (rows, starts, stops)
+    cdef npy_intp *rd
+    cdef npy_intp *sd
+    cdef npy_intp *ed
+    cdef npy_intp iy, k
+    cdef _Runs r
+
+    _runs_clear(&r)
+    try:
+        with nogil:
+            region._raster(y1, y2, x1, x2, &r)
+
+        rows = np.empty(r.n, dtype=np.intp)
+        starts = np.empty(r.n, dtype=np.intp)
+        stops = np.empty(r.n, dtype=np.intp)
+        rd = <npy_intp *> c_numpy.PyArray_DATA(rows)
+        sd = <npy_intp *> c_numpy.PyArray_DATA(starts)
+        ed = <npy_intp *> c_numpy.PyArray_DATA(stops)
+
+        with nogil:
+            for iy from y1 <= iy < y2:
+                for k from r.row[iy - y1] <= k < r.row[iy - y1 + 1]:
+                    rd[k] = iy
+                    sd[k] = r.x[2 * k]
+                    ed[k] = r.x[2 * k + 1]
+    finally:
+        _runs_free(&r)
+
+    return rows, starts, stops
+
+
+cdef inline double _read_value(char *p, int size, bint swap) noexcept nogil:
+    # the float of size 4 or 8 bytes at p, byte-swapped if needed
+    cdef uint32_t u4
+    cdef uint64_t u8
+    cdef float f4
+    cdef double f8
+
+    if size == 4:
+        memcpy(&u4, p, 4)
+        if swap:
+            u4 = ((u4 >> 24) | ((u4 >> 8) & 0xFF00u) |
+                  ((u4 << 8) & 0xFF0000u) | (u4 << 24))
+        memcpy(&f4, &u4, 4)
+        return f4
+
+    memcpy(&u8, p, 8)
+    if swap:
+        u8 = ((u8 >> 32) | (u8 << 32))
+        u8 = (((u8 >> 16) & 0x0000FFFF0000FFFFu) |
+              ((u8 & 0x0000FFFF0000FFFFu) << 16))
+        u8 = (((u8 >> 8) & 0x00FF00FF00FF00FFu) |
+              ((u8 & 0x00FF00FF00FF00FFu) << 8))
+    memcpy(&f8, &u8, 8)
+    return f8
+
+
+cdef _reduce_rows(RegionBase region, c_numpy.ndarray data,
+                  npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2):
+    # (sum, count, min, max) of the float pixels of data inside the
+    # filter in the rows [y1, y2), read along the runs
+    cdef char *dd = <char *> c_numpy.PyArray_DATA(data)
+    cdef npy_intp sy = data.strides[0]
+    cdef npy_intp sx = data.strides[1]
+    cdef int size = data.dtype.itemsize
+    cdef bint swap = not data.dtype.isnative
+    # read directly for aligned floats in the native byte order
+    cdef bint direct = (not swap) and (<object> data).flags.aligned
+    cdef double total = 0., low = HUGE_VAL, high = -HUGE_VAL, v
+    cdef npy_intp count = 0
+    cdef bint nan = 0
+    cdef npy_intp iy, ix, k
+    cdef char *row
+    cdef _Runs r
+
+    _runs_clear(&r)
+    try:
+        with nogil:
+            region._raster(y1, y2, x1, x2, &r)
+            for iy from y1 <= iy < y2:
+                row = dd + iy * sy
+                for k from r.row[iy - y1] <= k < r.row[iy - y1 + 1]:
+                    count += r.x[2 * k + 1] - r.x[2 * k]
+                    for ix from r.x[2 * k] <= ix < r.x[2 * k + 1]:
+                        if not direct:
+                            v = _read_value(row + ix * sx, size, swap)
+                        elif size == 8:
+                            v = (<double *> (row + ix * sx))[0]
+                        else:
+                            v = (<float *> (row + ix * sx))[0]
+                        total += v
+                        if v < low:
+                            low = v
+                        if v > high:
+                            high = v
+                        if v != v:
+                            nan = 1
+    finally:
+        _runs_free(&r)
+
+    if nan:
+        low = high = total
+    return total, count, low, high
+
+
+cdef _pack_rows(RegionBase region, c_numpy.ndarray ra,
+                npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2):
+    # Set the bits of the pixels of the rows [y1, y2) which are inside,
+    # the pixel x of a row being the bit 7 - x % 8 of its byte x // 8
+    # (as numpy.packbits).
+    cdef unsigned char *rd = <unsigned char *> c_numpy.PyArray_DATA(ra)
+    cdef npy_intp stride = ra.strides[0]
+    cdef unsigned char *row
+    cdef npy_intp iy, k, a, b
+    cdef _Runs r
+
+    _runs_clear(&r)
+    try:
+        with nogil:
+            region._raster(y1, y2, x1, x2, &r)
+            for iy from y1 <= iy < y2:
+                row = rd + iy * stride
+                for k from r.row[iy - y1] <= k < r.row[iy - y1 + 1]:
+                    a = r.x[2 * k]
+                    b = r.x[2 * k + 1] - 1
+                    if (a >> 3) == (b >> 3):
+                        row[a >> 3] |= (0xFF >> (a & 7)) & (0xFF << (7 - (b & 7)))
+                    else:
+                        row[a >> 3] |= 0xFF >> (a & 7)
+                        memset(row + (a >> 3) + 1, 0xFF, (b >> 3) - (a >> 3) - 1)
+                        row[b >> 3] |= (0xFF << (7 - (b & 7))) & 0xFF
+    finally:
+        _runs_free(&r)
+
+
+cdef _count_rows(RegionBase scaled, c_numpy.ndarray ra,
+                 npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2):
+    # Set the rows [y1, y2) of ra to the fraction of the points of the
+    # grid n times finer inside, given the filter on that grid.
+    cdef float *rd = <float *> c_numpy.PyArray_DATA(ra)
+    cdef npy_intp nx = ra.dimensions[1]
+    cdef npy_intp n = <npy_intp> (<_Scaled> scaled).n
+    cdef npy_intp *count
+    cdef npy_intp iy, iy0, k, a, b, p1, p2, run
+    cdef _Runs r
+
+    # count[p] is the number of points of the pixel x1 + p, and the
+    # pixels between the ends of a run are counted in the differences
+    # count[nw + 1 + p] instead.
+    cdef npy_intp nw = x2 - x1
+
+    count = <npy_intp *> malloc(2 * (nw + 1) * sizeof(npy_intp))
+    if count == NULL:
+        raise MemoryError()
+
+    _runs_clear(&r)
+    try:
+        with nogil:
+            (<RegionBase> scaled)._raster(n * y1, n * y2, n * x1, n * x2, &r)
+            for iy0 from y1 <= iy0 < y2:
+                memset(count, 0, 2 * (nw + 1) * sizeof(npy_intp))
+                for iy from n * iy0 <= iy < n * (iy0 + 1):
+                    for k from r.row[iy - n * y1] <= k < r.row[iy - n * y1 + 1]:
+                        a = r.x[2 * k] - n * x1
+                        b = r.x[2 * k + 1] - n * x1
+                        p1 = a // n
+                        p2 = (b - 1) // n
+                        if p1 == p2:
+                            count[p1] += b - a
+                        else:
+                            count[p1] += (p1 + 1) * n - a
+                            count[p2] += b - p2 * n
+                            count[nw + 1 + p1 + 1] += n
+                            count[nw + 1 + p2] -= n
+                run = 0
+                for k from 0 <= k < nw:
+                    run += count[nw + 1 + k]
+                    rd[iy0 * nx + x1 + k] = (count[k] + run) / (<double> n * n)
+    finally:
+        _runs_free(&r)
+        free(count)
+
+
+cdef _cover_rows(RegionBase region, c_numpy.ndarray ra, c_numpy.ndarray center,
+                 c_numpy.ndarray band_mask, npy_intp y1, npy_intp y2,
+                 npy_intp x1, npy_intp x2, int n):
+    # Set the rows [y1, y2) of ra to the fraction of the pixels inside
+    # the region: as given by the centers, but for the pixels in the band.
+    cdef float *rd = <float *> c_numpy.PyArray_DATA(ra)
+    cdef npy_bool *cd = <npy_bool *> c_numpy.PyArray_DATA(center)
+    cdef npy_bool *bd = <npy_bool *> c_numpy.PyArray_DATA(band_mask)
+    cdef npy_intp nx = ra.dimensions[1]
+    cdef npy_intp iy, ix, k
+    cdef double qx[4]
+    cdef double qy[4]
+    cdef double v
+
+    with nogil:
+        for iy from y1 <= iy < y2:
+            for ix from x1 <= ix < x2:
+                k = iy * nx + ix
+                if not bd[k]:
+                    rd[k] = cd[k]
+                    continue
+
+                qx[0], qy[0] = ix - .5, iy - .5
+                qx[1], qy[1] = ix + .5, iy - .5
+                qx[2], qy[2] = ix + .5, iy + .5
+                qx[3], qy[3] = ix - .5, iy + .5
+                v = region._cover(qx, qy)
+                if v < 0.:
+                    v = region._subsample(ix, iy, n)
+                rd[k] = v
+
+
+def _image_shape(img_or_shape):
+    # (ny, nx) of a 2-d image, or of its shape
+    if hasattr(img_or_shape, "shape"):
+        shape = img_or_shape.shape
+    elif c_python.PySequence_Check(img_or_shape):
+        shape = img_or_shape
+    else:
+        raise RegionFilterException("the inut needs to be a numpy 2-d array"
+                                    " or a tuple of two integers")
+
+    if c_python.PySequence_Length(shape) != 2:
+        raise RegionFilterException("shape of the input image must be 2d: "
+                                    "%s is given" % (str(shape)))
+
+    return shape[0], shape[1]
+
+
+def _window_indices(window, ny, nx):
+    # (y1, y2, x1, x2) of a pair of slices, clipped to the image
+    try:
+        sy, sx = window
+        y1, y2, ystep = sy.indices(ny)
+        x1, x2, xstep = sx.indices(nx)
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("window must be a pair of slices: "
+                         "%s is given" % (str(window)))
+    if (ystep != 1) or (xstep != 1):
+        raise ValueError("the slices of window must have a step of 1")
+    return y1, max(y1, y2), x1, max(x1, x2)
+
+
 cdef class RegionBase:
     cdef Metric m
     cdef RegionContext c
@@ -100,66 +935,519 @@ cdef class RegionBase:
     def __or__(self, RegionBase o):
         return RegionOr(self, o)
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         return (0)
 
-    def mask(self, img_or_shape):
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        # unbounded unless a subclass knows better
+        _bbox_set_unbounded(x1, y1, x2, y2)
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        t1[0] = -HUGE_VAL
+        t2[0] = HUGE_VAL
+        return 1
+
+    cdef _prepare(self, bint raster):
+        # Called before the filter is evaluated (with raster set when a
+        # mask is made), so that regions can build whatever speeds up
+        # the evaluation on first use. The evaluation itself runs
+        # without the GIL.
+        pass
+
+    cdef int _compile(self, _Program p) except -1:
+        # add the ops of the filter to p
+        return p.emit_region(self)
+
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        # The fraction of the pixel (see _PIXEL_RADIUS) inside the filter,
+        # or -1 if it is not known. Subclasses which know return it.
+        return -1.
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        # A filter containing the points within the distance h of the
+        # boundary of this one, in the window x1 <= x <= x2, y1 <= y <= y2
+        # at least, or None if there is none.
+        return None
+
+    cdef bint _is_convex(self) noexcept nogil:
+        # The pixels of a convex region form a single run on each row.
+        return 0
+
+    cdef bint _is_scanned(self) noexcept nogil:
+        # Whether _raster tests every pixel within the row spans. Such a
+        # region is better tested only at the pixels that matter.
+        return not self._is_convex()
+
+    cdef int _filter(self, _Runs *a, _Runs *r) except -1 nogil:
+        # Fill r with the pixels of the runs of a which are inside.
+        cdef npy_intp iy, ix, k, start
+
+        _runs_init(r, a.y1, a.y2)
+        for iy from a.y1 <= iy < a.y2:
+            for k from a.row[iy - a.y1] <= k < a.row[iy - a.y1 + 1]:
+                start = -1
+                for ix from a.x[2 * k] <= ix < a.x[2 * k + 1]:
+                    if self._inside(ix, iy):
+                        if start < 0:
+                            start = ix
+                    elif start >= 0:
+                        _runs_add(r, start, ix)
+                        start = -1
+                if start >= 0:
+                    _runs_add(r, start, a.x[2 * k + 1])
+            _runs_end_row(r)
+
+        return 0
+
+    cdef bint _clip_window(self, npy_intp *y1, npy_intp *y2,
+                           npy_intp *x1, npy_intp *x2) noexcept nogil:
+        # narrow the window [y1, y2) x [x1, x2) to the bounding box
+        cdef double bx1, by1, bx2, by2
+
+        self._bbox(&bx1, &by1, &bx2, &by2)
+        if not ((bx1 <= bx2) & (by1 <= by2)):
+            return 0
+
+        y1[0], y2[0] = (_clip_index(floor(_widen_lo(by1)), y1[0], y2[0]),
+                        _clip_index(ceil(_widen_hi(by2)) + 1, y1[0], y2[0]))
+        x1[0], x2[0] = (_clip_index(floor(_widen_lo(bx1)), x1[0], x2[0]),
+                        _clip_index(ceil(_widen_hi(bx2)) + 1, x1[0], x2[0]))
+
+        return (y1[0] < y2[0]) & (x1[0] < x2[0])
+
+    cdef int _raster(self, npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                     _Runs *r) except -1 nogil:
+        # Fill r with the runs of the rows y1 <= y < y2 within the columns
+        # x1 <= x < x2. By default, the pixels within the span of each row
+        # are tested one by one. For a convex region, only the pixels at
+        # both ends of the run need to be tested.
+        cdef npy_intp iy, ix, jx1, jx2, start
+        cdef double t1, t2
+        cdef bint convex
+
+        convex = self._is_convex()
+
+        _runs_init(r, y1, y2)
+
+        for iy from y1 <= iy < y2:
+            if (x1 < x2) and self._span(0., iy, 1., 0., &t1, &t2) and (t1 <= t2):
+                jx1 = _clip_index(floor(_widen_lo(t1)), x1, x2 - 1)
+                jx2 = _clip_index(ceil(_widen_hi(t2)), x1, x2 - 1)
+
+                if convex:
+                    while (jx1 <= jx2) and not self._inside(jx1, iy):
+                        jx1 += 1
+                    while (jx2 >= jx1) and not self._inside(jx2, iy):
+                        jx2 -= 1
+                    _runs_add(r, jx1, jx2 + 1)
+                else:
+                    start = -1
+                    for ix from jx1 <= ix <= jx2:
+                        if self._inside(ix, iy):
+                            if start < 0:
+                                start = ix
+                        elif start >= 0:
+                            _runs_add(r, start, ix)
+                            start = -1
+                    if start >= 0:
+                        _runs_add(r, start, jx2 + 1)
+
+            _runs_end_row(r)
+
+        return 0
+
+    def bbox(self):
+        """
+        bbox() : returns (x1, y1, x2, y2), a box which contains all
+        the points inside the filter. Unbounded sides are given as
+        infinity, and an empty filter has x1 > x2.
+        """
+        cdef double x1, y1, x2, y2
+
+        self._bbox(&x1, &y1, &x2, &y2)
+        return x1, y1, x2, y2
+
+    def span(self, double y):
+        """
+        span(float) : returns (x1, x2), a range which contains all the
+        points inside the filter along the row y, or None if the row
+        does not intersect the filter.
+        """
+        cdef double t1, t2
+
+        if not self._span(0., y, 1., 0., &t1, &t2):
+            return None
+        return t1, t2
+
+    def mask(self, img_or_shape, n_threads=None, mode="center", subsample=5):
         """
         Create a mask ( a 2-d image whose pixel value is 1 if the
         pixel is inside the filter, otherwise 0). It takes a single
         argument which is numpy 2d array (or any python object with
         *shape* attribute) or a tuple of two integer representing the
         image shape.
+
+        The mask is made without holding the GIL. If n_threads is
+        given, the rows are split between that many threads.
+
+        By default (mode="center"), a pixel is inside if its center
+        is. Otherwise, the mask is a float32 image of the fraction of
+        each pixel inside the filter: with mode="subsample", the
+        fraction of subsample x subsample points of the pixel, and with
+        mode="exact", the fraction of its area, computed exactly for
+        pixels crossed by a single boundary of circles, ellipses,
+        boxes, polygons or angle ranges, and by subsampling otherwise.
         """
 
-        cdef int l, nx, ny
+        cdef npy_intp nx, ny
+
+        ny, nx = _image_shape(img_or_shape)
+
+        if mode == "center":
+            return self._mask(nx, ny, n_threads)
 
-        if hasattr(img_or_shape, "shape"):
-            shape = img_or_shape.shape
-        elif c_python.PySequence_Check(img_or_shape):
-            shape = img_or_shape
+        if not (subsample >= 1):
+            raise ValueError("subsample must be a positive integer: "
+                             "%s is given" % (str(subsample)))
+        if mode == "subsample":
+            return self._mask_subsample(nx, ny, subsample, n_threads)
+        if mode == "exact":
+            return self._mask_exact(nx, ny, subsample, n_threads)
+
+        raise ValueError("mode must be one of 'center', 'subsample' or "
+                         "'exact': %s is given" % (str(mode)))
+
+    def mask_cutout(self, img_or_shape, window=None, out=None, n_threads=None):
+        """
+        Create the mask of a cutout of the image, without allocating a
+        mask of the whole image. Returns (slices, mask), where mask is
+        the part slices of the mask of the whole image (as made by the
+        mask method), which is 0 outside of it.
+
+        By default, the cutout is the smallest one which contains all
+        the pixels inside the filter. If window is given as a pair of
+        slices (of y and x), the cutout is the window clipped to the
+        image instead, and the mask may be written into out, a boolean
+        array of the shape of the cutout with contiguous rows.
+        """
+
+        cdef c_numpy.npy_intp ny_nx[2]
+        cdef c_numpy.ndarray ra
+        cdef npy_intp nx, ny, y1, y2, x1, x2
+
+        ny, nx = _image_shape(img_or_shape)
+
+        if window is None:
+            if out is not None:
+                raise ValueError("out is only supported with a window")
+            y1, y2, x1, x2 = 0, ny, 0, nx
+            if not self._clip_window(&y1, &y2, &x1, &x2):
+                y1, y2, x1, x2 = 0, 0, 0, 0
         else:
-            raise RegionFilterException("the inut needs to be a numpy 2-d array"
-                                        " or a tuple of two integers")
+            y1, y2, x1, x2 = _window_indices(window, ny, nx)
+
+        ny_nx[0] = y2 - y1
+        ny_nx[1] = x2 - x1
+        if out is None:
+            ra = c_numpy.PyArray_ZEROS(2, ny_nx, c_numpy.NPY_BOOL, 0)
+        else:
+            if not (c_numpy.PyArray_Check(out) and out.dtype == bool and
+                    out.shape == (ny_nx[0], ny_nx[1]) and
+                    (out.strides[1] == 1 or ny_nx[1] <= 1)):
+                raise ValueError("out must be a boolean array of shape %s "
+                                 "with contiguous rows"
+                                 % (str((ny_nx[0], ny_nx[1]))))
+            ra = out
+            ra[...] = False
+
+        self._fill_window(ra, y1, x1, y1, y2, x1, x2, n_threads)
+
+        if window is None:
+            # down to the rows and columns with pixels inside
+            rows = ra.any(axis=1).nonzero()[0]
+            if len(rows) == 0:
+                return (slice(0, 0), slice(0, 0)), ra[:0, :0]
+            cols = ra.any(axis=0).nonzero()[0]
+            ra = ra[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+            y1, y2 = y1 + rows[0], y1 + rows[-1] + 1
+            x1, x2 = x1 + cols[0], x1 + cols[-1] + 1
+
+        return (slice(y1, y2), slice(x1, x2)), ra
+
+    def mask_runs(self, img_or_shape, n_threads=None):
+        """
+        Create a run-length encoded mask, without allocating a mask of
+        the whole image. Returns (rows, starts, stops), arrays with an
+        element for each run of pixels inside the filter: the run k is
+        the pixels starts[k] <= x < stops[k] of the row rows[k]. The
+        runs are sorted by row and by x, and do not touch.
+
+        If n_threads is given, the rows are split between that many
+        threads.
+        """
+
+        cdef npy_intp nx, ny, y1, y2, x1, x2
+
+        ny, nx = _image_shape(img_or_shape)
 
-        if c_python.PySequence_Length(shape) != 2:
-            raise RegionFilterException("shape of the input image must be 2d: "
-                                        "%s is given" % (str(shape)))
+        self._prepare(1)
 
-        ny = c_python.PySequence_GetItem(shape, 0)
-        nx = c_python.PySequence_GetItem(shape, 1)
+        y1, y2, x1, x2 = 0, ny, 0, nx
+        if not self._clip_window(&y1, &y2, &x1, &x2):
+            y1, y2 = 0, 0
 
-        return self._mask(nx, ny)
+        chunks = _chunks(y1, y2, n_threads, _MIN_ROWS_PER_CHUNK)
+        if chunks is None:
+            return _runs_of_rows(self, y1, y2, x1, x2)
 
-    cdef c_numpy.ndarray _mask(self, c_numpy.npy_intp nx, c_numpy.npy_intp ny):
+        runs = _run_chunks(lambda cy1, cy2: _runs_of_rows(self, cy1, cy2,
+                                                          x1, x2),
+                           chunks, n_threads)
+        return tuple(np.concatenate(a) for a in zip(*runs))
+
+    def reduce(self, data, ops=("sum", "count", "mean", "min", "max"),
+               n_threads=None):
+        """
+        Statistics of the pixels of data inside the filter: a dict of
+        the values of ops, among "sum", "count", "mean", "min" and
+        "max". They are those of data[mask], read along the runs of
+        pixels without making a mask, so that data may be memory-mapped.
+        The sums are accumulated as float64, and NaN values propagate.
+        Without pixels, the count and sum are 0, and the others NaN.
+
+        If data has more than two axes, the statistics are computed for
+        each image along its last two axes (see
+        pyregion.sparse_mask.reduce_runs).
+
+        If n_threads is given, the rows are split between that many
+        threads.
+        """
+
+        from .sparse_mask import _check_ops, _statistics, reduce_runs
+
+        cdef npy_intp y1, y2, x1, x2
+
+        _check_ops(ops)
+
+        if not (c_numpy.PyArray_Check(data) and data.ndim == 2 and
+                data.dtype.kind == "f" and data.dtype.itemsize in (4, 8)):
+            return reduce_runs(data, self.mask_runs(data.shape[-2:],
+                                                    n_threads=n_threads),
+                               ops)
+
+        self._prepare(1)
+
+        y1, y2, x1, x2 = 0, data.shape[0], 0, data.shape[1]
+        if not self._clip_window(&y1, &y2, &x1, &x2):
+            return _statistics(ops, 0., 0, 0., 0.)
+
+        chunks = _chunks(y1, y2, n_threads, _MIN_ROWS_PER_CHUNK)
+        if chunks is None:
+            results = [_reduce_rows(self, data, y1, y2, x1, x2)]
+        else:
+            results = _run_chunks(lambda cy1, cy2: _reduce_rows(self, data,
+                                                                cy1, cy2,
+                                                                x1, x2),
+                                  chunks, n_threads)
+
+        total, count, low, high = zip(*results)
+        return _statistics(ops, sum(total), sum(count), np.min(low),
+                           np.max(high))
+
+    def mask_packed(self, img_or_shape, n_threads=None):
+        """
+        Create a bit-packed mask: a uint8 array of shape
+        (ny, (nx + 7) // 8), which is numpy.packbits(mask, axis=1) for
+        the mask given by the mask method, without making it. The bits
+        are set straight from the runs of pixels inside the filter.
+
+        If n_threads is given, the rows are split between that many
+        threads.
+        """
+
+        cdef c_numpy.npy_intp ny_nx[2]
+        cdef c_numpy.ndarray ra
+        cdef npy_intp nx, ny, y1, y2, x1, x2
+
+        ny, nx = _image_shape(img_or_shape)
+
+        ny_nx[0] = ny
+        ny_nx[1] = (nx + 7) // 8
+        ra = c_numpy.PyArray_ZEROS(2, ny_nx, c_numpy.NPY_UBYTE, 0)
+
+        self._prepare(1)
+
+        y1, y2, x1, x2 = 0, ny, 0, nx
+        if not self._clip_window(&y1, &y2, &x1, &x2):
+            return ra
+
+        # the chunks of rows write to different bytes
+        chunks = _chunks(y1, y2, n_threads, _MIN_ROWS_PER_CHUNK)
+        if chunks is None:
+            _pack_rows(self, ra, y1, y2, x1, x2)
+        else:
+            _run_chunks(lambda cy1, cy2: _pack_rows(self, ra, cy1, cy2, x1, x2),
+                        chunks, n_threads)
+
+        return ra
+
+    cdef c_numpy.ndarray _mask(self, c_numpy.npy_intp nx, c_numpy.npy_intp ny,
+                               n_threads=None):
 
         cdef c_numpy.npy_intp ny_nx[2]
         cdef c_numpy.ndarray ra
-        cdef npy_bool *rd
-        cdef int iy, ix
 
         ny_nx[0] = ny
         ny_nx[1] = nx
 
-        ra = c_numpy.PyArray_EMPTY(2, ny_nx,
+        ra = c_numpy.PyArray_ZEROS(2, ny_nx,
                                    c_numpy.NPY_BOOL, 0)
 
-        rd = <npy_bool *> c_numpy.PyArray_DATA(ra)
+        self._fill_window(ra, 0, 0, 0, ny, 0, nx, n_threads)
+
+        return ra
+
+    cdef _fill_window(self, c_numpy.ndarray ra, npy_intp y0, npy_intp x0,
+                      npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                      n_threads):
+        # Set the pixels of ra within [y1, y2) x [x1, x2) which are
+        # inside the filter, where ra starts at the pixel (y0, x0).
+        cdef npy_bool *rd = <npy_bool *> c_numpy.PyArray_DATA(ra)
+        cdef npy_intp stride = ra.strides[0]
+
+        self._prepare(1)
+
+        # Only the rows and columns within the bounding box are
+        # rasterized, and the resulting runs are filled in one go.
+        if not self._clip_window(&y1, &y2, &x1, &x2):
+            return
+
+        chunks = _chunks(y1, y2, n_threads, _MIN_ROWS_PER_CHUNK)
+        if chunks is None:
+            with nogil:
+                self._fill_rows(rd, stride, y0, x0, y1, y2, x1, x2)
+        else:
+            _run_chunks(lambda cy1, cy2: self._fill_rows_nogil(ra, y0, x0,
+                                                               cy1, cy2,
+                                                               x1, x2),
+                        chunks, n_threads)
+
+    cdef _fill_rows_nogil(self, c_numpy.ndarray ra, npy_intp y0, npy_intp x0,
+                          npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2):
+        cdef npy_bool *rd = <npy_bool *> c_numpy.PyArray_DATA(ra)
+        cdef npy_intp stride = ra.strides[0]
+
+        with nogil:
+            self._fill_rows(rd, stride, y0, x0, y1, y2, x1, x2)
+
+    cdef int _fill_rows(self, npy_bool *rd, npy_intp stride,
+                        npy_intp y0, npy_intp x0,
+                        npy_intp y1, npy_intp y2,
+                        npy_intp x1, npy_intp x2) except -1 nogil:
+        # set the pixels of the rows [y1, y2) which are inside the filter,
+        # the pixel (y0, x0) being at rd and the rows stride apart.
+        cdef npy_intp iy, k
+        cdef _Runs r
+
+        _runs_clear(&r)
+        try:
+            self._raster(y1, y2, x1, x2, &r)
+            for iy from y1 <= iy < y2:
+                for k from r.row[iy - y1] <= k < r.row[iy - y1 + 1]:
+                    memset(rd + (iy - y0) * stride + (r.x[2 * k] - x0), 1,
+                           (r.x[2 * k + 1] - r.x[2 * k]) * sizeof(npy_bool))
+        finally:
+            _runs_free(&r)
+
+        return 0
+
+    cdef c_numpy.ndarray _mask_subsample(self, npy_intp nx, npy_intp ny,
+                                         int n, n_threads):
+        cdef c_numpy.npy_intp ny_nx[2]
+        cdef c_numpy.ndarray ra
+        cdef npy_intp y1, y2, x1, x2
+        cdef _Scaled scaled
+
+        ny_nx[0] = ny
+        ny_nx[1] = nx
+        ra = c_numpy.PyArray_ZEROS(2, ny_nx, c_numpy.NPY_FLOAT, 0)
+
+        self._prepare(1)
+
+        y1, y2, x1, x2 = 0, ny, 0, nx
+        if not self._clip_window(&y1, &y2, &x1, &x2):
+            return ra
+
+        # the filter is rasterized on a grid n times finer, and the
+        # points of each pixel counted.
+        scaled = _Scaled(self, n)
+        scaled._prepare(1)
+
+        chunks = _chunks(y1, y2, n_threads, _MIN_ROWS_PER_CHUNK)
+        if chunks is None:
+            _count_rows(scaled, ra, y1, y2, x1, x2)
+        else:
+            _run_chunks(lambda cy1, cy2: _count_rows(scaled, ra, cy1, cy2,
+                                                     x1, x2),
+                        chunks, n_threads)
+
+        return ra
+
+    cdef c_numpy.ndarray _mask_exact(self, npy_intp nx, npy_intp ny,
+                                     int n, n_threads):
+        cdef c_numpy.npy_intp ny_nx[2]
+        cdef c_numpy.ndarray ra
+        cdef c_numpy.ndarray center
+        cdef c_numpy.ndarray band_mask
+        cdef npy_intp y1, y2, x1, x2
 
-        for iy from 0 <= iy < ny:
-            for ix from 0 <= ix < nx:
-                #rd[iy*nx + ix] = self._inside(i, j)
-                # altenatively more optimized
-                #rd[0] = self._inside(ix+1, iy+1) # +1 for (1,1) based..
-                rd[0] = self._inside(ix, iy)
-                rd = rd + 1
+        ny_nx[0] = ny
+        ny_nx[1] = nx
+        ra = c_numpy.PyArray_ZEROS(2, ny_nx, c_numpy.NPY_FLOAT, 0)
+
+        center = self._mask(nx, ny, n_threads)
+
+        y1, y2, x1, x2 = 0, ny, 0, nx
+        if not self._clip_window(&y1, &y2, &x1, &x2):
+            return ra
+
+        # Only the pixels near the boundary of a primitive can be partly
+        # inside. The others are inside or outside with their centers.
+        band = self._band(_PIXEL_RADIUS, x1 - .5, y1 - .5, x2 - .5, y2 - .5)
+        if band is None:
+            band_mask = c_numpy.PyArray_ZEROS(2, ny_nx, c_numpy.NPY_BOOL, 0)
+            band_mask[y1:y2, x1:x2] = True
+        else:
+            band_mask = (<RegionBase> band)._mask(nx, ny, n_threads)
+
+        chunks = _chunks(y1, y2, n_threads, _MIN_ROWS_PER_CHUNK)
+        if chunks is None:
+            _cover_rows(self, ra, center, band_mask, y1, y2, x1, x2, n)
+        else:
+            _run_chunks(lambda cy1, cy2: _cover_rows(self, ra, center,
+                                                     band_mask, cy1, cy2,
+                                                     x1, x2, n),
+                        chunks, n_threads)
 
         return ra
 
+    cdef double _subsample(self, double x, double y, int n) noexcept nogil:
+        # the fraction of the n x n points of the pixel (x, y) inside
+        cdef int i, j, k
+
+        k = 0
+        for i from 0 <= i < n:
+            for j from 0 <= j < n:
+                k += self._inside(x + (j + .5) / n - .5, y + (i + .5) / n - .5)
+        return k / (<double> n * n)
+
     def inside1(self, double x, double y):
         """
         inside1(float, float) : returns True if the point (x,y) is inside the filter.
         """
+        self._prepare(0)
         return self._inside(x, y)
 
     def inside(self, x, y=None):
@@ -171,17 +1459,19 @@ cdef class RegionBase:
         else:
             return self.inside_x_y(x, y)
 
-    def inside_xy(self, xy):
+    def inside_xy(self, xy, n_threads=None):
         """
         inside(x, y) : given the numpy array of x and y, returns an
         array b of same shape, where b[i] = inside1(x[i], y[i])
+
+        The points are tested without holding the GIL. If n_threads is
+        given, they are split between that many threads.
         """
         cdef c_numpy.ndarray xya
         cdef c_numpy.ndarray ra
         cdef double *xyd
         cdef npy_bool *rd
-        cdef int i
-        cdef int n
+        cdef npy_intp n
 
         xya = c_numpy.PyArray_ContiguousFromAny(xy, c_numpy.NPY_DOUBLE, 1, 0)
 
@@ -192,25 +1482,21 @@ cdef class RegionBase:
         rd = <npy_bool *> c_numpy.PyArray_DATA(ra)
 
         n = xya.dimensions[0]  # c_numpy.PyArray_SIZE(xya) / 2
-        #_inside_ptr = self._inside
-        for i from 0 <= i < n:
-            rd[i] = self._inside(xyd[2 * i], xyd[2 * i + 1])
+        self._inside_chunks(xya, xya, 2, 1, ra, n, n_threads)
         return ra
 
-    def inside_x_y(self, x, y):
+    def inside_x_y(self, x, y, n_threads=None):
         """
         inside(x, y) : given the numpy array of x and y, returns an
         array b of same shape, where b[i] = inside1(x[i], y[i])
+
+        The points are tested without holding the GIL. If n_threads is
+        given, they are split between that many threads.
         """
         cdef c_numpy.ndarray xa
         cdef c_numpy.ndarray ya
         cdef c_numpy.ndarray ra
-        cdef double *xd
-        cdef double *yd
-        cdef npy_bool *rd
-        cdef int i
-        cdef int n
-        #cdef c_numpy.npy_bool ((*_inside_ptr)(RegionBase, double ,double ))
+        cdef npy_intp n
 
         # FIX : check if two input has identical shape
 
@@ -220,20 +1506,28 @@ cdef class RegionBase:
         ra = c_numpy.PyArray_EMPTY(xa.nd, xa.dimensions,
                                    c_numpy.NPY_BOOL, 0)
 
-        xd = <double *> c_numpy.PyArray_DATA(xa)
-        yd = <double *> c_numpy.PyArray_DATA(ya)
-        rd = <npy_bool *> c_numpy.PyArray_DATA(ra)
-
         n = c_numpy.PyArray_SIZE(xa)
-        #_inside_ptr = self._inside
-        for i from 0 <= i < n:
-            #self._inside(xd[0], yd[0])
-            #rd[i] = _inside_ptr(self, xd[i], yd[i])
-            rd[i] = self._inside(xd[i], yd[i])
-            #rd[i] = _inside_ptr(self, xd[i], yd[i])
-            #print xd[i], yd[i], rd[i]
+        self._inside_chunks(xa, ya, 1, 0, ra, n, n_threads)
         return ra
 
+    cdef _inside_chunks(self, c_numpy.ndarray xa, c_numpy.ndarray ya,
+                        npy_intp stride, npy_intp offset,
+                        c_numpy.ndarray ra, npy_intp n, n_threads):
+        # test the points i of n, at x[stride * i] and y[stride * i + offset]
+        cdef _Program p
+
+        self._prepare(0)
+        p = _Program()
+        self._compile(p)
+
+        chunks = _chunks(0, n, n_threads, _MIN_POINTS_PER_CHUNK)
+        if chunks is None:
+            _inside_points(p, xa, ya, stride, offset, ra, 0, n)
+        else:
+            _run_chunks(lambda i1, i2: _inside_points(p, xa, ya, stride,
+                                                      offset, ra, i1, i2),
+                        chunks, n_threads)
+
 cdef class RegionNot(RegionBase):
     """
     >>> r = RegionNot(r2)
@@ -243,12 +1537,105 @@ cdef class RegionNot(RegionBase):
     def __init__(self, RegionBase child_region):
         self.child_region = child_region
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         return not (self.child_region._inside(x, y))
 
+    cdef _prepare(self, bint raster):
+        self.child_region._prepare(raster)
+
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        cdef double v
+
+        v = self.child_region._cover(qx, qy)
+        if v < 0.:
+            return v
+        return 1. - v
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        return self.child_region._band(h, x1, y1, x2, y2)
+
+    cdef int _compile(self, _Program p) except -1:
+        cdef int i
+
+        if isinstance(self.child_region, RegionNot):
+            return (<RegionNot> self.child_region).child_region._compile(p)
+
+        i = p.n
+        p.emit(_OP_NOT)
+        self.child_region._compile(p)
+        return p.close(i)
+
+    cdef bint _is_scanned(self) noexcept nogil:
+        return 0
+
+    cdef int _raster(self, npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                     _Runs *r) except -1 nogil:
+        cdef npy_intp cy1, cy2, cx1, cx2, iy, i
+        cdef _Runs c
+
+        cy1, cy2, cx1, cx2 = y1, y2, x1, x2
+        _runs_clear(&c)
+        try:
+            if self.child_region._clip_window(&cy1, &cy2, &cx1, &cx2):
+                self.child_region._raster(cy1, cy2, cx1, cx2, &c)
+            else:
+                cy1 = cy2 = y1
+
+            _runs_init(r, y1, y2)
+            for iy from y1 <= iy < y2:
+                if (cy1 <= iy) and (iy < cy2):
+                    i = iy - cy1
+                    _runs_not_row(r, c.x + 2 * c.row[i], c.row[i + 1] - c.row[i],
+                                  x1, x2)
+                else:
+                    _runs_not_row(r, NULL, 0, x1, x2)
+        finally:
+            _runs_free(&c)
+
+        return 0
+
 cdef class RegionList(RegionBase):
     cdef object child_regions
 
+    # The children as of the last change, for the evaluation without
+    # the GIL. The tuple keeps them alive. The snapshot is replaced as a
+    # whole when the list has changed (also through asList()), and is
+    # not modified after, so that it can be shared by the threads.
+    cdef tuple _children
+    cdef void **_child_ptrs
+    cdef int _n_children
+
+    def __dealloc__(self):
+        free(self._child_ptrs)
+
+    cdef bint _changed(self):
+        if len(self.child_regions) != self._n_children:
+            return 1
+        for k, s in zip(self.child_regions, self._children):
+            if k is not s:
+                return 1
+        return 0
+
+    cdef _snapshot(self):
+        cdef int i
+        cdef void **ptrs
+        cdef void **old
+
+        children = tuple(self.child_regions)
+        ptrs = <void **> malloc((len(children) + 1) * sizeof(void *))
+        if ptrs == NULL:
+            raise MemoryError()
+
+        for i from 0 <= i < len(children):
+            ptrs[i] = <void *> children[i]
+
+        old = self._child_ptrs
+        self._child_ptrs = ptrs
+        free(old)
+        self._children = children
+        self._n_children = len(children)
+
     def _check_type_of_list(self, kl):
         for k in kl:
             if not isinstance(k, RegionBase):
@@ -257,6 +1644,7 @@ cdef class RegionList(RegionBase):
     def __init__(self, *kl):
         self._check_type_of_list(kl)
         self.child_regions = list(kl)
+        self._snapshot()
 
     def __len__(self):
         return len(self.child_regions)
@@ -266,9 +1654,11 @@ cdef class RegionList(RegionBase):
 
     def __setitem__(self, Py_ssize_t x, RegionBase y):
         self.child_regions[x] = y
+        self._snapshot()
 
     def __delitem__(self, Py_ssize_t x):
         del self.child_regions[x]
+        self._snapshot()
 
     def __contains__(self, RegionBase x):
         return x in self.child_regions
@@ -279,21 +1669,186 @@ cdef class RegionList(RegionBase):
     def asList(self):
         return self.child_regions
 
+    cdef _prepare(self, bint raster):
+        if self._changed():
+            self._snapshot()
+        for k in self._children:
+            (<RegionBase> k)._prepare(raster)
+
+    cdef bint _is_scanned(self) noexcept nogil:
+        return 0
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        bands = [(<RegionBase> k)._band(h, x1, y1, x2, y2)
+                 for k in self._children]
+        if None in bands:
+            return None
+        return RegionOrList(*bands)
+
+    cdef int _compile_list(self, _Program p, int code) except -1:
+        cdef int i
+
+        if self._n_children == 1:
+            return (<RegionBase> self._child_ptrs[0])._compile(p)
+
+        i = p.n
+        p.emit(code)
+        self._compile_children(p)
+        return p.close(i)
+
+    cdef int _compile_children(self, _Program p) except -1:
+        # the children of a nested list of the same kind are merged,
+        # looking through lists of a single child.
+        for k in self._children:
+            while isinstance(k, RegionList) and (<RegionList> k)._n_children == 1:
+                k = (<RegionList> k)._children[0]
+            if type(k) is type(self):
+                (<RegionList> k)._compile_children(p)
+            else:
+                (<RegionBase> k)._compile(p)
+        return 0
+
 cdef class RegionOrList(RegionList):
     """
     >>> r = RegionOrList(r1, r2, r3, r4, ...)
     """
-    cdef npy_bool _inside(self, double x, double y):
-        cdef c_python.PyListObject *child_regions
+    cdef int _compile(self, _Program p) except -1:
+        return self._compile_list(p, _OP_OR)
+
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        # Exact if at most one child is partly inside, the others being
+        # all inside or all outside.
+        cdef int i
+        cdef double v, partial
+        cdef bint unknown
+
+        partial = 0.
+        unknown = 0
+        for i from 0 <= i < self._n_children:
+            v = (<RegionBase> self._child_ptrs[i])._cover(qx, qy)
+            if v >= 1.:
+                return 1.
+            if (v < 0.) or ((v > 0.) and (partial > 0.)):
+                unknown = 1
+            elif v > 0.:
+                partial = v
+        if unknown:
+            return -1.
+        return partial
+
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         cdef int i, n
 
-        child_regions = <c_python.PyListObject *> self.child_regions
-        n = c_python.PyList_GET_SIZE(child_regions)
+        n = self._n_children
         for i from 0 <= i < n:
-            if (<RegionBase> c_python.PyList_GET_ITEM(child_regions, i))._inside(x, y):
+            if (<RegionBase> self._child_ptrs[i])._inside(x, y):
                 return 1
         return 0
 
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        cdef int i, n
+        cdef double cx1, cy1, cx2, cy2
+
+        _bbox_set_empty(x1, y1, x2, y2)
+
+        n = self._n_children
+        for i from 0 <= i < n:
+            (<RegionBase> self._child_ptrs[i])._bbox(&cx1, &cy1, &cx2, &cy2)
+            if not ((cx1 <= cx2) & (cy1 <= cy2)):
+                continue
+            if cx1 < x1[0]:
+                x1[0] = cx1
+            if cy1 < y1[0]:
+                y1[0] = cy1
+            if cx2 > x2[0]:
+                x2[0] = cx2
+            if cy2 > y2[0]:
+                y2[0] = cy2
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        cdef int i, n
+        cdef double ct1, ct2
+        cdef int r
+
+        t1[0] = HUGE_VAL
+        t2[0] = -HUGE_VAL
+        r = 0
+
+        n = self._n_children
+        for i from 0 <= i < n:
+            if not (<RegionBase> self._child_ptrs[i])._span(px, py, dx, dy, &ct1, &ct2):
+                continue
+            r = 1
+            if ct1 < t1[0]:
+                t1[0] = ct1
+            if ct2 > t2[0]:
+                t2[0] = ct2
+
+        return r
+
+    cdef int _raster(self, npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                     _Runs *r) except -1 nogil:
+        cdef int i, n
+        cdef npy_intp *cy1
+        cdef npy_intp *cy2
+        cdef npy_intp cx1, cx2, iy, j, m, nmax
+        cdef npy_intp *buf
+        cdef _Runs *c
+
+        n = self._n_children
+
+        c = <_Runs *> malloc((n + 1) * sizeof(_Runs))
+        cy1 = <npy_intp *> malloc((n + 1) * sizeof(npy_intp))
+        cy2 = <npy_intp *> malloc((n + 1) * sizeof(npy_intp))
+        buf = NULL
+        if (c == NULL) or (cy1 == NULL) or (cy2 == NULL):
+            free(c)
+            free(cy1)
+            free(cy2)
+            with gil:
+                raise MemoryError()
+
+        for i from 0 <= i < n:
+            _runs_clear(&c[i])
+
+        try:
+            # rasterize each child within its own bounding box, then merge
+            # the runs of the children row by row.
+            nmax = 0
+            for i from 0 <= i < n:
+                cy1[i], cy2[i], cx1, cx2 = y1, y2, x1, x2
+                if (<RegionBase> self._child_ptrs[i])._clip_window(&cy1[i], &cy2[i], &cx1, &cx2):
+                    (<RegionBase> self._child_ptrs[i])._raster(cy1[i], cy2[i], cx1, cx2, &c[i])
+                    nmax += c[i].n
+                else:
+                    cy1[i] = cy2[i] = y1
+
+            buf = <npy_intp *> malloc((2 * nmax + 2) * sizeof(npy_intp))
+            if buf == NULL:
+                with gil:
+                    raise MemoryError()
+
+            _runs_init(r, y1, y2)
+            for iy from y1 <= iy < y2:
+                m = 0
+                for i from 0 <= i < n:
+                    if (cy1[i] <= iy) and (iy < cy2[i]):
+                        for j from 2 * c[i].row[iy - cy1[i]] <= j < 2 * c[i].row[iy - cy1[i] + 1]:
+                            buf[m] = c[i].x[j]
+                            m += 1
+                _runs_or_row(r, buf, m // 2)
+        finally:
+            for i from 0 <= i < n:
+                _runs_free(&c[i])
+            free(c)
+            free(cy1)
+            free(cy2)
+            free(buf)
+
+        return 0
+
     def __repr__(self):
         return "Or" + repr(self.child_regions)
 
@@ -302,17 +1857,161 @@ cdef class RegionAndList(RegionList):
     >>> r = RegionAndList(r1, r2, r3, r4, ...)
     """
 
-    cdef npy_bool _inside(self, double x, double y):
-        cdef c_python.PyListObject *child_regions
+    cdef int _compile(self, _Program p) except -1:
+        return self._compile_list(p, _OP_AND)
+
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        # as for RegionOrList
+        cdef int i
+        cdef double v, partial
+        cdef bint unknown
+
+        partial = 1.
+        unknown = 0
+        for i from 0 <= i < self._n_children:
+            v = (<RegionBase> self._child_ptrs[i])._cover(qx, qy)
+            if v == 0.:
+                return 0.
+            if (v < 0.) or ((v < 1.) and (partial < 1.)):
+                unknown = 1
+            elif v < 1.:
+                partial = v
+        if unknown:
+            return -1.
+        return partial
+
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         cdef int i, n
 
-        child_regions = <c_python.PyListObject *> self.child_regions
-        n = c_python.PyList_GET_SIZE(child_regions)
+        n = self._n_children
         for i from 0 <= i < n:
-            if not (<RegionBase> c_python.PyList_GET_ITEM(child_regions, i))._inside(x, y):
+            if not (<RegionBase> self._child_ptrs[i])._inside(x, y):
                 return 0
         return 1
 
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        cdef int i, n
+        cdef double cx1, cy1, cx2, cy2
+
+        _bbox_set_unbounded(x1, y1, x2, y2)
+
+        n = self._n_children
+        for i from 0 <= i < n:
+            (<RegionBase> self._child_ptrs[i])._bbox(&cx1, &cy1, &cx2, &cy2)
+            if cx1 > x1[0]:
+                x1[0] = cx1
+            if cy1 > y1[0]:
+                y1[0] = cy1
+            if cx2 < x2[0]:
+                x2[0] = cx2
+            if cy2 < y2[0]:
+                y2[0] = cy2
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        cdef int i, n
+        cdef double ct1, ct2
+
+        t1[0] = -HUGE_VAL
+        t2[0] = HUGE_VAL
+
+        n = self._n_children
+        for i from 0 <= i < n:
+            if not (<RegionBase> self._child_ptrs[i])._span(px, py, dx, dy, &ct1, &ct2):
+                return 0
+            if ct1 > t1[0]:
+                t1[0] = ct1
+            if ct2 < t2[0]:
+                t2[0] = ct2
+
+        return t1[0] <= t2[0]
+
+    cdef bint _is_convex(self) noexcept nogil:
+        cdef int i, n
+
+        n = self._n_children
+        for i from 0 <= i < n:
+            if not (<RegionBase> self._child_ptrs[i])._is_convex():
+                return 0
+        return n > 0
+
+    cdef int _raster(self, npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                     _Runs *r) except -1 nogil:
+        cdef int i, n
+        cdef npy_intp cy1, cy2, cx1, cx2, iy, j, m
+        cdef int k
+        cdef _Runs c, t
+
+        n = self._n_children
+
+        # start from the whole window and intersect with each child in
+        # turn, rasterizing the child only within what is left. Children
+        # which would test every pixel anyway are only tested at the
+        # pixels that are left.
+        _runs_init(r, y1, y2)
+        for iy from y1 <= iy < y2:
+            _runs_add(r, x1, x2)
+            _runs_end_row(r)
+
+        _runs_clear(&c)
+        _runs_clear(&t)
+        try:
+            for k from 0 <= k < 2 * n:
+                # the scanned children go last
+                i = k % n
+                if (<RegionBase> self._child_ptrs[i])._is_scanned() != (k >= n):
+                    continue
+
+                if k >= n:
+                    (<RegionBase> self._child_ptrs[i])._filter(r, &t)
+                    _runs_free(r)
+                    r[0] = t
+                    _runs_clear(&t)
+                    continue
+
+                cy1, cy2, cx1, cx2 = y2, y1, x2, x1
+                for iy from y1 <= iy < y2:
+                    j = r.row[iy - y1]
+                    m = r.row[iy - y1 + 1]
+                    if j < m:
+                        if iy < cy1:
+                            cy1 = iy
+                        cy2 = iy + 1
+                        if r.x[2 * j] < cx1:
+                            cx1 = r.x[2 * j]
+                        if r.x[2 * m - 1] > cx2:
+                            cx2 = r.x[2 * m - 1]
+
+                if (cy1 >= cy2) or \
+                   not (<RegionBase> self._child_ptrs[i])._clip_window(&cy1, &cy2, &cx1, &cx2):
+                    _runs_free(r)
+                    _runs_init(r, y1, y2)
+                    for iy from y1 <= iy < y2:
+                        _runs_end_row(r)
+                    break
+
+                (<RegionBase> self._child_ptrs[i])._raster(cy1, cy2, cx1, cx2, &c)
+
+                _runs_init(&t, y1, y2)
+                for iy from y1 <= iy < y2:
+                    if (cy1 <= iy) and (iy < cy2):
+                        j = iy - y1
+                        m = iy - cy1
+                        _runs_and_row(&t, r.x + 2 * r.row[j], r.row[j + 1] - r.row[j],
+                                      c.x + 2 * c.row[m], c.row[m + 1] - c.row[m])
+                    else:
+                        _runs_end_row(&t)
+
+                _runs_free(&c)
+                _runs_free(r)
+                r[0] = t
+                _runs_clear(&t)
+        finally:
+            _runs_free(&c)
+            _runs_free(&t)
+
+        return 0
+
     def __repr__(self):
         return "And" + repr(self.child_regions)
 
@@ -348,21 +2047,53 @@ def RegionOr(RegionBase region1, RegionBase region2):
 
     return RegionOrList(*(region1_list + region2_list))
 
+cdef object _tree(RegionBase region):
+    # The composite regions below a region and their children, which
+    # determine the tree a transform is pushed down to.
+    if isinstance(region, RegionNot):
+        return (region, _tree((<RegionNot> region).child_region))
+    elif isinstance(region, RegionList):
+        return (region,) + tuple([_tree(k) for k in
+                                  (<RegionList> region).child_regions])
+    elif isinstance(region, Transform):
+        return (region, _tree((<Transform> region).child_region))
+    else:
+        return region
+
+
 cdef class Transform(RegionBase):
     cdef RegionBase child_region
 
+    # For a composite child, the transform moved down to its primitives
+    # (see _push_down). It is rebuilt only when the composite regions
+    # below have changed since (see _tree), and is not modified after.
+    cdef bint composite
+    cdef RegionBase pushed
+    cdef object _pushed_tree
+
     def __init__(self, RegionBase child_region):
         self.child_region = child_region
+        self.composite = isinstance(child_region, (RegionNot, RegionList))
 
     property child:
         def __get__(self):
             return self.child_region
 
-    cdef int _transform(self, double x, double y, double *xp, double *yp):
+    cdef _prepare(self, bint raster):
+        self.child_region._prepare(raster)
+        if raster and self.composite:
+            tree = _tree(self.child_region)
+            if (self.pushed is None) or (tree != self._pushed_tree):
+                pushed = self._push_down(self.child_region)
+                pushed._prepare(raster)
+                self._pushed_tree = tree
+                self.pushed = pushed
+
+    cdef int _transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
         xp[0] = x
         yp[0] = y
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         cdef double xp, yp
         cdef npy_bool r
 
@@ -371,13 +2102,116 @@ cdef class Transform(RegionBase):
 
         return r
 
+    cdef int _inverse_transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
+        xp[0] = x
+        yp[0] = y
 
-cdef extern from "math.h":
-    double sin(double)
-    double cos(double)
-    double atan2(double, double)
-    double fmod(double, double)
-    double M_PI
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        cdef double cx[2]
+        cdef double cy[2]
+        cdef double xp, yp
+        cdef int i, j
+
+        self.child_region._bbox(&cx[0], &cy[0], &cx[1], &cy[1])
+        if not ((cx[0] <= cx[1]) & (cy[0] <= cy[1])):
+            _bbox_set_empty(x1, y1, x2, y2)
+            return
+        if (cx[0] == -HUGE_VAL) | (cy[0] == -HUGE_VAL) | \
+           (cx[1] == HUGE_VAL) | (cy[1] == HUGE_VAL):
+            _bbox_set_unbounded(x1, y1, x2, y2)
+            return
+
+        # the box around the four transformed corners
+        _bbox_set_empty(x1, y1, x2, y2)
+        for i from 0 <= i < 2:
+            for j from 0 <= j < 2:
+                self._inverse_transform(cx[i], cy[j], &xp, &yp)
+                if xp < x1[0]:
+                    x1[0] = xp
+                if yp < y1[0]:
+                    y1[0] = yp
+                if xp > x2[0]:
+                    x2[0] = xp
+                if yp > y2[0]:
+                    y2[0] = yp
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        cdef double qx, qy, rx, ry
+
+        # the transforms are affine, so a line maps to a line with the
+        # same parametrization.
+        self._transform(px, py, &qx, &qy)
+        self._transform(px + dx, py + dy, &rx, &ry)
+
+        return self.child_region._span(qx, qy, rx - qx, ry - qy, t1, t2)
+
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        # The transforms are affine (and keep the orientation), so the
+        # pixel maps to a quad with the same fraction inside.
+        cdef double tx[4]
+        cdef double ty[4]
+        cdef int i
+
+        for i from 0 <= i < 4:
+            self._transform(qx[i], qy[i], &tx[i], &ty[i])
+        return self.child_region._cover(tx, ty)
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        # for the transforms which keep the distances
+        cdef double cx[2]
+        cdef double cy[2]
+        cdef double xp, yp, wx1, wy1, wx2, wy2
+        cdef int i, j
+
+        # the box around the window as seen by the child
+        cx[0], cy[0], cx[1], cy[1] = x1, y1, x2, y2
+        _bbox_set_empty(&wx1, &wy1, &wx2, &wy2)
+        for i from 0 <= i < 2:
+            for j from 0 <= j < 2:
+                self._transform(cx[i], cy[j], &xp, &yp)
+                wx1, wy1 = min(wx1, xp), min(wy1, yp)
+                wx2, wy2 = max(wx2, xp), max(wy2, yp)
+
+        band = self.child_region._band(h, wx1, wy1, wx2, wy2)
+        if band is None:
+            return None
+        try:
+            return self._with_child(band)
+        except NotYetImplemented:
+            return None
+
+    cdef bint _is_convex(self) noexcept nogil:
+        return self.child_region._is_convex()
+
+    cdef bint _is_scanned(self) noexcept nogil:
+        if self.composite:
+            return 0
+        return not self._is_convex()
+
+    cdef Transform _with_child(self, RegionBase child):
+        # a copy of this transform applied to another region
+        raise NotYetImplemented()
+
+    cdef RegionBase _push_down(self, RegionBase child):
+        # The transforms commute with the set operations, so a transform
+        # of a composite region can be moved down to its primitives.
+        if isinstance(child, RegionNot):
+            return RegionNot(self._push_down((<RegionNot> child).child_region))
+        elif isinstance(child, RegionOrList):
+            return RegionOrList(*[self._push_down(k) for k in child.asList()])
+        elif isinstance(child, RegionAndList):
+            return RegionAndList(*[self._push_down(k) for k in child.asList()])
+        else:
+            return self._with_child(child)
+
+    cdef int _raster(self, npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                     _Runs *r) except -1 nogil:
+        if self.composite:
+            return self.pushed._raster(y1, y2, x1, x2, r)
+
+        return RegionBase._raster(self, y1, y2, x1, x2, r)
 
 
 cdef class Rotated(Transform):
@@ -405,7 +2239,7 @@ cdef class Rotated(Transform):
         self.origin_x = origin_x
         self.origin_y = origin_y
 
-    cdef int _transform(self, double x, double y, double *xp, double *yp):
+    cdef int _transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
         cdef double x1, x2, y1, y2
         cdef double st, ct, ox, oy
 
@@ -423,6 +2257,49 @@ cdef class Rotated(Transform):
         xp[0] = x2 + ox
         yp[0] = y2 + oy
 
+    cdef int _inverse_transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
+        cdef double x1, x2, y1, y2
+        cdef double st, ct, ox, oy
+
+        st = self.sin_theta
+        ct = self.cos_theta
+        ox = self.origin_x
+        oy = self.origin_y
+
+        x1 = x - ox
+        y1 = y - oy
+
+        x2 = ct * x1 - st * y1
+        y2 = st * x1 + ct * y1
+
+        xp[0] = x2 + ox
+        yp[0] = y2 + oy
+
+    cdef int _compile(self, _Program p) except -1:
+        cdef int i
+        cdef _Op *op
+
+        i = p.n
+        op = p.emit(_OP_ROTATE)
+        op.p[0] = self.sin_theta
+        op.p[1] = self.cos_theta
+        op.p[2] = self.origin_x
+        op.p[3] = self.origin_y
+        self.child_region._compile(p)
+        return p.close(i)
+
+    cdef Transform _with_child(self, RegionBase child):
+        cdef Rotated r
+
+        r = Rotated.__new__(Rotated)
+        r.child_region = child
+        r.composite = isinstance(child, (RegionNot, RegionList))
+        r.sin_theta = self.sin_theta
+        r.cos_theta = self.cos_theta
+        r.origin_x = self.origin_x
+        r.origin_y = self.origin_y
+        return r
+
 cdef class Translated(Transform):
     """
     Translated region.
@@ -440,10 +2317,28 @@ cdef class Translated(Transform):
         self.dx = dx
         self.dy = dy
 
-    cdef int _transform(self, double x, double y, double *xp, double *yp):
+    cdef int _transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
         xp[0] = x - self.dx
         yp[0] = y - self.dy
 
+    cdef int _inverse_transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
+        xp[0] = x + self.dx
+        yp[0] = y + self.dy
+
+    cdef int _compile(self, _Program p) except -1:
+        cdef int i
+        cdef _Op *op
+
+        i = p.n
+        op = p.emit(_OP_TRANSLATE)
+        op.p[0] = self.dx
+        op.p[1] = self.dy
+        self.child_region._compile(p)
+        return p.close(i)
+
+    cdef Transform _with_child(self, RegionBase child):
+        return Translated(child, self.dx, self.dy)
+
 # Basic Shapes
 
 cdef class Circle(RegionBase):
@@ -472,12 +2367,81 @@ cdef class Circle(RegionBase):
         self.metric_set_origin(xc, yc, c)
         self._set_v(xc, yc, radius)
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         cdef double dist2
 
         dist2 = ((x - self.xc) * self.m.g_x) ** 2 + ((y - self.yc) * self.m.g_y) ** 2
         return (dist2 <= self.radius2)
 
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        cdef double ux[4]
+        cdef double uy[4]
+        cdef double r
+        cdef int i
+
+        r = fabs(self.radius)
+        if r == 0.:
+            return 0.
+        if (self.m.g_x <= 0.) | (self.m.g_y <= 0.):
+            return -1.
+
+        # scaled to the unit disk
+        for i from 0 <= i < 4:
+            ux[i] = (qx[i] - self.xc) * self.m.g_x / r
+            uy[i] = (qy[i] - self.yc) * self.m.g_y / r
+        return _disk_quad(ux, uy)
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        cdef double r
+
+        if (self.m.g_x != 1.) | (self.m.g_y != 1.):
+            return None
+
+        r = fabs(self.radius)
+        band = Circle(self.xc, self.yc, r + h)
+        if r > h:
+            band = band & ~Circle(self.xc, self.yc, r - h)
+        return band
+
+    cdef int _compile(self, _Program p) except -1:
+        cdef _Op *op
+
+        op = p.emit(_OP_CIRCLE)
+        op.p[0] = self.xc
+        op.p[1] = self.yc
+        op.p[2] = self.m.g_x
+        op.p[3] = self.m.g_y
+        op.p[4] = self.radius2
+        return 0
+
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        if (self.m.g_x <= 0.) | (self.m.g_y <= 0.):
+            _bbox_set_unbounded(x1, y1, x2, y2)
+            return
+
+        x1[0] = self.xc - fabs(self.radius) / self.m.g_x
+        x2[0] = self.xc + fabs(self.radius) / self.m.g_x
+        y1[0] = self.yc - fabs(self.radius) / self.m.g_y
+        y2[0] = self.yc + fabs(self.radius) / self.m.g_y
+
+    cdef bint _is_convex(self) noexcept nogil:
+        return 1
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        cdef double ux, uy, wx, wy
+
+        ux = dx * self.m.g_x
+        uy = dy * self.m.g_y
+        wx = (px - self.xc) * self.m.g_x
+        wy = (py - self.yc) * self.m.g_y
+
+        return _span_quadratic(ux * ux + uy * uy,
+                               2. * (ux * wx + uy * wy),
+                               wx * wx + wy * wy - self.radius2,
+                               t1, t2)
+
     def __repr__(self):
         return "Circle(%f, %f, %f)" % (self.xc, self.yc, self.radius)
 
@@ -513,12 +2477,86 @@ cdef class Ellipse(RegionBase):
 
         self.metric_set_origin(xc, yc, c)
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         cdef double dist2
 
         dist2 = self.radius_minor_2 * (x - self.xc) ** 2 + self.radius_major_2 * (y - self.yc) ** 2
         return (dist2 <= self.radius_major_2_radius_minor_2)
 
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        cdef double ux[4]
+        cdef double uy[4]
+        cdef double a, b
+        cdef int i
+
+        a = fabs(self.radius_major)
+        b = fabs(self.radius_minor)
+        if (a == 0.) | (b == 0.):
+            return 0.
+
+        # scaled to the unit disk
+        for i from 0 <= i < 4:
+            ux[i] = (qx[i] - self.xc) / a
+            uy[i] = (qy[i] - self.yc) / b
+        return _disk_quad(ux, uy)
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        # An ellipse grown (shrunk) by the distance h is contained in
+        # (contains) the ellipse scaled by 1 + h/b (1 - h/b), where b is
+        # its smallest radius.
+        cdef double a, b, s
+
+        a = fabs(self.radius_major)
+        b = fabs(self.radius_minor)
+        if min(a, b) == 0.:
+            return Box(self.xc, self.yc, 2. * (a + h), 2. * (b + h))
+
+        s = h / min(a, b)
+        band = Ellipse(self.xc, self.yc, a * (1. + s), b * (1. + s))
+        if s < 1.:
+            band = band & ~Ellipse(self.xc, self.yc, a * (1. - s), b * (1. - s))
+        return band
+
+    cdef int _compile(self, _Program p) except -1:
+        cdef _Op *op
+
+        op = p.emit(_OP_ELLIPSE)
+        op.p[0] = self.xc
+        op.p[1] = self.yc
+        op.p[2] = self.radius_minor_2
+        op.p[3] = self.radius_major_2
+        op.p[4] = self.radius_major_2_radius_minor_2
+        return 0
+
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        x1[0] = self.xc - fabs(self.radius_major)
+        x2[0] = self.xc + fabs(self.radius_major)
+        y1[0] = self.yc - fabs(self.radius_minor)
+        y2[0] = self.yc + fabs(self.radius_minor)
+
+        # with a zero radius, _inside does not bound the other axis
+        if self.radius_minor == 0.:
+            x1[0], x2[0] = -HUGE_VAL, HUGE_VAL
+        if self.radius_major == 0.:
+            y1[0], y2[0] = -HUGE_VAL, HUGE_VAL
+
+    cdef bint _is_convex(self) noexcept nogil:
+        return 1
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        cdef double wx, wy
+
+        wx = px - self.xc
+        wy = py - self.yc
+
+        return _span_quadratic(self.radius_minor_2 * dx * dx + self.radius_major_2 * dy * dy,
+                               2. * (self.radius_minor_2 * dx * wx + self.radius_major_2 * dy * wy),
+                               self.radius_minor_2 * wx * wx + self.radius_major_2 * wy * wy
+                               - self.radius_major_2_radius_minor_2,
+                               t1, t2)
+
     def __repr__(self):
         return "Ellipse(%f, %f, %f, %f)" % (self.xc, self.yc, self.radius_major, self.radius_minor)
 
@@ -549,9 +2587,128 @@ cdef class Box(RegionBase):
 
         self.metric_set_origin(xc, yc, c)
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         return (self.x1 <= x) & (x <= self.x2) & (self.y1 <= y) & (y <= self.y2)
 
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        cdef _Clip c
+        cdef int i, k
+
+        if (self.x1 > self.x2) | (self.y1 > self.y2):
+            return 0.
+
+        k = 0
+        for i from 0 <= i < 4:
+            k += self._inside(qx[i], qy[i])
+        if k == 4:
+            return 1.
+
+        _clip_init(&c, qx[0], qy[0])
+        _clip_add_line(&c, self.x1, self.y1, 1., 0.)
+        _clip_add_line(&c, self.x2, self.y1, 0., 1.)
+        _clip_add_line(&c, self.x2, self.y2, -1., 0.)
+        _clip_add_line(&c, self.x1, self.y2, 0., -1.)
+        return _fraction(_clip_quad(qx, qy, &c))
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        cdef double xc, yc, w, hh
+
+        if (self.x1 > self.x2) | (self.y1 > self.y2):
+            return RegionOrList()
+
+        xc, yc = .5 * (self.x1 + self.x2), .5 * (self.y1 + self.y2)
+        w, hh = self.x2 - self.x1, self.y2 - self.y1
+        band = Box(xc, yc, w + 2. * h, hh + 2. * h)
+        if (w > 2. * h) and (hh > 2. * h):
+            band = band & ~Box(xc, yc, w - 2. * h, hh - 2. * h)
+        return band
+
+    cdef int _compile(self, _Program p) except -1:
+        cdef _Op *op
+
+        op = p.emit(_OP_BOX)
+        op.p[0] = self.x1
+        op.p[1] = self.x2
+        op.p[2] = self.y1
+        op.p[3] = self.y2
+        return 0
+
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        x1[0] = self.x1
+        x2[0] = self.x2
+        y1[0] = self.y1
+        y2[0] = self.y2
+
+    cdef bint _is_convex(self) noexcept nogil:
+        return 1
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        t1[0] = -HUGE_VAL
+        t2[0] = HUGE_VAL
+
+        return _span_slab(px, dx, self.x1, self.x2, t1, t2) & \
+               _span_slab(py, dy, self.y1, self.y2, t1, t2)
+
+# The edge table of a polygon. Each edge joins the vertex i and the
+# previous vertex j, in the same order as in Polygon._inside so that the
+# crossings with a row are computed identically.
+
+cdef struct _Edge:
+    double xi
+    double yi
+    double xj
+    double yj
+    double ymin
+    double ymax
+
+cdef int _cmp_edge(const void *a, const void *b) noexcept nogil:
+    cdef double ya = (<_Edge *> a).ymin
+    cdef double yb = (<_Edge *> b).ymin
+    return (ya > yb) - (ya < yb)
+
+cdef int _cmp_double(const void *a, const void *b) noexcept nogil:
+    cdef double va = (<double *> a)[0]
+    cdef double vb = (<double *> b)[0]
+    return (va > vb) - (va < vb)
+
+
+cdef double _orient(double ax, double ay, double bx, double by,
+                    double cx, double cy) noexcept nogil:
+    # > 0 if a, b, c turn anticlockwise, < 0 if clockwise, 0 if aligned
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+cdef bint _on_segment(double ax, double ay, double bx, double by,
+                      double cx, double cy) noexcept nogil:
+    # whether c, aligned with a and b, is between them
+    return ((fmin(ax, bx) <= cx) & (cx <= fmax(ax, bx)) &
+            (fmin(ay, by) <= cy) & (cy <= fmax(ay, by)))
+
+cdef bint _segments_meet(double ax, double ay, double bx, double by,
+                         double cx, double cy, double dx, double dy) noexcept nogil:
+    cdef double o1, o2, o3, o4
+
+    o1 = _orient(ax, ay, bx, by, cx, cy)
+    o2 = _orient(ax, ay, bx, by, dx, dy)
+    o3 = _orient(cx, cy, dx, dy, ax, ay)
+    o4 = _orient(cx, cy, dx, dy, bx, by)
+
+    if (((o1 > 0.) & (o2 < 0.)) | ((o1 < 0.) & (o2 > 0.))) & \
+       (((o3 > 0.) & (o4 < 0.)) | ((o3 < 0.) & (o4 > 0.))):
+        return 1
+
+    return (((o1 == 0.) & _on_segment(ax, ay, bx, by, cx, cy)) |
+            ((o2 == 0.) & _on_segment(ax, ay, bx, by, dx, dy)) |
+            ((o3 == 0.) & _on_segment(cx, cy, dx, dy, ax, ay)) |
+            ((o4 == 0.) & _on_segment(cx, cy, dx, dy, bx, by)))
+
+
+# Polygons with at least this many vertices index their edges by y for
+# point queries.
+cdef int _POLYGON_INDEX_MIN_VERTICES = 16
+
+
 cdef class Polygon(RegionBase):
     """
     Polygon.
@@ -567,9 +2724,30 @@ cdef class Polygon(RegionBase):
     cdef double *x
     cdef double *y
     cdef int n
+    cdef double xmin, ymin, xmax, ymax
+
+    # edges sorted by ymin, and horizontal edges sorted by y
+    cdef _Edge *edges
+    cdef int n_edges
+    cdef _Edge *hedges
+    cdef int n_hedges
+
+    # For point queries, the edges (by the index of their vertex i) are
+    # bucketed into n_bands bands of height band_height. The edges
+    # crossing the band k are band_edges[band_start[k]:band_start[k+1]].
+    cdef int n_bands
+    cdef double band_height
+    cdef int *band_start
+    cdef int *band_edges
+
+    # whether no two edges meet but adjacent ones at their common vertex
+    # (-1 until checked), for the pixel coverage.
+    cdef int simple
 
     def __init__(self, x, y,
                  RegionContext c=None):
+        cdef int i
+
         self.xa = c_numpy.PyArray_CopyFromObject(x, c_numpy.NPY_DOUBLE, 1, 1)
         self.ya = c_numpy.PyArray_CopyFromObject(y, c_numpy.NPY_DOUBLE, 1, 1)
 
@@ -580,8 +2758,336 @@ cdef class Polygon(RegionBase):
 
         self.metric_set_origin(self.x[0], self.y[0], c)
 
-    cdef npy_bool _inside(self, double x, double y):
+        _bbox_set_empty(&self.xmin, &self.ymin, &self.xmax, &self.ymax)
+        for i from 0 <= i < self.n:
+            if self.x[i] < self.xmin:
+                self.xmin = self.x[i]
+            if self.y[i] < self.ymin:
+                self.ymin = self.y[i]
+            if self.x[i] > self.xmax:
+                self.xmax = self.x[i]
+            if self.y[i] > self.ymax:
+                self.ymax = self.y[i]
+
+        self._build_edge_table()
+        self.simple = -1
+
+    def __dealloc__(self):
+        free(self.edges)
+        free(self.hedges)
+        free(self.band_start)
+        free(self.band_edges)
+
+    cdef int _band_of(self, double y) noexcept nogil:
+        cdef double k
+
+        k = floor((y - self.ymin) / self.band_height)
+        if k < 0:
+            return 0
+        if k >= self.n_bands:
+            return self.n_bands - 1
+        return <int> k
+
+    cdef _prepare(self, bint raster):
+        if (self.band_start == NULL) and (self.n >= _POLYGON_INDEX_MIN_VERTICES):
+            self._build_band_index()
+
+    cdef _build_band_index(self):
+        cdef int i, j, k, k1, k2, total, n_bands
+        cdef int *count
+
+        # aim at a few edges per band, with the total size of the index
+        # bounded for polygons with many tall edges.
+        n_bands = self.n
+        while True:
+            self.n_bands = n_bands
+            self.band_height = (self.ymax - self.ymin) / n_bands
+            if not (self.band_height > 0.):
+                self.n_bands = n_bands = 1
+                self.band_height = 1.
+
+            total = 0
+            j = self.n - 1
+            for i from 0 <= i < self.n:
+                total += (self._band_of(max(self.y[i], self.y[j])) -
+                          self._band_of(min(self.y[i], self.y[j])) + 1)
+                j = i
+
+            if (total <= 16 * self.n) or (n_bands == 1):
+                break
+            n_bands = n_bands // 2
+
+        self.band_start = <int *> malloc((n_bands + 1) * sizeof(int))
+        self.band_edges = <int *> malloc(total * sizeof(int))
+        if (self.band_start == NULL) or (self.band_edges == NULL):
+            free(self.band_start)
+            free(self.band_edges)
+            self.band_start = NULL
+            self.band_edges = NULL
+            raise MemoryError()
+
+        count = self.band_start
+        for k from 0 <= k <= n_bands:
+            count[k] = 0
+
+        j = self.n - 1
+        for i from 0 <= i < self.n:
+            k1 = self._band_of(min(self.y[i], self.y[j]))
+            k2 = self._band_of(max(self.y[i], self.y[j]))
+            for k from k1 <= k <= k2:
+                count[k + 1] += 1
+            j = i
+
+        for k from 0 <= k < n_bands:
+            count[k + 1] += count[k]
+
+        # fill the bands, using band_start[k] as the fill position of
+        # the band k, then shift it back.
+        j = self.n - 1
+        for i from 0 <= i < self.n:
+            k1 = self._band_of(min(self.y[i], self.y[j]))
+            k2 = self._band_of(max(self.y[i], self.y[j]))
+            for k from k1 <= k <= k2:
+                self.band_edges[count[k]] = i
+                count[k] += 1
+            j = i
+
+        for k from n_bands > k >= 1:
+            count[k] = count[k - 1]
+        count[0] = 0
+
+    cdef _build_edge_table(self):
+        cdef int i, j
+        cdef _Edge e
+
+        free(self.edges)
+        free(self.hedges)
+        self.n_edges = 0
+        self.n_hedges = 0
+
+        self.edges = <_Edge *> malloc((self.n + 1) * sizeof(_Edge))
+        self.hedges = <_Edge *> malloc((self.n + 1) * sizeof(_Edge))
+        if (self.edges == NULL) or (self.hedges == NULL):
+            raise MemoryError()
+
+        j = self.n - 1
+        for i from 0 <= i < self.n:
+            e.xi = self.x[i]
+            e.yi = self.y[i]
+            e.xj = self.x[j]
+            e.yj = self.y[j]
+            if e.yi < e.yj:
+                e.ymin, e.ymax = e.yi, e.yj
+            else:
+                e.ymin, e.ymax = e.yj, e.yi
+
+            if e.yi == e.yj:
+                self.hedges[self.n_hedges] = e
+                self.n_hedges += 1
+            else:
+                self.edges[self.n_edges] = e
+                self.n_edges += 1
+            j = i
+
+        qsort(self.edges, self.n_edges, sizeof(_Edge), _cmp_edge)
+        qsort(self.hedges, self.n_hedges, sizeof(_Edge), _cmp_edge)
+
+    cdef bint _is_scanned(self) noexcept nogil:
+        return 0
+
+    cdef int _raster(self, npy_intp y1, npy_intp y2, npy_intp x1, npy_intp x2,
+                     _Runs *r) except -1 nogil:
+        # Scanline fill with an active edge list. An edge is active on
+        # the rows ymin <= y < ymax. The pixels inside are those between
+        # the crossings 2k and 2k + 1 (both included), and those on a
+        # horizontal edge.
+        cdef int *aet
+        cdef double *t
+        cdef npy_intp *buf
+        cdef int na, p, ph, k, m
+        cdef npy_intp iy, a, b
+        cdef double y
+        cdef _Edge *e
+
+        aet = <int *> malloc((self.n_edges + 1) * sizeof(int))
+        t = <double *> malloc((self.n_edges + 1) * sizeof(double))
+        buf = <npy_intp *> malloc((self.n + 1) * 2 * sizeof(npy_intp))
+
+        try:
+            if (aet == NULL) or (t == NULL) or (buf == NULL):
+                with gil:
+                    raise MemoryError()
+
+            _runs_init(r, y1, y2)
+
+            na = 0
+            p = 0
+            ph = 0
+            for iy from y1 <= iy < y2:
+                y = iy
+
+                # update the active edge list
+                m = 0
+                for k from 0 <= k < na:
+                    if self.edges[aet[k]].ymax > y:
+                        aet[m] = aet[k]
+                        m += 1
+                na = m
+                while (p < self.n_edges) and (self.edges[p].ymin <= y):
+                    if self.edges[p].ymax > y:
+                        aet[na] = p
+                        na += 1
+                    p += 1
+
+                for k from 0 <= k < na:
+                    e = &self.edges[aet[k]]
+                    t[k] = e.xi + (y - e.yi) / (e.yj - e.yi) * (e.xj - e.xi)
+                qsort(t, na, sizeof(double), _cmp_double)
+
+                m = 0
+                for k from 0 <= k < na // 2:
+                    a = _clip_index(ceil(t[2 * k]), x1, x2)
+                    b = _clip_index(floor(t[2 * k + 1]) + 1, x1, x2)
+                    if a < b:
+                        buf[2 * m] = a
+                        buf[2 * m + 1] = b
+                        m += 1
+
+                while (ph < self.n_hedges) and (self.hedges[ph].yi < y):
+                    ph += 1
+                k = ph
+                while (k < self.n_hedges) and (self.hedges[k].yi == y):
+                    e = &self.hedges[k]
+                    if e.xi < e.xj:
+                        a = _clip_index(ceil(e.xi), x1, x2)
+                        b = _clip_index(floor(e.xj) + 1, x1, x2)
+                    else:
+                        a = _clip_index(ceil(e.xj), x1, x2)
+                        b = _clip_index(floor(e.xi) + 1, x1, x2)
+                    if a < b:
+                        buf[2 * m] = a
+                        buf[2 * m + 1] = b
+                        m += 1
+                    k += 1
+
+                _runs_or_row(r, buf, m)
+        finally:
+            free(aet)
+            free(t)
+            free(buf)
+
+        return 0
+
+    cdef bint _check_simple(self):
+        # Only the edges in a same band can meet.
+        cdef int i, k, kk, k1, k2
+
+        self._prepare(0)
+        if self.band_start == NULL:
+            for i from 0 <= i < self.n:
+                for k from i < k < self.n:
+                    if self._edges_meet(i, k):
+                        return 0
+            return 1
+
+        for kk from 0 <= kk < self.n_bands:
+            k1 = self.band_start[kk]
+            k2 = self.band_start[kk + 1]
+            for i from k1 <= i < k2:
+                for k from i < k < k2:
+                    if self._edges_meet(self.band_edges[i], self.band_edges[k]):
+                        return 0
+        return 1
+
+    cdef bint _edges_meet(self, int i, int k):
+        # whether the edges i and k (joining the vertices i - 1 and i)
+        # meet, other than at a common vertex
+        cdef int i0, k0, s, a, b
+        cdef double *x = self.x
+        cdef double *y = self.y
+
+        i0 = i - 1 if i > 0 else self.n - 1
+        k0 = k - 1 if k > 0 else self.n - 1
+
+        if ((x[i] == x[i0]) & (y[i] == y[i0])) | ((x[k] == x[k0]) & (y[k] == y[k0])):
+            return 1
+
+        if (k0 == i) | (i0 == k):
+            # adjacent, they only overlap if they fold back on each other
+            if k0 == i:
+                s, a, b = i, i0, k
+            else:
+                s, a, b = k, i, k0
+            return ((_orient(x[s], y[s], x[a], y[a], x[b], y[b]) == 0.) &
+                    ((x[a] - x[s]) * (x[b] - x[s]) +
+                     (y[a] - y[s]) * (y[b] - y[s]) > 0.))
+
+        return _segments_meet(x[i0], y[i0], x[i], y[i], x[k0], y[k0], x[k], y[k])
+
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        cdef _Clip c
+        cdef double a
+        cdef int i
+
+        if self.simple != 1:
+            return -1.
+
+        if ((fmin(fmin(qx[0], qx[1]), fmin(qx[2], qx[3])) >= self.xmax) or
+            (fmax(fmax(qx[0], qx[1]), fmax(qx[2], qx[3])) <= self.xmin) or
+            (fmin(fmin(qy[0], qy[1]), fmin(qy[2], qy[3])) >= self.ymax) or
+            (fmax(fmax(qy[0], qy[1]), fmax(qy[2], qy[3])) <= self.ymin)):
+            return 0.
+
+        a = _quad_area(qx, qy)
+        if not (a > 0.):
+            return 0.
+
+        # the polygon clipped by the pixel
+        _clip_init(&c, qx[0], qy[0])
+        for i from 0 <= i < 4:
+            _clip_add_line(&c, qx[i], qy[i], qx[(i + 1) % 4] - qx[i],
+                           qy[(i + 1) % 4] - qy[i])
+        for i from 0 <= i < self.n:
+            _clip_push(&c, 0, self.x[i], self.y[i])
+        return _fraction(fabs(_clip_close(&c)) / a)
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        # a box around each edge
         cdef int i, j
+        cdef double length
+
+        if self.simple == -1:
+            self.simple = self._check_simple()
+
+        bands = []
+        j = self.n - 1
+        for i from 0 <= i < self.n:
+            xc = .5 * (self.x[i] + self.x[j])
+            yc = .5 * (self.y[i] + self.y[j])
+            length = sqrt((self.x[i] - self.x[j]) ** 2 + (self.y[i] - self.y[j]) ** 2)
+            bands.append(Rotated(Box(xc, yc, length + 2. * h, 2. * h),
+                                 atan2(self.y[i] - self.y[j], self.x[i] - self.x[j]) / M_PI * 180.,
+                                 xc, yc))
+            j = i
+        return RegionOrList(*bands)
+
+    cdef void _bbox(self, double *x1, double *y1, double *x2, double *y2) noexcept nogil:
+        x1[0] = self.xmin
+        x2[0] = self.xmax
+        y1[0] = self.ymin
+        y2[0] = self.ymax
+
+    cdef int _span(self, double px, double py, double dx, double dy,
+                   double *t1, double *t2) noexcept nogil:
+        t1[0] = -HUGE_VAL
+        t2[0] = HUGE_VAL
+
+        return _span_slab(px, dx, self.xmin, self.xmax, t1, t2) & \
+               _span_slab(py, dy, self.ymin, self.ymax, t1, t2)
+
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
+        cdef int i, j, k, kk, k1, k2
         cdef npy_bool r
         cdef double *xp
         cdef double *yp
@@ -593,6 +3099,34 @@ cdef class Polygon(RegionBase):
         xp = self.x
         yp = self.y
 
+        if self.band_start != NULL:
+            if not ((self.ymin <= y) & (y <= self.ymax)):
+                return 0
+
+            # the same test as below, for the edges of the band only
+            kk = self._band_of(y)
+            k1 = self.band_start[kk]
+            k2 = self.band_start[kk + 1]
+            for k from k1 <= k < k2:
+                i = self.band_edges[k]
+                j = i - 1 if i > 0 else self.n - 1
+
+                y_yp_i = y - yp[i]
+                y_yp_j = y - yp[j]
+
+                if (y_yp_i == 0.) & (y_yp_j == 0.):
+                    if (xp[i] - x) * (xp[j] - x) <= 0.:
+                        return 1
+
+                if ((0 <= y_yp_i) & (0 > y_yp_j) | (0 <= y_yp_j) & (0 > y_yp_i)):
+                    _t = xp[i] + y_yp_i / (yp[j] - yp[i]) * (xp[j] - xp[i])
+                    if _t == x:
+                        return 1
+                    if (_t < x):
+                        r = not r
+
+            return r
+
         #stable version, but would require more time
         for i from 0 <= i < self.n:
             y_yp_i = y - yp[i]
@@ -642,13 +3176,13 @@ cdef class AngleRange(RegionBase):
 
         self.metric_set_origin(xc, yc, c)
 
-    cdef double _fix_angle(self, double a):
+    cdef double _fix_angle(self, double a) noexcept nogil:
         if a > self.radian1:
             return self.radian1 + fmod((a - self.radian1), 2 * M_PI)
         else:
             return self.radian1 + 2. * M_PI - fmod((self.radian1 - a), 2 * M_PI)
 
-    cdef npy_bool _inside(self, double x, double y):
+    cdef npy_bool _inside(self, double x, double y) noexcept nogil:
         cdef double dx, dy, theta
 
         dx = x - self.xc
@@ -659,5 +3193,79 @@ cdef class AngleRange(RegionBase):
         theta = self._fix_angle(theta)
         return (theta < self.radian2)
 
+    cdef double _cover(self, double *qx, double *qy) noexcept nogil:
+        cdef _Clip c
+        cdef double r1 = self.radian1, r2 = self.radian2
+
+        if r2 - r1 > M_PI:
+            # one minus the complementary wedge, which is convex
+            r1, r2 = r2, r1 + 2. * M_PI
+        _clip_init(&c, qx[0], qy[0])
+        _clip_add_line(&c, self.xc, self.yc, cos(r1), sin(r1))
+        _clip_add_line(&c, self.xc, self.yc, -cos(r2), -sin(r2))
+        if r1 == self.radian1:
+            return _fraction(_clip_quad(qx, qy, &c))
+        return _fraction(1. - _clip_quad(qx, qy, &c))
+
+    cdef object _band(self, double h, double x1, double y1,
+                      double x2, double y2):
+        # a box along each ray, long enough to cross the window
+        cdef double length = 0.
+
+        for x in (x1, x2):
+            for y in (y1, y2):
+                length = max(length, sqrt((x - self.xc) ** 2 + (y - self.yc) ** 2))
+
+        bands = []
+        for theta in (self.radian1, self.radian2):
+            xc = self.xc + .5 * length * cos(theta)
+            yc = self.yc + .5 * length * sin(theta)
+            bands.append(Rotated(Box(xc, yc, length + 2. * h, 2. * h),
+                                 theta / M_PI * 180., xc, yc))
+        return RegionOrList(*bands)
+
     def __repr__(self):
         return "AngleRange(%f, %f, %f, %f)" % (self.xc, self.yc, self.degree1, self.degree2)
+
+
+cdef class _Scaled(Transform):
+    # The filter on a grid n times finer, whose point X is the point
+    # (X + .5) / n - .5 of the original one, so that the n x n points
+    # of each pixel are counted for the subsampled masks.
+
+    cdef int n
+
+    def __init__(self, RegionBase child_region, int n):
+        Transform.__init__(self, child_region)
+        self.n = n
+        self.composite = 1
+
+    cdef int _transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
+        xp[0] = (x + .5) / self.n - .5
+        yp[0] = (y + .5) / self.n - .5
+
+    cdef int _inverse_transform(self, double x, double y, double *xp, double *yp) noexcept nogil:
+        xp[0] = (x + .5) * self.n - .5
+        yp[0] = (y + .5) * self.n - .5
+
+    cdef Transform _with_child(self, RegionBase child):
+        cdef _Scaled r
+
+        r = _Scaled.__new__(_Scaled)
+        r.child_region = child
+        r.composite = 0
+        r.n = self.n
+        return r
+
+    cdef RegionBase _push_down(self, RegionBase child):
+        cdef Polygon p
+        cdef Transform t
+
+        if isinstance(child, Polygon):
+            # rasterized with its edges rather than point by point
+            p = <Polygon> child
+            return Polygon((p.xa + .5) * self.n - .5, (p.ya + .5) * self.n - .5)
+        if isinstance(child, Transform) and (<Transform> child).composite:
+            t = <Transform> child
+            return self._push_down(t._push_down(t.child_region))
+        return Transform._push_down(self, child)
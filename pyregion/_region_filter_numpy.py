@@ -0,0 +1,685 @@
+"""
+Region filters in pure NumPy.
+
+The same classes as `pyregion._region_filter`, evaluated with whole-array
+operations over the coordinates instead of the compiled extension. The
+points are tested as in the extension, so that both give the same masks.
+"""
+
+import math
+
+import numpy as np
+
+
+class RegionFilterException(Exception):
+    pass
+
+
+class BaseClassInitException(Exception):
+    pass
+
+
+class NotYetImplemented(Exception):
+    pass
+
+
+# masks are made this many pixels at a time
+_MASK_CHUNK_SIZE = 1 << 20
+
+
+class RegionBase:
+
+    def __init__(self):
+        raise BaseClassInitException()
+
+    def __invert__(self):
+        return RegionNot(self)
+
+    def __and__(self, o):
+        return RegionAnd(self, o)
+
+    def __or__(self, o):
+        return RegionOr(self, o)
+
+    def _inside(self, x, y):
+        # x, y : 1-d arrays of float
+        return np.zeros(x.shape, dtype=bool)
+
+    def _bbox(self):
+        # unbounded unless a subclass knows better
+        return -np.inf, -np.inf, np.inf, np.inf
+
+    def bbox(self):
+        """
+        bbox() : returns (x1, y1, x2, y2), a box which contains all the
+        points inside the filter. It is unbounded (infinite) if the
+        filter is, and empty (x1 > x2) if no point is inside.
+        """
+        return tuple(float(v) for v in self._bbox())
+
+    def mask(self, img_or_shape, n_threads=None, mode="center", subsample=5):
+        """
+        Create a mask ( a 2-d image whose pixel value is 1 if the
+        pixel is inside the filter, otherwise 0). It takes a single
+        argument which is numpy 2d array (or any python object with
+        *shape* attribute) or a tuple of two integer representing the
+        image shape.
+
+        With mode="subsample", the mask is a float32 image of the
+        fraction of subsample x subsample points of each pixel inside
+        the filter. mode="exact" is only available with the extension.
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+
+        ny, nx = _image_shape(img_or_shape)
+
+        if mode == "center":
+            n = 1
+        elif mode in ("subsample", "exact"):
+            if not (subsample >= 1):
+                raise ValueError("subsample must be a positive integer: "
+                                 "%s is given" % (str(subsample)))
+            if mode == "exact":
+                raise NotYetImplemented("mode='exact' needs the compiled "
+                                        "region filters")
+            n = int(subsample)
+        else:
+            raise ValueError("mode must be one of 'center', 'subsample' or "
+                             "'exact': %s is given" % (str(mode)))
+
+        ra = np.zeros((ny, nx), dtype=bool if mode == "center" else np.float32)
+        self._fill_window(ra, 0, 0, 0, ny, 0, nx, n)
+        return ra
+
+    def mask_cutout(self, img_or_shape, window=None, out=None, n_threads=None):
+        """
+        Create the mask of a cutout of the image, without allocating a
+        mask of the whole image. Returns (slices, mask), where mask is
+        the part slices of the mask of the whole image (as made by the
+        mask method), which is 0 outside of it.
+
+        By default, the cutout is the smallest one which contains all
+        the pixels inside the filter. If window is given as a pair of
+        slices (of y and x), the cutout is the window clipped to the
+        image instead, and the mask may be written into out, a boolean
+        array of the shape of the cutout.
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+
+        ny, nx = _image_shape(img_or_shape)
+
+        if window is None:
+            if out is not None:
+                raise ValueError("out is only supported with a window")
+            y1, y2, x1, x2 = self._window(0, ny, 0, nx)
+        else:
+            y1, y2, x1, x2 = _window_indices(window, ny, nx)
+
+        if out is None:
+            ra = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+        else:
+            if not (isinstance(out, np.ndarray) and out.dtype == bool and
+                    out.shape == (y2 - y1, x2 - x1)):
+                raise ValueError("out must be a boolean array of shape %s"
+                                 % (str((y2 - y1, x2 - x1))))
+            ra = out
+            ra[...] = False
+
+        self._fill_window(ra, y1, x1, y1, y2, x1, x2, 1)
+
+        if window is None:
+            # down to the rows and columns with pixels inside
+            rows = ra.any(axis=1).nonzero()[0]
+            if len(rows) == 0:
+                return (slice(0, 0), slice(0, 0)), ra[:0, :0]
+            cols = ra.any(axis=0).nonzero()[0]
+            ra = ra[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+            y1, y2 = y1 + rows[0], y1 + rows[-1] + 1
+            x1, x2 = x1 + cols[0], x1 + cols[-1] + 1
+
+        return (slice(y1, y2), slice(x1, x2)), ra
+
+    def mask_runs(self, img_or_shape, n_threads=None):
+        """
+        Create a run-length encoded mask, without allocating a mask of
+        the whole image. Returns (rows, starts, stops), arrays with an
+        element for each run of pixels inside the filter: the run k is
+        the pixels starts[k] <= x < stops[k] of the row rows[k]. The
+        runs are sorted by row and by x, and do not touch.
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+        (sy, sx), mask = self.mask_cutout(img_or_shape)
+
+        # the runs start and stop where the padded rows change
+        padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        change = np.diff(padded, axis=1)
+        rows, starts = (change == 1).nonzero()
+        stops = (change == -1).nonzero()[1]
+
+        return (rows.astype(np.intp) + sy.start, starts.astype(np.intp) + sx.start,
+                stops.astype(np.intp) + sx.start)
+
+    def reduce(self, data, ops=("sum", "count", "mean", "min", "max"),
+               n_threads=None):
+        """
+        Statistics of the pixels of data inside the filter: a dict of
+        the values of ops, among "sum", "count", "mean", "min" and
+        "max". They are those of data[mask], read along the runs of
+        pixels without making a mask of the image (see
+        pyregion.sparse_mask.reduce_runs).
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+        from .sparse_mask import _check_ops, reduce_runs
+
+        _check_ops(ops)
+        return reduce_runs(data, self.mask_runs(data.shape[-2:]), ops)
+
+    def mask_packed(self, img_or_shape, n_threads=None):
+        """
+        Create a bit-packed mask: a uint8 array of shape
+        (ny, (nx + 7) // 8), which is numpy.packbits(mask, axis=1) for
+        the mask given by the mask method, without making it.
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+        ny, nx = _image_shape(img_or_shape)
+        ra = np.zeros((ny, (nx + 7) // 8), dtype=np.uint8)
+
+        # the rows of the bounding box, packed a chunk at a time
+        y1, y2, x1, x2 = self._window(0, ny, 0, nx)
+        if (y1 >= y2) or (x1 >= x2):
+            return ra
+
+        rows = max(1, _MASK_CHUNK_SIZE // nx)
+        for cy1 in range(y1, y2, rows):
+            cy2 = min(cy1 + rows, y2)
+            mask = np.zeros((cy2 - cy1, nx), dtype=bool)
+            self._fill_window(mask, cy1, 0, cy1, cy2, x1, x2, 1)
+            ra[cy1:cy2] = np.packbits(mask, axis=1)
+
+        return ra
+
+    def _window(self, y1, y2, x1, x2):
+        # the window [y1, y2) x [x1, x2) narrowed to the bounding box
+        bx1, by1, bx2, by2 = self._bbox()
+        if not ((bx1 <= bx2) and (by1 <= by2)):
+            return y1, y1, x1, x1
+
+        y1, y2 = (_clip_index(np.floor(by1), y1, y2),
+                  _clip_index(np.ceil(by2) + 1, y1, y2))
+        x1, x2 = (_clip_index(np.floor(bx1), x1, x2),
+                  _clip_index(np.ceil(bx2) + 1, x1, x2))
+        return y1, y2, x1, x2
+
+    def _fill_window(self, ra, y0, x0, y1, y2, x1, x2, n):
+        # Set the pixels of ra within [y1, y2) x [x1, x2) to the fraction
+        # of their n x n points inside, where ra starts at the pixel
+        # (y0, x0). Only the pixels within the bounding box are tested.
+        y1, y2, x1, x2 = self._window(y1, y2, x1, x2)
+        if (y1 >= y2) or (x1 >= x2):
+            return
+
+        x = np.arange(x1, x2, dtype=float)
+        rows = max(1, _MASK_CHUNK_SIZE // (x2 - x1))
+        for cy1 in range(y1, y2, rows):
+            cy2 = min(cy1 + rows, y2)
+            xx, yy = np.meshgrid(x, np.arange(cy1, cy2, dtype=float))
+            xx, yy = xx.ravel(), yy.ravel()
+            if n == 1:
+                inside = self._inside(xx, yy)
+            else:
+                # the n x n points of each pixel, as in the extension
+                inside = np.zeros(xx.shape, dtype=np.intp)
+                for i in range(n):
+                    for j in range(n):
+                        inside += self._inside(xx + ((j + .5) / n - .5),
+                                               yy + ((i + .5) / n - .5))
+                inside = inside / float(n * n)
+            ra[cy1 - y0:cy2 - y0, x1 - x0:x2 - x0] = inside.reshape(cy2 - cy1,
+                                                                    x2 - x1)
+
+    def inside1(self, x, y):
+        """
+        inside1(float, float) : returns True if the point (x,y) is inside the filter.
+        """
+        return bool(self._inside(np.array([x], dtype=float),
+                                 np.array([y], dtype=float))[0])
+
+    def inside(self, x, y=None):
+        if y is None:
+            if len(x.shape) == 2 and x.shape[-1] == 2:
+                return self.inside_xy(x)
+            else:
+                raise ValueError("input array has a wrong shape")
+        else:
+            return self.inside_x_y(x, y)
+
+    def inside_xy(self, xy, n_threads=None):
+        """
+        inside(x, y) : given the numpy array of x and y, returns an
+        array b of same shape, where b[i] = inside1(x[i], y[i])
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+        xy = np.asarray(xy, dtype=float)
+        return self._inside(xy[:, 0].copy(), xy[:, 1].copy())
+
+    def inside_x_y(self, x, y, n_threads=None):
+        """
+        inside(x, y) : given the numpy array of x and y, returns an
+        array b of same shape, where b[i] = inside1(x[i], y[i])
+
+        n_threads is accepted for compatibility, and ignored.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        return self._inside(x.ravel(), y.ravel()).reshape(x.shape)
+
+
+def _clip_index(v, lo, hi):
+    # v is clipped before the conversion so that infinities are safe
+    return int(min(max(v, lo), hi))
+
+
+def _image_shape(img_or_shape):
+    # (ny, nx) of a 2-d image, or of its shape
+    if hasattr(img_or_shape, "shape"):
+        shape = img_or_shape.shape
+    else:
+        try:
+            shape = tuple(img_or_shape)
+        except TypeError:
+            raise RegionFilterException("the inut needs to be a numpy 2-d array"
+                                        " or a tuple of two integers")
+
+    if len(shape) != 2:
+        raise RegionFilterException("shape of the input image must be 2d: "
+                                    "%s is given" % (str(shape)))
+
+    return int(shape[0]), int(shape[1])
+
+
+def _window_indices(window, ny, nx):
+    # (y1, y2, x1, x2) of a pair of slices, clipped to the image
+    try:
+        sy, sx = window
+        y1, y2, ystep = sy.indices(ny)
+        x1, x2, xstep = sx.indices(nx)
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("window must be a pair of slices: "
+                         "%s is given" % (str(window)))
+    if (ystep != 1) or (xstep != 1):
+        raise ValueError("the slices of window must have a step of 1")
+    return y1, max(y1, y2), x1, max(x1, x2)
+
+
+class RegionNot(RegionBase):
+    """
+    >>> r = RegionNot(r2)
+    """
+
+    def __init__(self, child_region):
+        self.child_region = child_region
+
+    def _inside(self, x, y):
+        return ~self.child_region._inside(x, y)
+
+
+class RegionList(RegionBase):
+
+    def _check_type_of_list(self, kl):
+        for k in kl:
+            if not isinstance(k, RegionBase):
+                raise TypeError("All elements should be subclass of RegionBase type: %s" % k)
+
+    def __init__(self, *kl):
+        self._check_type_of_list(kl)
+        self.child_regions = list(kl)
+
+    def __len__(self):
+        return len(self.child_regions)
+
+    def __getitem__(self, x):
+        return self.child_regions[x]
+
+    def __setitem__(self, x, y):
+        self._check_type_of_list([y])
+        self.child_regions[x] = y
+
+    def __delitem__(self, x):
+        del self.child_regions[x]
+
+    def __contains__(self, x):
+        return x in self.child_regions
+
+    def __repr__(self):
+        return repr(self.child_regions)
+
+    def asList(self):
+        return self.child_regions
+
+
+class RegionOrList(RegionList):
+    """
+    >>> r = RegionOrList(r1, r2, r3, r4, ...)
+    """
+
+    def _inside(self, x, y):
+        r = np.zeros(x.shape, dtype=bool)
+        for child in self.child_regions:
+            # only the points not inside yet are tested
+            todo = ~r
+            r[todo] = child._inside(x[todo], y[todo])
+        return r
+
+    def _bbox(self):
+        bbox = [b for b in (child._bbox() for child in self.child_regions)
+                if (b[0] <= b[2]) and (b[1] <= b[3])]
+        if not bbox:
+            return np.inf, np.inf, -np.inf, -np.inf
+        x1, y1, x2, y2 = zip(*bbox)
+        return min(x1), min(y1), max(x2), max(y2)
+
+    def __repr__(self):
+        return "Or" + repr(self.child_regions)
+
+
+class RegionAndList(RegionList):
+    """
+    >>> r = RegionAndList(r1, r2, r3, r4, ...)
+    """
+
+    def _inside(self, x, y):
+        r = np.ones(x.shape, dtype=bool)
+        for child in self.child_regions:
+            # only the points still inside are tested
+            r[r] = child._inside(x[r], y[r])
+        return r
+
+    def _bbox(self):
+        x1, y1, x2, y2 = -np.inf, -np.inf, np.inf, np.inf
+        for child in self.child_regions:
+            cx1, cy1, cx2, cy2 = child._bbox()
+            x1, y1 = max(x1, cx1), max(y1, cy1)
+            x2, y2 = min(x2, cx2), min(y2, cy2)
+        return x1, y1, x2, y2
+
+    def __repr__(self):
+        return "And" + repr(self.child_regions)
+
+
+def RegionAnd(region1, region2):
+    """
+    >>> r = RegionAnd(reg1, reg2)
+    """
+    if isinstance(region1, RegionAndList):
+        region1_list = region1.asList()
+    else:
+        region1_list = [region1]
+
+    if isinstance(region2, RegionAndList):
+        region2_list = region2.asList()
+    else:
+        region2_list = [region2]
+
+    return RegionAndList(*(region1_list + region2_list))
+
+
+def RegionOr(region1, region2):
+    """
+    >>> r = RegionOr(reg1, reg2)
+    """
+    if isinstance(region1, RegionOrList):
+        region1_list = region1.asList()
+    else:
+        region1_list = [region1]
+
+    if isinstance(region2, RegionOrList):
+        region2_list = region2.asList()
+    else:
+        region2_list = [region2]
+
+    return RegionOrList(*(region1_list + region2_list))
+
+
+class Transform(RegionBase):
+
+    def __init__(self, child_region):
+        self.child_region = child_region
+
+    @property
+    def child(self):
+        return self.child_region
+
+    def _transform(self, x, y):
+        return x, y
+
+    def _inverse_transform(self, x, y):
+        return x, y
+
+    def _inside(self, x, y):
+        return self.child_region._inside(*self._transform(x, y))
+
+    def _bbox(self):
+        cx1, cy1, cx2, cy2 = self.child_region._bbox()
+        if not ((cx1 <= cx2) and (cy1 <= cy2)):
+            return np.inf, np.inf, -np.inf, -np.inf
+        if not np.isfinite([cx1, cy1, cx2, cy2]).all():
+            return -np.inf, -np.inf, np.inf, np.inf
+
+        # the box around the four transformed corners
+        xp, yp = self._inverse_transform(np.array([cx1, cx1, cx2, cx2]),
+                                         np.array([cy1, cy2, cy1, cy2]))
+        return xp.min(), yp.min(), xp.max(), yp.max()
+
+
+class Rotated(Transform):
+    """
+    Rotate the region by degree in anti-colockwise direction.
+
+     >>> reg = Rotated(child_region, degree, origin_x, origin_y)
+
+    """
+
+    def __init__(self, child_region, degree, origin_x, origin_y):
+        Transform.__init__(self, child_region)
+
+        theta = degree / 180. * math.pi
+        self.sin_theta = math.sin(theta)
+        self.cos_theta = math.cos(theta)
+
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+
+    def _transform(self, x, y):
+        st, ct = self.sin_theta, self.cos_theta
+        x1 = x - self.origin_x
+        y1 = y - self.origin_y
+        return (ct * x1 + st * y1 + self.origin_x,
+                -st * x1 + ct * y1 + self.origin_y)
+
+    def _inverse_transform(self, x, y):
+        st, ct = self.sin_theta, self.cos_theta
+        x1 = x - self.origin_x
+        y1 = y - self.origin_y
+        return (ct * x1 - st * y1 + self.origin_x,
+                st * x1 + ct * y1 + self.origin_y)
+
+
+class Translated(Transform):
+    """
+    Translated region.
+
+     >>> Translate(child_region, dx, dy)
+    """
+
+    def __init__(self, child_region, dx, dy):
+        Transform.__init__(self, child_region)
+
+        self.dx = dx
+        self.dy = dy
+
+    def _transform(self, x, y):
+        return x - self.dx, y - self.dy
+
+    def _inverse_transform(self, x, y):
+        return x + self.dx, y + self.dy
+
+
+# Basic Shapes
+
+class Circle(RegionBase):
+    """
+    Circle.
+
+    >>> cir = Circle(xc, yc, radius)
+
+    """
+
+    def __init__(self, xc, yc, radius):
+        self.xc = xc
+        self.yc = yc
+        self.radius = radius
+        self.radius2 = radius * radius
+
+    def _inside(self, x, y):
+        return (x - self.xc) ** 2 + (y - self.yc) ** 2 <= self.radius2
+
+    def _bbox(self):
+        r = abs(self.radius)
+        return self.xc - r, self.yc - r, self.xc + r, self.yc + r
+
+    def __repr__(self):
+        return "Circle(%f, %f, %f)" % (self.xc, self.yc, self.radius)
+
+
+class Ellipse(RegionBase):
+    """
+    Ellipse.
+
+    >>> shape = Ellipse(xc, yc, radius_major, radius_minor)
+    """
+
+    def __init__(self, xc, yc, radius_major, radius_minor):
+        self.xc = xc
+        self.yc = yc
+        self.radius_major = radius_major
+        self.radius_minor = radius_minor
+        self.radius_major_2 = radius_major ** 2
+        self.radius_minor_2 = radius_minor ** 2
+        self.radius_major_2_radius_minor_2 = self.radius_major_2 * self.radius_minor_2
+
+    def _inside(self, x, y):
+        dist2 = (self.radius_minor_2 * (x - self.xc) ** 2 +
+                 self.radius_major_2 * (y - self.yc) ** 2)
+        return dist2 <= self.radius_major_2_radius_minor_2
+
+    def _bbox(self):
+        a, b = abs(self.radius_major), abs(self.radius_minor)
+        return self.xc - a, self.yc - b, self.xc + a, self.yc + b
+
+    def __repr__(self):
+        return "Ellipse(%f, %f, %f, %f)" % (self.xc, self.yc, self.radius_major, self.radius_minor)
+
+
+class Box(RegionBase):
+    """
+    Box.
+
+    >>> shape = Box(xc, yc, width, height)
+    """
+
+    def __init__(self, xc, yc, width, height):
+        halfwidth = width * .5
+        halfheight = height * .5
+
+        self.x1 = xc - halfwidth
+        self.x2 = xc + halfwidth
+        self.y1 = yc - halfheight
+        self.y2 = yc + halfheight
+
+    def _inside(self, x, y):
+        return (self.x1 <= x) & (x <= self.x2) & (self.y1 <= y) & (y <= self.y2)
+
+    def _bbox(self):
+        return self.x1, self.y1, self.x2, self.y2
+
+
+class Polygon(RegionBase):
+    """
+    Polygon.
+
+     >>> shape = Polygon(x, y)
+
+     Parameters:
+     x, y : list of floats
+    """
+
+    def __init__(self, x, y):
+        self.x = np.array(x, dtype=float).ravel()
+        self.y = np.array(y, dtype=float).ravel()
+
+    def _inside(self, x, y):
+        # crossing number, with the points on an edge inside
+        xp, yp = self.x, self.y
+        r = np.zeros(x.shape, dtype=bool)
+        on_edge = np.zeros(x.shape, dtype=bool)
+
+        j = len(xp) - 1
+        for i in range(len(xp)):
+            y_yp_i = y - yp[i]
+            y_yp_j = y - yp[j]
+
+            if yp[i] == yp[j]:
+                # horizontal edge
+                on_edge |= ((y_yp_i == 0.) &
+                            ((xp[i] - x) * (xp[j] - x) <= 0.))
+            else:
+                c = (((0 <= y_yp_i) & (0 > y_yp_j)) |
+                     ((0 <= y_yp_j) & (0 > y_yp_i)))
+                t = xp[i] + y_yp_i[c] / (yp[j] - yp[i]) * (xp[j] - xp[i])
+                on_edge[c] |= (t == x[c])
+                r[c] ^= (t < x[c])
+            j = i
+
+        return r | on_edge
+
+    def _bbox(self):
+        if len(self.x) == 0:
+            return np.inf, np.inf, -np.inf, -np.inf
+        return self.x.min(), self.y.min(), self.x.max(), self.y.max()
+
+
+class AngleRange(RegionBase):
+    """
+    AngleRange.
+
+    >>> shape = AngleRange(xc, yc, degree1, degree2)
+    """
+
+    def __init__(self, xc, yc, degree1, degree2):
+        self.xc = xc
+        self.yc = yc
+        self.degree1 = degree1
+        self.degree2 = degree2
+
+        # theta in radian
+        self.radian1 = degree1 / 180. * math.pi
+        self.radian2 = float(self._fix_angle(np.array(degree2 / 180. * math.pi)))
+
+    def _fix_angle(self, a):
+        return np.where(a > self.radian1,
+                        self.radian1 + np.fmod(a - self.radian1, 2 * math.pi),
+                        self.radian1 + 2. * math.pi - np.fmod(self.radian1 - a, 2 * math.pi))
+
+    def _inside(self, x, y):
+        theta = np.arctan2(y - self.yc, x - self.xc)
+        return self._fix_angle(theta) < self.radian2
+
+    def __repr__(self):
+        return "AngleRange(%f, %f, %f, %f)" % (self.xc, self.yc, self.degree1, self.degree2)
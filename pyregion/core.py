@@ -45,13 +45,20 @@ class ShapeList(list):
         else:
             return True
 
-    def as_imagecoord(self, header):
+    def as_imagecoord(self, header, local=False):
         """New shape list in image coordinates.
 
         Parameters
         ----------
         header : `~astropy.io.fits.Header`
             FITS header
+        local : bool
+            If True, the angles of the shapes are converted with the
+            rotation of the north axis at their center, and their radii
+            and axis lengths with the pixel scales of the WCS there,
+            distortions included, rather than with the rotation at the
+            center of the image as DS9 does and the scales at the
+            reference pixel. This is more accurate for wide-field images.
 
         Returns
         -------
@@ -66,7 +73,7 @@ class ShapeList(list):
             comment_list = cycle([None])
 
         r = RegionParser.sky_to_image(zip(self, comment_list),
-                                      header)
+                                      header, local=local)
         shape_list, comment_list = zip(*list(r))
         return ShapeList(shape_list, comment_list=comment_list)
 
@@ -88,7 +95,15 @@ class ShapeList(list):
 
         return patches, txts
 
-    def get_filter(self, header=None, origin=1):
+    def _in_imagecoord(self, header):
+        # the shape list in image coordinates, for the filters
+        if header is None:
+            if not self.check_imagecoord():
+                raise RuntimeError("the region has non-image coordinate. header is required.")
+            return self
+        return self.as_imagecoord(header)
+
+    def get_filter(self, header=None, origin=1, backend=None):
         """Get filter.
         Often, the regions files implicitly assume the lower-left
         corner of the image as a coordinate (1,1). However, the python
@@ -103,6 +118,9 @@ class ShapeList(list):
             FITS header
         origin : {0, 1}
             Pixel coordinate origin
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter: the compiled extension, or pure
+            NumPy. By default, the compiled extension if it is available.
 
         Returns
         -------
@@ -112,20 +130,25 @@ class ShapeList(list):
 
         from .region_to_filter import as_region_filter
 
-        if header is None:
-            if not self.check_imagecoord():
-                raise RuntimeError("the region has non-image coordinate. header is required.")
-            reg_in_imagecoord = self
-        else:
-            reg_in_imagecoord = self.as_imagecoord(header)
+        reg_in_imagecoord = self._in_imagecoord(header)
 
-        region_filter = as_region_filter(reg_in_imagecoord, origin=origin)
+        region_filter = as_region_filter(reg_in_imagecoord, origin=origin,
+                                         backend=backend)
 
         return region_filter
 
-    def get_mask(self, hdu=None, header=None, shape=None):
+    def get_mask(self, hdu=None, header=None, shape=None, backend=None,
+                 per_plane=False):
         """Create a 2-d mask.
 
+        For an image with more than two axes (such as a data cube), the
+        mask is made on the first two axes of the header (the last two
+        axes of the array), and returned as a read-only view broadcast
+        to the other axes, without copies; ``mask[0]`` (or
+        ``mask[(0,) * (mask.ndim - 2)]``) is the 2-d mask. If the
+        celestial WCS changes from a plane to another, use
+        ``per_plane=True`` instead.
+
         Parameters
         ----------
         hdu : `astropy.io.fits.ImageHDU`
@@ -134,6 +157,12 @@ class ShapeList(list):
             FITS header
         shape : tuple
             Image shape
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+        per_plane : bool
+            For an image with more than two axes, whether to make a mask
+            for each plane, with the WCS of the plane. The mask is then a
+            full array (unless the WCS is the same for all the planes).
 
         Returns
         -------
@@ -152,11 +181,523 @@ class ShapeList(list):
         if hdu and shape is None:
             shape = hdu.data.shape
 
-        region_filter = self.get_filter(header=header)
-        mask = region_filter.mask(shape)
+        if len(shape) <= 2:
+            region_filter = self.get_filter(header=header, backend=backend)
+            return region_filter.mask(shape)
+
+        import numpy as np
+        from .wcs_helper import _is_plane_invariant, _plane_header
 
+        shape = tuple(shape)
+        if (not per_plane) or (header is None) or _is_plane_invariant(header):
+            region_filter = self.get_filter(header=header, backend=backend)
+            mask = region_filter.mask(shape[-2:])
+            return np.broadcast_to(mask, shape)
+
+        mask = np.empty(shape, dtype=bool)
+        for index in np.ndindex(*shape[:-2]):
+            region_filter = self.get_filter(header=_plane_header(header, index),
+                                            backend=backend)
+            mask[index] = region_filter.mask(shape[-2:])
         return mask
 
+    def get_mask_runs(self, hdu=None, header=None, shape=None, backend=None):
+        """Create a run-length encoded 2-d mask.
+
+        Unlike `get_mask`, no mask of the whole image is allocated. See
+        `pyregion.sparse_mask` for helpers to use it.
+
+        Parameters
+        ----------
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        shape : tuple
+            Image shape
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        runs : tuple of `numpy.array`
+            ``(rows, starts, stops)``, where the run ``k`` is the pixels
+            ``starts[k] <= x < stops[k]`` of the row ``rows[k]``
+
+        Examples
+        --------
+        runs = get_mask_runs(hdu=f[0])
+        values = pyregion.sparse_mask.take_runs(f[0].data, runs)
+        """
+
+        if hdu and header is None:
+            header = hdu.header
+        if hdu and shape is None:
+            shape = hdu.data.shape
+
+        region_filter = self.get_filter(header=header, backend=backend)
+
+        return region_filter.mask_runs(shape)
+
+    def get_mask_packed(self, hdu=None, header=None, shape=None,
+                        backend=None):
+        """Create a bit-packed 2-d mask.
+
+        The mask takes a bit per pixel, in the layout of
+        `numpy.packbits` along the rows. See `pyregion.packed_mask` for
+        helpers to use it.
+
+        Parameters
+        ----------
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        shape : tuple
+            Image shape
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        packed_mask : `numpy.array`
+            uint8 array of shape ``(ny, (nx + 7) // 8)``, equal to
+            ``numpy.packbits(get_mask(...), axis=1)``
+
+        Examples
+        --------
+        packed_mask = get_mask_packed(hdu=f[0])
+        """
+
+        if hdu and header is None:
+            header = hdu.header
+        if hdu and shape is None:
+            shape = hdu.data.shape
+
+        region_filter = self.get_filter(header=header, backend=backend)
+
+        return region_filter.mask_packed(shape)
+
+    def get_label_mask(self, hdu=None, header=None, shape=None,
+                       overlaps=False, backend=None):
+        """Create a 2-d mask of the index of the shape of each pixel.
+
+        Each shape is rasterized once, within its bounding box. A pixel
+        inside several shapes is labeled with the last of them, and the
+        excluded shapes are removed from the shapes before them (as in
+        `get_mask`).
+
+        Parameters
+        ----------
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        shape : tuple
+            Image shape
+        overlaps : bool
+            Whether to also return the shapes of the pixels inside
+            several shapes
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        label_mask : `numpy.array`
+            int32 mask of the index of the shape in this list of each
+            pixel, or -1 outside of the shapes
+        overlaps : tuple of `numpy.array`
+            If ``overlaps`` is set, ``(pixel, index)``: the flat index
+            in the image of each pixel inside several shapes, repeated
+            for each of them, and the index of the shape, sorted by
+            pixel and index
+
+        Examples
+        --------
+        label_mask = get_label_mask(hdu=f[0])
+        mask_of_shape_2 = label_mask == 2
+        """
+
+        import numpy as np
+        from .region_to_filter import as_region_filter_list
+
+        if hdu and header is None:
+            header = hdu.header
+        if hdu and shape is None:
+            shape = hdu.data.shape
+
+        reg_in_imagecoord = self._in_imagecoord(header)
+        filter_list = as_region_filter_list(reg_in_imagecoord,
+                                            backend=backend)
+
+        label_mask = np.full(shape, -1, dtype=np.int32)
+        keys = []
+        n = max(len(self), 1)
+
+        for i, region_filter in filter_list:
+            slices, mask = region_filter.mask_cutout(shape)
+            labels = label_mask[slices]
+
+            if overlaps:
+                # the pixels already labeled, keyed by pixel and index
+                previous = labels[mask]
+                covered = previous >= 0
+                if covered.any():
+                    y, x = mask.nonzero()
+                    pixel = np.ravel_multi_index((y[covered] + slices[0].start,
+                                                  x[covered] + slices[1].start),
+                                                 label_mask.shape)
+                    pixel = pixel.astype(np.int64) * n
+                    keys.extend([pixel + previous[covered], pixel + i])
+
+            labels[mask] = i
+
+        if not overlaps:
+            return label_mask
+
+        keys = np.unique(np.concatenate(keys)) if keys else np.zeros(0, np.int64)
+        return label_mask, (keys // n, (keys % n).astype(np.int32))
+
+    def reduce(self, data=None, hdu=None, header=None,
+               ops=("sum", "count", "mean", "min", "max"), backend=None):
+        """Statistics of the pixels of an image inside each shape.
+
+        The pixels of each shape (without the excluded shapes which
+        follow it, as in `get_label_mask`) are read along their runs,
+        without making masks, so that the image may be memory-mapped.
+        See the ``reduce`` method of the region filters.
+
+        Parameters
+        ----------
+        data : `numpy.array`
+            Image, by default the data of the HDU
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        ops : tuple of str
+            Statistics among "sum", "count", "mean", "min" and "max"
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        statistics : dict
+            ``"index"``, the index in this list of each included shape,
+            and the value of each statistic for each of them
+
+        Examples
+        --------
+        stats = reduce(hdu=f[0], ops=("sum", "count"))
+        """
+
+        import numpy as np
+        from .region_to_filter import as_region_filter_list
+
+        if hdu and header is None:
+            header = hdu.header
+        if data is None:
+            data = hdu.data
+
+        reg_in_imagecoord = self._in_imagecoord(header)
+        filter_list = as_region_filter_list(reg_in_imagecoord,
+                                            backend=backend)
+
+        results = [region_filter.reduce(data, ops=ops)
+                   for i, region_filter in filter_list]
+
+        statistics = {"index": np.array([i for i, _ in filter_list], dtype=int)}
+        for op in ops:
+            statistics[op] = np.array([r[op] for r in results])
+        return statistics
+
+    def match_points(self, x, y, header=None, origin=1, n_threads=None,
+                     backend=None):
+        """Find the shapes which contain each of many points.
+
+        The points are tested against each shape (without the excluded
+        shapes which follow it, as in `get_label_mask`), but only those
+        within its bounding box, found with a grid index of the points.
+        This is much faster than ``inside_x_y`` for each shape when the
+        shapes are small compared to the area of the points.
+
+        Parameters
+        ----------
+        x, y : `numpy.array`
+            Coordinates of the points, in pixels, in the convention of
+            the filter given by `get_filter` with the same ``origin``
+        header : `~astropy.io.fits.Header`
+            FITS header
+        origin : {0, 1}
+            Pixel coordinate origin (see `get_filter`)
+        n_threads : int
+            Number of threads used to test the points of each shape
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        point, index : `numpy.array`
+            For each point inside a shape, the index of the point in the
+            (flattened) arrays ``x`` and ``y``, repeated for each of its
+            shapes, and the index of the shape in this list, sorted by
+            point and index
+
+        Examples
+        --------
+        point, index = match_points(x, y)
+        offsets = np.searchsorted(point, np.arange(len(x) + 1))
+        shapes_of_point_7 = index[offsets[7]:offsets[8]]
+        """
+
+        from .region_to_filter import as_region_filter_list, match_points
+
+        reg_in_imagecoord = self._in_imagecoord(header)
+        filter_list = as_region_filter_list(reg_in_imagecoord, origin=origin,
+                                            backend=backend)
+
+        return match_points(filter_list, x, y, n_threads=n_threads)
+
+    def contains_sky(self, ra, dec, frame="fk5", backend=None):
+        """Whether positions on the sky are inside the region.
+
+        Each shape is evaluated on the plane tangent to the sky at its
+        center (see `pyregion.wcs_converter.convert_to_tangent_plane`),
+        so that no header is needed and shapes anywhere on the sky,
+        including near the poles, keep their shape. The positions are
+        converted once to the frame of each group of shapes, and only
+        those within the cap of each shape are projected and tested.
+        Excluded shapes are applied as in `get_mask`.
+
+        Parameters
+        ----------
+        ra, dec : `numpy.array`
+            Longitude and latitude of the positions, in degrees
+        frame : str
+            Frame of the positions, as understood by
+            `~astropy.coordinates.SkyCoord`
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        inside : `numpy.array`
+            Boolean array of the shape of ``ra``
+
+        Examples
+        --------
+        inside = contains_sky(catalog["RA"], catalog["DEC"], frame="icrs")
+        """
+
+        import copy
+        import numpy as np
+        from astropy.coordinates import SkyCoord
+        from .ds9_region_parser import image_like_coordformats
+        from .region_to_filter import get_backend, _shape_filter
+        from .wcs_converter import convert_to_tangent_plane
+        from .wcs_helper import _tangent_plane, _unit_vector
+
+        if [s for s in self if s.coord_format in image_like_coordformats]:
+            raise ValueError("the region has non-sky coordinates: "
+                             "contains_sky needs shapes in sky coordinates")
+
+        region_filter = get_backend(backend)
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+        inside = np.zeros(ra.shape, dtype=bool)
+        flat_inside = inside.reshape(-1)
+
+        # the positions in the frame of each group of shapes, with their
+        # order in latitude to find those near a shape
+        positions = {}
+
+        for shape in self:
+            if shape.coord_format not in positions:
+                c = SkyCoord(ra.ravel(), dec.ravel(), frame=frame,
+                             unit="degree", obstime="J2000")
+                c = c.transform_to(SkyCoord(0, 0, frame=shape.coord_format,
+                                            unit="degree",
+                                            obstime="J2000").frame)
+                lon = c.spherical.lon.degree
+                lat = c.spherical.lat.degree
+                order = np.argsort(lat, kind="stable")
+                positions[shape.coord_format] = lon, lat, order, lat[order]
+            lon, lat, order, sorted_lat = positions[shape.coord_format]
+
+            (lon0, lat0), coord_list = convert_to_tangent_plane(shape)
+            plane_shape = copy.copy(shape)
+            plane_shape.coord_list = coord_list
+            plane_shape.coord_format = "image"
+            f = _shape_filter(region_filter, plane_shape, 0)
+            if f is None:
+                continue
+
+            # the cap on the sky of the bounding box of the shape
+            x1, y1, x2, y2 = f.bbox()
+            if x1 > x2 or y1 > y2:
+                continue
+            rho = max(np.hypot(x, y) for x in (x1, x2) for y in (y1, y2))
+            radius = min(np.degrees(np.arctan(np.radians(rho))), 90.)
+            radius = radius * (1 + 1e-9) + 1e-9
+
+            i1, i2 = np.searchsorted(sorted_lat, [lat0 - radius, lat0 + radius])
+            candidates = order[i1:i2]
+            cos_c = _unit_vector(lon[candidates], lat[candidates]).dot(
+                _unit_vector(lon0, lat0))
+            candidates = candidates[cos_c >= np.cos(np.radians(radius))]
+
+            x, y = _tangent_plane(lon[candidates], lat[candidates], lon0, lat0)
+            candidates = candidates[f.inside_x_y(x, y)]
+            flat_inside[candidates] = not shape.exclude
+
+        return inside
+
+    def get_mask_cutout(self, hdu=None, header=None, shape=None, window=None,
+                        out=None, backend=None):
+        """Create a 2-d mask of a cutout of the image.
+
+        Unlike `get_mask`, no mask of the whole image is allocated.
+
+        Parameters
+        ----------
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        shape : tuple
+            Image shape
+        window : tuple of slice, None
+            Cutout of the image (y and x slices). By default, the
+            smallest cutout which contains the region.
+        out : `numpy.array`, None
+            Boolean array of the shape of the window to write the mask
+            into
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        slices : tuple of slice
+            Cutout of the image
+        mask : `numpy.array`
+            Boolean mask of the cutout, the mask of the whole image being
+            ``False`` outside of it
+
+        Examples
+        --------
+        slices, mask = get_mask_cutout(hdu=f[0])
+        data = f[0].data[slices][mask]
+        """
+
+        if hdu and header is None:
+            header = hdu.header
+        if hdu and shape is None:
+            shape = hdu.data.shape
+
+        region_filter = self.get_filter(header=header, backend=backend)
+
+        return region_filter.mask_cutout(shape, window=window, out=out)
+
+    def get_mask_tiles(self, hdu=None, header=None, shape=None,
+                       tile_shape=(1024, 1024), skip_empty=True,
+                       backend=None):
+        """Create a 2-d mask tile by tile.
+
+        Only a tile of the mask is in memory at a time.
+
+        Parameters
+        ----------
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        shape : tuple
+            Image shape
+        tile_shape : tuple
+            Shape of the tiles. None for an axis takes the whole axis.
+        skip_empty : bool
+            Whether to skip the tiles outside of the region
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Yields
+        ------
+        slices : tuple of slice
+            Tile of the image
+        mask : `numpy.array`
+            Boolean mask of the tile
+
+        Examples
+        --------
+        for slices, mask in get_mask_tiles(hdu=f[0]):
+            f[0].data[slices][mask] = 0
+        """
+
+        if hdu and header is None:
+            header = hdu.header
+        if hdu and shape is None:
+            shape = hdu.data.shape
+
+        region_filter = self.get_filter(header=header, backend=backend)
+
+        # the tiles outside of the bounding box are empty
+        x1, y1, x2, y2 = region_filter.bbox()
+
+        for slices in _tiles(shape, tile_shape):
+            if skip_empty and not ((y1 < slices[0].stop) and
+                                   (y2 >= slices[0].start - 1) and
+                                   (x1 < slices[1].stop) and
+                                   (x2 >= slices[1].start - 1)):
+                continue
+            window, mask = region_filter.mask_cutout(shape, window=slices)
+            if skip_empty and not mask.any():
+                continue
+            yield window, mask
+
+    def apply_mask_tiles(self, func, hdu=None, header=None, data=None,
+                         tile_shape=(1024, 1024), backend=None):
+        """Apply a function to an image and its mask, tile by tile.
+
+        The image is only read (or written) a tile at a time, so that a
+        memory-mapped FITS image is not loaded. The tiles outside of the
+        region are skipped.
+
+        Parameters
+        ----------
+        func : callable
+            Called as ``func(data_tile, mask_tile)`` for each tile, where
+            ``data_tile`` is a view of the image
+        hdu : `astropy.io.fits.ImageHDU`
+            FITS image HDU
+        header : `~astropy.io.fits.Header`
+            FITS header
+        data : `numpy.array`
+            Image, by default the data of the HDU
+        tile_shape : tuple
+            Shape of the tiles (see `get_mask_tiles`)
+        backend : {None, 'cython', 'numpy'}
+            Implementation of the filter (see `get_filter`)
+
+        Returns
+        -------
+        results : list
+            The results of func for each tile
+
+        Examples
+        --------
+        total = sum(apply_mask_tiles(lambda d, m: d[m].sum(), hdu=f[0]))
+        apply_mask_tiles(lambda d, m: np.copyto(d, np.nan, where=m), hdu=f[0])
+        """
+
+        if hdu and header is None:
+            header = hdu.header
+        if data is None:
+            data = hdu.data
+
+        tiles = self.get_mask_tiles(header=header, shape=data.shape,
+                                    tile_shape=tile_shape, backend=backend)
+        return [func(data[slices], mask) for slices, mask in tiles]
+
     def write(self, outfile):
         """Write this shape list to a region file.
 
@@ -220,20 +761,45 @@ class ShapeList(list):
                 outf.close()
 
 
-def parse(region_string):
+def _tiles(shape, tile_shape):
+    # the slices of the tiles of an image, row by row
+    ny, nx = shape
+    ty, tx = tile_shape
+    ty = ty or ny or 1
+    tx = tx or nx or 1
+    for y in range(0, ny, ty):
+        for x in range(0, nx, tx):
+            yield slice(y, min(y + ty, ny)), slice(x, min(x + tx, nx))
+
+
+def _region_parser(engine):
+    if engine == "pyparsing":
+        return RegionParser()
+    elif engine == "fast":
+        from .ds9_fast_parser import FastRegionParser
+        return FastRegionParser()
+    raise ValueError("unknown engine '{0}': should be one of "
+                     "'pyparsing' or 'fast'".format(engine))
+
+
+def parse(region_string, engine="pyparsing"):
     """Parse DS9 region string into a ShapeList.
 
     Parameters
     ----------
     region_string : str
         Region string
+    engine : {"pyparsing", "fast"}
+        The parser of the lines: the pyparsing grammar, or the much faster
+        tokenizer of `pyregion.ds9_fast_parser`, which gives the same
+        shapes and hands the lines it does not understand to the grammar.
 
     Returns
     -------
     shapes : `ShapeList`
         List of `~pyregion.Shape`
     """
-    rp = RegionParser()
+    rp = _region_parser(engine)
     ss = rp.parse(region_string)
     sss1 = rp.convert_attr(ss)
     sss2 = _check_wcs(sss1)
@@ -242,13 +808,15 @@ def parse(region_string):
     return ShapeList(shape_list, comment_list=comment_list)
 
 
-def open(fname):
+def open(fname, engine="pyparsing"):
     """Open, read and parse DS9 region file.
 
     Parameters
     ----------
     fname : str
         Filename
+    engine : {"pyparsing", "fast"}
+        The parser of the lines, see `parse`
 
     Returns
     -------
@@ -257,7 +825,63 @@ def open(fname):
     """
     with _builtin_open(fname) as fh:
         region_string = fh.read()
-    return parse(region_string)
+    return parse(region_string, engine=engine)
+
+
+def iter_parse(lines, engine="pyparsing"):
+    """Parse the lines of a DS9 region file one at a time.
+
+    Unlike `parse`, the shapes are yielded as soon as their line is
+    parsed, with their attributes, including the global ones, and their
+    coordinate format resolved as in a `ShapeList`, so that arbitrarily
+    large region files are parsed in constant memory.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The lines, with or without their trailing newline, e.g. an open
+        file
+    engine : {"pyparsing", "fast"}
+        The parser of the lines, see `parse`
+
+    Yields
+    ------
+    shape : `~pyregion.Shape`
+        The shapes of the lines, in order
+    """
+    from .parser_helper import Shape
+
+    rp = _region_parser(engine)
+    ss = rp.parse_lines(lines)
+    sss1 = rp.convert_attr(ss)
+    sss2 = _check_wcs(sss1)
+
+    for shape, comment in sss2:
+        if isinstance(shape, Shape):
+            yield shape
+
+
+def iter_open(fname, engine="pyparsing"):
+    """Open a DS9 region file and parse its lines one at a time.
+
+    The file is read as the shapes are consumed, see `iter_parse`, and
+    closed once they are all yielded.
+
+    Parameters
+    ----------
+    fname : str
+        Filename
+    engine : {"pyparsing", "fast"}
+        The parser of the lines, see `parse`
+
+    Yields
+    ------
+    shape : `~pyregion.Shape`
+        The shapes of the file, in order
+    """
+    with _builtin_open(fname) as fh:
+        for shape in iter_parse(fh, engine=engine):
+            yield shape
 
 
 def read_region(s):
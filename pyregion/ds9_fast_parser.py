@@ -0,0 +1,447 @@
+"""
+A fast parser of DS9 region files.
+
+The lines of the region file, and the attributes in their comments, are
+tokenized with regular expressions instead of the pyparsing grammar of
+`~pyregion.ds9_region_parser.RegionParser`, which stays the reference:
+the lines which are not understood here (shapes given without
+parentheses, spaces within numbers, escapes in quoted strings, ...) are
+given to the pyparsing grammar, so that both parsers always give the
+same shapes, and the same warnings.
+"""
+import re
+
+from .ds9_attr_parser import Ds9AttrParser, ds9_shape_in_comment_defs
+from .ds9_region_parser import RegionParser, ds9_shape_defs
+from .parser_helper import Shape, CoordCommand, Global
+from .region_numbers import (CoordOdd, CoordEven, Distance, Angle, Integer,
+                             SimpleNumber, SimpleInteger, HMS, DMS,
+                             AngularDistance)
+
+# the whitespace skipped by pyparsing
+_WHITE = " \t\r\n"
+
+# the characters of keywords, as for pyparsing.Keyword
+_IDENT = re.compile(r"[A-Za-z0-9_$]+")
+
+# an unsigned number, as region_numbers.usn
+_USN = r"[0-9]+(?:\.[0-9]*)?(?:[eE][+-]?[0-9]+)?"
+
+_HMS = re.compile(r"([+-]?)(%s)h(?:(%s)m(?:(%s)s)?)?" % (_USN, _USN, _USN))
+_DMS = re.compile(r"([+-]?)(%s)d(?:(%s)m(?:(%s)s)?)?" % (_USN, _USN, _USN))
+_SEXADECIMAL = re.compile(r"([+-]?)(%s):(%s)(?::(%s))?" % (_USN, _USN, _USN))
+_ANGULAR = re.compile(r"(%s)('(?:(%s)\")?|\"|d|r)" % (_USN, _USN))
+_INTEGER = re.compile(r"\+?[0-9]+")
+
+
+def _sixty(regex, units, text):
+    # the tokens of a number in hms or dms format
+    m = regex.match(text)
+    kl = [m.group(1)]
+    for value, unit in zip(m.groups()[1:], units):
+        if value is None:
+            break
+        kl += [value, unit]
+    return kl
+
+
+def _sexadecimal(text):
+    m = _SEXADECIMAL.match(text)
+    kl = [m.group(1), m.group(2), ":", m.group(3)]
+    if m.group(4) is not None:
+        kl += [":", m.group(4)]
+    return kl
+
+
+def _angular_distance(text):
+    m = _ANGULAR.match(text)
+    kl = [m.group(1), m.group(2)[0]]
+    if m.group(3) is not None:
+        kl += [m.group(3), '"']
+    return AngularDistance(kl)
+
+
+_makers = dict(
+    hms=lambda text: HMS(_sixty(_HMS, "hms", text)),
+    dms=lambda text: DMS(_sixty(_DMS, "dms", text)),
+    sexadecimal24=lambda text: HMS(_sexadecimal(text)),
+    sexadecimal60=lambda text: DMS(_sexadecimal(text)),
+    angular=_angular_distance,
+    simple=SimpleNumber,
+    integer=SimpleInteger,
+)
+
+_patterns = dict(
+    hms=_HMS.pattern,
+    dms=_DMS.pattern,
+    sexadecimal24=_SEXADECIMAL.pattern,
+    sexadecimal60=_SEXADECIMAL.pattern,
+    angular=_ANGULAR.pattern,
+    simple=r"[+-]?%s" % _USN,
+    integer=_INTEGER.pattern,
+)
+
+
+def _alternatives(*names):
+    # the alternatives are tried in order, as the MatchFirst of
+    # region_numbers: the first one matching the beginning of an argument
+    # has to match all of it
+    return re.compile("|".join("(?P<%s>%s)" % (name, _patterns[name])
+                               for name in names))
+
+
+_arg_regexes = {
+    CoordOdd: _alternatives("hms", "sexadecimal24", "simple"),
+    CoordEven: _alternatives("dms", "sexadecimal60", "simple"),
+    Distance: _alternatives("angular", "simple"),
+    Angle: _alternatives("simple"),
+    Integer: _alternatives("integer"),
+}
+
+
+def _parse_arg_list(arg_types, texts):
+    # the parameters of the arguments, or None
+    params = []
+    for arg_type, text in zip(arg_types, texts):
+        m = _arg_regexes[arg_type].match(text)
+        if not m or m.end() != len(text):
+            return None
+        params.append(_makers[m.lastgroup](text))
+    return params
+
+
+# the types of the arguments of the shapes, by shape and number of
+# arguments, when all of them are parsed
+_arg_types_cache = {}
+
+
+def _arg_types(shape_def, n):
+    key = shape_def, n
+    if key not in _arg_types_cache:
+        args_list = shape_def.args_list
+        types = args_list if len(args_list) == n else None
+        if shape_def.args_repeat is not None:
+            n1, n2 = shape_def.args_repeat
+            block, tail = args_list[n1:n2], args_list[n2:]
+            k = (n - n1) // len(block)
+            types = None
+            if k >= 1 and n1 + k * len(block) + len(tail) == n:
+                types = args_list[:n1] + block * k + tail
+        _arg_types_cache[key] = types
+    return _arg_types_cache[key]
+
+
+def _parse_simple_args(shape_def, texts):
+    # the parameters of a shape whose arguments are all simple numbers
+    types = _arg_types(shape_def, len(texts))
+    if types is None:
+        return None
+    params = []
+    for t, s in zip(types, texts):
+        if t is not Integer:
+            params.append(SimpleNumber(s))
+        elif _INTEGER.fullmatch(s):
+            params.append(SimpleInteger(s))
+        else:
+            return None
+    return params
+
+
+def _parse_args(shape_def, texts):
+    # the parameters of a shape, following the repetition of its
+    # arguments as the pyparsing grammar does, or None
+    args_list = shape_def.args_list
+    if shape_def.args_repeat is None:
+        if len(args_list) != len(texts):
+            return None
+        return _parse_arg_list(args_list, texts)
+
+    n1, n2 = shape_def.args_repeat
+    block, tail = args_list[n1:n2], args_list[n2:]
+    if len(texts) < n2 + len(tail):
+        return None
+    params = _parse_arg_list(args_list[:n2], texts)
+    if params is None:
+        return None
+
+    # as many more blocks as can be parsed, then the tail
+    i = n2
+    while i + len(block) <= len(texts):
+        block_params = _parse_arg_list(block, texts[i:i + len(block)])
+        if block_params is None:
+            break
+        params.extend(block_params)
+        i += len(block)
+    if len(texts) - i != len(tail):
+        return None
+    tail_params = _parse_arg_list(tail, texts[i:])
+    if tail_params is None:
+        return None
+    return params + tail_params
+
+
+# a shape with its arguments in parentheses
+_SHAPE = re.compile(r"([A-Za-z0-9_$]+)[ \t\r\n]*\(([^)]*)\)")
+
+# arguments which are all simple numbers, the most common case
+_SIMPLE_ARGS = re.compile(r"[ \t\r\n]*[+-]?{0}[ \t\r\n]*"
+                          r"(?:,[ \t\r\n]*[+-]?{0}[ \t\r\n]*)*".format(_USN))
+
+# an argument with whitespace inside
+_SPLIT_ARG = re.compile(r"[^ \t\r\n,][ \t\r\n]+[^ \t\r\n,]")
+
+
+def _parse_shape(line, pos, shape_defs):
+    # (shape, position after it) of the shape at pos, or None
+    m = _SHAPE.match(line, pos)
+    if not m:
+        return None
+    name = m.group(1).lower()
+    if name not in shape_defs or _SPLIT_ARG.search(m.group(2)):
+        return None
+
+    texts = [s.strip(_WHITE) for s in m.group(2).split(",")]
+    if "" in texts:
+        return None
+
+    if _SIMPLE_ARGS.fullmatch(m.group(2)):
+        params = _parse_simple_args(shape_defs[name], texts)
+    else:
+        params = _parse_args(shape_defs[name], texts)
+    if params is None:
+        return None
+    return Shape(name, params), m.end()
+
+
+_coord_command_keys = ['PHYSICAL', 'IMAGE', 'FK4', 'B1950', 'FK5',
+                       'J2000', 'GALACTIC', 'ECLIPTIC', 'ICRS',
+                       'LINEAR', 'AMPLIFIER', 'DETECTOR']
+
+_WCS_COMMAND = re.compile(r"[Ww][Cc][Ss][A-Za-z]*")
+
+_SKIP_WHITE = re.compile(r"[ \t\r\n]*")
+
+
+def _parse_atom(line, pos):
+    # (atom, position after it) of the atom at pos, or None
+    if line[pos] == "-":
+        r = _parse_shape(line, _SKIP_WHITE.match(line, pos + 1).end(),
+                         ds9_shape_defs)
+        if r is not None:
+            r[0].set_exclude()
+        return r
+
+    m = _IDENT.match(line, pos)
+    if not m:
+        return None
+    word = m.group()
+
+    if word.lower() in ds9_shape_defs:
+        return _parse_shape(line, pos, ds9_shape_defs)
+    if word.upper() in _coord_command_keys:
+        return CoordCommand(word.upper()), m.end()
+    if word.lower() == "global":
+        if not line[m.end():].strip(_WHITE):
+            return None
+        return Global(line[m.end():]), len(line)
+
+    m = _WCS_COMMAND.match(line, pos)
+    if m and m.end() == pos + len(word):
+        return CoordCommand("WCS" + m.group()[3:]), m.end()
+    return None
+
+
+# what may follow an atom: a separator, a comment, a continuation or the
+# end of the line
+_AFTER_ATOM = re.compile(r"[ \t\r\n]*(?:(?P<separator>;)|(?P<comment>#)"
+                         r"|(?P<continued>\|\|)|\Z)")
+
+
+def _parse_line(line):
+    # (atoms, comment, continued) of a line, as RegionParser.parseLine,
+    # or None; as pyparsing does, the tabs are expanded first
+    line = line.expandtabs()
+    atoms = []
+
+    pos = _SKIP_WHITE.match(line).end()
+    while pos < len(line) and line[pos] != "#":
+        r = _parse_atom(line, pos)
+        if r is None:
+            return None
+        atom, pos = r
+        atoms.append(atom)
+
+        m = _AFTER_ATOM.match(line, pos)
+        if not m:
+            return None
+        if m.lastgroup == "separator":
+            pos = _SKIP_WHITE.match(line, m.end()).end()
+        elif m.lastgroup == "continued":
+            # a composite shape continued on the next line
+            if len(atoms) > 1 or _IDENT.match(line, m.start("continued") - 1):
+                return None
+            comment = _parse_continuation(line, m.end())
+            if comment is False:
+                return None
+            return atoms, comment, True
+        else:
+            pos = m.end() - 1 if m.lastgroup == "comment" else len(line)
+            break
+
+    comment = None
+    if pos < len(line):
+        comment = line[pos + 1:].strip()
+    return atoms, comment, None
+
+
+def _parse_continuation(line, pos):
+    # the comment after "||", None if there is none, or False if the
+    # line does not end there
+    pos = _SKIP_WHITE.match(line, pos).end()
+    if pos == len(line):
+        return None
+    if line[pos] != "#":
+        return False
+    return line[pos + 1:].strip()
+
+
+_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_DIGITS = "0123456789"
+
+# the alternatives for the values of attributes, as in get_ds9_attr_parser,
+# with the characters they start with
+_attr_values = [
+    (_LETTERS + _DIGITS, re.compile(r"[A-Za-z0-9]+")),
+    ("#", re.compile(r"#[A-Za-z0-9]+")),
+    (_LETTERS, re.compile(r"[A-Za-z]+[ \t\r\n]+[0-9]+")),
+    ('"', re.compile(r'"(?:[^"\n\r\\]|(?:"")|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*')),
+    ("'", re.compile(r"'(?:[^'\n\r\\]|(?:'')|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*")),
+    ("{", re.compile(r"\{([^}\n\r]*)\}")),
+    ("(", re.compile(r"[ \t\r\n]*\(([^)\n\r]*)\)")),
+    (_DIGITS, re.compile(r"[0-9 ]+")),
+    (_DIGITS + ".", re.compile(r"[0-9.]+")),
+]
+
+# the alternatives by the character they start with
+_attr_values_by_start = {
+    c: [regex for starts, regex in _attr_values if c in starts]
+    for c in "".join(starts for starts, regex in _attr_values)}
+
+_quoted_strings = (_attr_values[3][1], _attr_values[4][1])
+_paren_value = _attr_values[6][1]
+
+# the name of an attribute, and the "=" before its value
+_ATTR_NAME = re.compile(r"[ \t\r\n]*([A-Za-z]+)[ \t\r\n]*(=[ \t\r\n]*)?")
+
+
+def _parse_attr_value(s, pos):
+    # (tokens, end) of the longest value at pos, or None; as for the Or
+    # of pyparsing, the first of the longest alternatives is chosen
+    best = None
+    for regex in _attr_values_by_start.get(s[pos:pos + 1], ()):
+        m = regex.match(s, pos)
+        if not m:
+            continue
+        if regex in _quoted_strings:
+            # the closing quote is matched after the body, without
+            # backtracking, as pyparsing.quotedString does
+            if not s.startswith(s[pos], m.end()):
+                continue
+            tokens, end = [s[pos:m.end() + 1]], m.end() + 1
+        elif regex is _paren_value:
+            tokens = []
+            while m:
+                tokens.append(m.group(1))
+                end = m.end()
+                m = regex.match(s, end)
+        else:
+            tokens, end = [m.group(m.lastindex or 0)], m.end()
+        if best is None or end > best[1]:
+            best = tokens, end
+    return best
+
+
+def _parse_attrs(s, pos=0):
+    # the (keyword, value, ...) tuples of the attributes at pos
+    attrs = []
+    while True:
+        m = _ATTR_NAME.match(s, pos)
+        if not m:
+            return attrs
+        if not m.group(2):
+            attrs.append((m.group(1),))
+            pos = m.end()
+            continue
+
+        r = _parse_attr_value(s, m.end())
+        if r is None:
+            attrs.append((m.group(1),))
+            return attrs
+        tokens, pos = r
+        attrs.append(tuple([m.group(1)] + tokens))
+
+
+class FastDs9AttrParser(Ds9AttrParser):
+    """
+    A `~pyregion.ds9_attr_parser.Ds9AttrParser` tokenizing the attributes
+    with regular expressions, and falling back to the pyparsing grammar
+    for the shapes in comments it does not understand.
+    """
+
+    def parse_default(self, s):
+        if "\\" in s:
+            # escapes are converted by the quoted strings of pyparsing
+            return Ds9AttrParser.parse_default(self, s)
+        return _parse_attrs(s.expandtabs())
+
+    def parse_check_shape(self, s):
+        if "\\" in s:
+            return Ds9AttrParser.parse_check_shape(self, s)
+
+        s = s.expandtabs()
+        pos = _SKIP_WHITE.match(s).end()
+        m = _IDENT.match(s, pos)
+        if not m or m.group().lower() not in ds9_shape_in_comment_defs:
+            return None, _parse_attrs(s)
+
+        i = _SKIP_WHITE.match(s, m.end()).end()
+        if not s.startswith("(", i):
+            if i < len(s) and s[i] in "+-0123456789":
+                # a shape with its arguments separated by spaces
+                return Ds9AttrParser.parse_check_shape(self, s)
+            return None, _parse_attrs(s)
+
+        r = _parse_shape(s, pos, ds9_shape_in_comment_defs)
+        if r is None:
+            return Ds9AttrParser.parse_check_shape(self, s)
+        shape, pos = r
+
+        pos = _SKIP_WHITE.match(s, pos).end()
+        if s.startswith("||", pos):
+            if _IDENT.match(s, pos + 2):
+                return Ds9AttrParser.parse_check_shape(self, s)
+            self.continued = True
+            pos += 2
+
+        if self.continued:
+            shape.continued = True
+        return shape, _parse_attrs(s, pos)
+
+
+class FastRegionParser(RegionParser):
+    """
+    A `~pyregion.ds9_region_parser.RegionParser` tokenizing the lines with
+    regular expressions, which is much faster than the pyparsing grammar.
+
+    The lines which are not understood, and their attributes, are given
+    to the pyparsing grammar, so that the shapes are the same with both
+    parsers.
+    """
+
+    attr_parser_class = FastDs9AttrParser
+
+    def parseLine(self, l):
+        r = _parse_line(l)
+        if r is None:
+            return RegionParser.parseLine(self, l)
+        return r
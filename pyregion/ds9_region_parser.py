@@ -10,8 +10,8 @@ from .parser_helper import (wcs_shape, define_shape_helper, Shape, Global,
                             CoordCommand,
                             comment_shell_like, define_simple_literals)
 from .ds9_attr_parser import Ds9AttrParser, get_attr
-from .wcs_converter import (convert_to_imagecoord,
-                            convert_physical_to_imagecoord)
+from .wcs_converter import (convert_list_to_imagecoord,
+                            convert_physical_list_to_imagecoord)
 
 ds9_shape_defs = dict(
     circle=wcs_shape(CoordOdd, CoordEven, Distance),
@@ -45,6 +45,9 @@ image_like_coordformats = ["image", "physical", "detector", "logical"]
 
 class RegionParser(RegionPusher):
 
+    # the parser of the attributes in the comments
+    attr_parser_class = Ds9AttrParser
+
     def __init__(self):
 
         RegionPusher.__init__(self)
@@ -99,8 +102,25 @@ class RegionParser(RegionPusher):
         return s, c, continued
 
     def parse(self, s):
+        return self.parse_lines(s.split("\n"))
+
+    def parse_lines(self, lines):
+        """Parse the lines of a region file, one at a time.
+
+        Parameters
+        ----------
+        lines : iterable of str
+            The lines, with or without their trailing newline, e.g. an
+            open file
 
-        for l in s.split("\n"):
+        Yields
+        ------
+        shape, comment : `~pyregion.Shape` or Property, str
+            The shapes and properties of the lines, with their comments
+        """
+
+        for l in lines:
+            l = l.rstrip("\n")
             try:
                 s, c, continued = self.parseLine(l)
             except ParseException:
@@ -127,7 +147,7 @@ class RegionParser(RegionPusher):
     def convert_attr(self, l):
         global_attr = [], {}
 
-        parser = Ds9AttrParser()
+        parser = self.attr_parser_class()
 
         for l1, c1 in l:
             if isinstance(l1, Global):
@@ -159,7 +179,7 @@ class RegionParser(RegionPusher):
                 yield l1, c1
 
     @staticmethod
-    def sky_to_image(shape_list, header):
+    def sky_to_image(shape_list, header, local=False):
         """Converts a `ShapeList` into shapes with coordinates in image coordinates
 
         Parameters
@@ -168,6 +188,11 @@ class RegionParser(RegionPusher):
             The ShapeList to convert
         header : `~astropy.io.fits.Header`
             Specifies what WCS transformations to use.
+        local : bool
+            Whether to convert the angles and distances of the shapes
+            with the rotation of the north axis and the pixel scales of
+            the WCS at their center, see
+            `pyregion.wcs_converter.convert_list_to_imagecoord`
 
         Yields
         -------
@@ -180,11 +205,31 @@ class RegionParser(RegionPusher):
 
         """
 
+        shape_list = list(shape_list)
+
+        # the shapes in sky coordinates are converted at once
+        sky_shapes = [shape for shape, comment in shape_list
+                      if isinstance(shape, Shape) and
+                      shape.coord_format not in image_like_coordformats]
+        sky_coords = iter(convert_list_to_imagecoord(sky_shapes, header,
+                                                     local=local)
+                          if sky_shapes else [])
+
+        # and so are those in physical coordinates
+        physical_shapes = [shape for shape, comment in shape_list
+                           if isinstance(shape, Shape) and
+                           shape.coord_format == "physical"]
+        if physical_shapes and header is None:
+            raise RuntimeError("Physical coordinate is not known.")
+        physical_coords = iter(
+            convert_physical_list_to_imagecoord(physical_shapes, header)
+            if physical_shapes else [])
+
         for shape, comment in shape_list:
             if isinstance(shape, Shape) and \
                     (shape.coord_format not in image_like_coordformats):
 
-                new_coords = convert_to_imagecoord(shape, header)
+                new_coords = next(sky_coords)
 
                 l1n = copy.copy(shape)
 
@@ -194,10 +239,7 @@ class RegionParser(RegionPusher):
 
             elif isinstance(shape, Shape) and shape.coord_format == "physical":
 
-                if header is None:
-                    raise RuntimeError("Physical coordinate is not known.")
-
-                new_coordlist = convert_physical_to_imagecoord(shape, header)
+                new_coordlist = next(physical_coords)
 
                 l1n = copy.copy(shape)
 
@@ -0,0 +1,104 @@
+"""
+Helpers for the bit-packed masks made by `pyregion.ShapeList.get_mask_packed`
+(or the ``mask_packed`` method of the region filters).
+
+A packed mask of an image of shape ``(ny, nx)`` is a uint8 array of
+shape ``(ny, (nx + 7) // 8)``, in the layout of ``numpy.packbits(mask,
+axis=1)``: the pixel ``x`` of a row is the bit ``7 - x % 8`` of its byte
+``x // 8``, and the bits past ``nx`` are 0. Masks of the same image are
+combined without unpacking them.
+"""
+
+import numpy as np
+
+# the number of bits set in each byte
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None],
+                          axis=1).sum(axis=1).astype(np.uint8)
+
+
+def pack_mask(mask):
+    """Pack a boolean mask.
+
+    Parameters
+    ----------
+    mask : `numpy.array`
+        Boolean mask
+
+    Returns
+    -------
+    packed_mask : `numpy.array`
+        Packed mask
+    """
+    return np.packbits(mask, axis=-1)
+
+
+def unpack_mask(packed_mask, nx):
+    """Unpack a packed mask.
+
+    Parameters
+    ----------
+    packed_mask : `numpy.array`
+        Packed mask
+    nx : int
+        Width of the image
+
+    Returns
+    -------
+    mask : `numpy.array`
+        Boolean mask
+    """
+    return np.unpackbits(packed_mask, axis=-1, count=nx).view(bool)
+
+
+def mask_and(*packed_masks):
+    """Pixels inside all the packed masks (of the same image)."""
+    return _reduce(np.bitwise_and, packed_masks)
+
+
+def mask_or(*packed_masks):
+    """Pixels inside any of the packed masks (of the same image)."""
+    return _reduce(np.bitwise_or, packed_masks)
+
+
+def mask_xor(*packed_masks):
+    """Pixels inside an odd number of the packed masks (of the same image)."""
+    return _reduce(np.bitwise_xor, packed_masks)
+
+
+def mask_not(packed_mask, nx):
+    """Pixels outside a packed mask.
+
+    Parameters
+    ----------
+    packed_mask : `numpy.array`
+        Packed mask
+    nx : int
+        Width of the image, so that the bits past it stay 0
+
+    Returns
+    -------
+    packed_mask : `numpy.array`
+        Packed mask
+    """
+    result = np.invert(packed_mask)
+    if nx % 8:
+        result[..., -1] &= np.uint8((0xFF << (8 - nx % 8)) & 0xFF)
+    return result
+
+
+def mask_count(packed_mask):
+    """Number of pixels inside a packed mask."""
+    count = 0
+    # a bounded number of rows at a time
+    for row in range(0, len(packed_mask), 1024):
+        count += int(_POPCOUNT[packed_mask[row:row + 1024]].sum(dtype=np.int64))
+    return count
+
+
+def _reduce(op, packed_masks):
+    if not packed_masks:
+        raise ValueError("at least one packed mask is needed")
+    result = np.array(packed_masks[0], dtype=np.uint8)
+    for packed_mask in packed_masks[1:]:
+        op(result, packed_mask, out=result)
+    return result
@@ -1,4 +1,16 @@
 class PhysicalCoordinate(object):
+    """Physical coordinates of an image, as defined by its header.
+
+    The header is read once, and the coordinates and distances given to
+    the conversion methods may be floats or NumPy arrays, so that a
+    single instance converts all the shapes of a list at once.
+
+    Parameters
+    ----------
+    header : `~astropy.io.fits.Header`
+        FITS header
+    """
+
     def __init__(self, header):
         phys_coord = ""
 
@@ -36,6 +48,7 @@ class PhysicalCoordinate(object):
             self.cdelt = 1
 
     def to_physical(self, imx, imy):
+        """Physical coordinates of image coordinates (floats or arrays)"""
 
         if self._physical_coord_not_defined:
             return imx, imy
@@ -49,6 +62,7 @@ class PhysicalCoordinate(object):
         return phyx, phyy
 
     def to_image(self, phyx, phyy):
+        """Image coordinates of physical coordinates (floats or arrays)"""
 
         if self._physical_coord_not_defined:
             return phyx, phyy
@@ -62,6 +76,7 @@ class PhysicalCoordinate(object):
         return imx, imy
 
     def to_physical_distance(self, im_distance):
+        """Physical distance of an image distance (float or array)"""
 
         if self._physical_coord_not_defined:
             return im_distance
@@ -69,6 +84,7 @@ class PhysicalCoordinate(object):
         return im_distance * self.cdelt
 
     def to_image_distance(self, im_physical):
+        """Image distance of a physical distance (float or array)"""
 
         if self._physical_coord_not_defined:
             return im_physical
@@ -1,117 +1,306 @@
 import numpy as np
-import pyregion._region_filter as region_filter
+import pyregion._region_filter_numpy
 import warnings
 
+try:
+    import pyregion._region_filter
+except ImportError:
+    _backends = {}
+else:
+    _backends = {"cython": pyregion._region_filter}
 
-def as_region_filter(shape_list, origin=1):
+_backends["numpy"] = pyregion._region_filter_numpy
+
+
+def get_backend(backend=None):
+    """
+    Return the module implementing the region filters: "cython" for the
+    compiled extension, or "numpy" for the pure NumPy implementation.
+    By default, the compiled extension is used if it is available.
+    """
+    if backend is None:
+        backend = "cython" if "cython" in _backends else "numpy"
+
+    if backend not in _backends:
+        if backend == "cython":
+            raise ImportError("the compiled extension pyregion._region_filter "
+                              "is not available")
+        raise ValueError("unknown backend '{0}': should be one of "
+                         "'cython' or 'numpy'".format(backend))
+
+    return _backends[backend]
+
+
+def as_region_filter(shape_list, origin=1, backend=None):
     """
     Often, the regions files implicitly assume the lower-left corner
     of the image as a coordinate (1,1). However, the python convetion
     is that the array index starts from 0. By default (origin = 1),
     coordinates of the returned mpl artists have coordinate shifted by
     (1, 1). If you do not want this shift, use origin=0.
+
+    The filter is made with the given backend (see `get_backend`).
     """
+    region_filter = get_backend(backend)
 
+    # An excluded shape is excluded from all the shapes before it, but
+    # not from those after it. Consecutive excluded shapes are collected
+    # in exclude_list and excluded at once, so that the filter only
+    # nests where included and excluded shapes alternate.
     filter_list = []
+    exclude_list = []
     for shape in shape_list:
-
-        if shape.name == "composite":
+        f = _shape_filter(region_filter, shape, origin)
+        if f is None:
             continue
 
-        if shape.name == "polygon":
-            xy = np.array(shape.coord_list) - origin
-            f = region_filter.Polygon(xy[::2], xy[1::2])
+        if shape.exclude:
+            exclude_list.append(f)
+        else:
+            if exclude_list:
+                filter_list = [_exclude(region_filter, filter_list, exclude_list)]
+                exclude_list = []
+            filter_list.append(f)
+
+    if exclude_list:
+        filter_list = [_exclude(region_filter, filter_list, exclude_list)]
 
-        elif shape.name == "rotbox" or shape.name == "box":
-            xc, yc, w, h, rot = shape.coord_list
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
+    return region_filter.RegionOrList(*filter_list)
 
-            f = region_filter.Rotated(region_filter.Box(xc, yc, w, h),
-                                      rot, xc, yc)
 
-        elif shape.name == "ellipse":
-            xc, yc = shape.coord_list[:2]
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
-            angle = shape.coord_list[-1]
+def as_region_filter_list(shape_list, origin=1, backend=None):
+    """
+    Return a list of (index, filter) for the included shapes of
+    shape_list, where index is the index of the shape in shape_list, and
+    filter the shape without the excluded shapes which follow it (so
+    that the union of the filters is `as_region_filter`).
 
-            maj_list, min_list = shape.coord_list[2:-1:2], shape.coord_list[3:-1:2]
+    The filters are made with the given backend (see `get_backend`).
+    """
+    region_filter = get_backend(backend)
 
-            if len(maj_list) > 1:
-                w1, h1 = max(maj_list), max(min_list)
-                w2, h2 = min(maj_list), min(min_list)
+    filters = [(i, _shape_filter(region_filter, shape, origin))
+               for i, shape in enumerate(shape_list)]
 
-                f1 = region_filter.Ellipse(xc, yc, w1, h1) \
-                     & ~region_filter.Ellipse(xc, yc, w2, h2)
-                f = region_filter.Rotated(f1, angle, xc, yc)
+    # from the end, to share the excluded shapes between the filters
+    filter_list = []
+    excluded = None
+    exclude_list = []
+    for i, f in reversed(filters):
+        if f is None:
+            continue
+        if shape_list[i].exclude:
+            exclude_list.append(f)
+            continue
+        if exclude_list:
+            if excluded is not None:
+                exclude_list.append(excluded)
+            if len(exclude_list) == 1:
+                excluded = exclude_list[0]
             else:
-                w, h = maj_list[0], min_list[0]
-                f = region_filter.Rotated(region_filter.Ellipse(xc, yc, w, h),
-                                          angle, xc, yc)
+                excluded = region_filter.RegionOrList(*exclude_list[::-1])
+            exclude_list = []
+        if excluded is not None:
+            f = f & ~excluded
+        filter_list.append((i, f))
+
+    return filter_list[::-1]
 
-        elif shape.name == "annulus":
-            xc, yc = shape.coord_list[:2]
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
-            r_list = shape.coord_list[2:]
 
-            r1 = max(r_list)
-            r2 = min(r_list)
+def _shape_filter(region_filter, shape, origin):
+    # the filter of a shape, or None if it has none
+    if shape.name == "composite":
+        return None
 
-            f = region_filter.Circle(xc, yc, r1) & ~region_filter.Circle(xc, yc, r2)
+    if shape.name == "polygon":
+        xy = np.array(shape.coord_list) - origin
+        f = region_filter.Polygon(xy[::2], xy[1::2])
 
-        elif shape.name == "circle":
-            xc, yc, r = shape.coord_list
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
+    elif shape.name == "rotbox" or shape.name == "box":
+        xc, yc, w, h, rot = shape.coord_list
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
 
-            f = region_filter.Circle(xc, yc, r)
+        f = region_filter.Rotated(region_filter.Box(xc, yc, w, h),
+                                  rot, xc, yc)
 
-        elif shape.name == "panda":
-            xc, yc, a1, a2, an, r1, r2, rn = shape.coord_list
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
+    elif shape.name == "ellipse":
+        xc, yc = shape.coord_list[:2]
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
+        angle = shape.coord_list[-1]
 
-            f1 = region_filter.Circle(xc, yc, r2) & ~region_filter.Circle(xc, yc, r1)
-            f = f1 & region_filter.AngleRange(xc, yc, a1, a2)
+        maj_list, min_list = shape.coord_list[2:-1:2], shape.coord_list[3:-1:2]
 
-        elif shape.name == "pie":
-            xc, yc, r1, r2, a1, a2 = shape.coord_list
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
+        if len(maj_list) > 1:
+            w1, h1 = max(maj_list), max(min_list)
+            w2, h2 = min(maj_list), min(min_list)
 
-            f1 = region_filter.Circle(xc, yc, r2) & ~region_filter.Circle(xc, yc, r1)
-            f = f1 & region_filter.AngleRange(xc, yc, a1, a2)
+            f1 = region_filter.Ellipse(xc, yc, w1, h1) \
+                 & ~region_filter.Ellipse(xc, yc, w2, h2)
+            f = region_filter.Rotated(f1, angle, xc, yc)
+        else:
+            w, h = maj_list[0], min_list[0]
+            f = region_filter.Rotated(region_filter.Ellipse(xc, yc, w, h),
+                                      angle, xc, yc)
 
-        elif shape.name == "epanda":
-            xc, yc, a1, a2, an, r11, r12, r21, r22, rn, angle = shape.coord_list
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
+    elif shape.name == "annulus":
+        xc, yc = shape.coord_list[:2]
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
+        r_list = shape.coord_list[2:]
 
-            f1 = region_filter.Ellipse(xc, yc, r21, r22) & ~region_filter.Ellipse(xc, yc, r11, r12)
-            f2 = f1 & region_filter.AngleRange(xc, yc, a1, a2)
-            f = region_filter.Rotated(f2, angle, xc, yc)
-            # f = f2 & region_filter.AngleRange(xc, yc, a1, a2)
+        r1 = max(r_list)
+        r2 = min(r_list)
 
-        elif shape.name == "bpanda":
-            xc, yc, a1, a2, an, r11, r12, r21, r22, rn, angle = shape.coord_list
-            # -1 for change origin to 0,0
-            xc, yc = xc - origin, yc - origin
+        f = region_filter.Circle(xc, yc, r1) & ~region_filter.Circle(xc, yc, r2)
 
-            f1 = region_filter.Box(xc, yc, r21, r22) & ~region_filter.Box(xc, yc, r11, r12)
-            f2 = f1 & region_filter.AngleRange(xc, yc, a1, a2)
-            f = region_filter.Rotated(f2, angle, xc, yc)
-            # f = f2 & region_filter.AngleRange(xc, yc, a1, a2)
+    elif shape.name == "circle":
+        xc, yc, r = shape.coord_list
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
 
-        else:
-            warnings.warn("'as_region_filter' does not know how to convert {0}"
-                          " to a region filter.".format(shape.name))
+        f = region_filter.Circle(xc, yc, r)
+
+    elif shape.name == "panda":
+        xc, yc, a1, a2, an, r1, r2, rn = shape.coord_list
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
+
+        f1 = region_filter.Circle(xc, yc, r2) & ~region_filter.Circle(xc, yc, r1)
+        f = f1 & region_filter.AngleRange(xc, yc, a1, a2)
+
+    elif shape.name == "pie":
+        xc, yc, r1, r2, a1, a2 = shape.coord_list
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
+
+        f1 = region_filter.Circle(xc, yc, r2) & ~region_filter.Circle(xc, yc, r1)
+        f = f1 & region_filter.AngleRange(xc, yc, a1, a2)
+
+    elif shape.name == "epanda":
+        xc, yc, a1, a2, an, r11, r12, r21, r22, rn, angle = shape.coord_list
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
+
+        f1 = region_filter.Ellipse(xc, yc, r21, r22) & ~region_filter.Ellipse(xc, yc, r11, r12)
+        f2 = f1 & region_filter.AngleRange(xc, yc, a1, a2)
+        f = region_filter.Rotated(f2, angle, xc, yc)
+        # f = f2 & region_filter.AngleRange(xc, yc, a1, a2)
+
+    elif shape.name == "bpanda":
+        xc, yc, a1, a2, an, r11, r12, r21, r22, rn, angle = shape.coord_list
+        # -1 for change origin to 0,0
+        xc, yc = xc - origin, yc - origin
+
+        f1 = region_filter.Box(xc, yc, r21, r22) & ~region_filter.Box(xc, yc, r11, r12)
+        f2 = f1 & region_filter.AngleRange(xc, yc, a1, a2)
+        f = region_filter.Rotated(f2, angle, xc, yc)
+        # f = f2 & region_filter.AngleRange(xc, yc, a1, a2)
+
+    else:
+        warnings.warn("'as_region_filter' does not know how to convert {0}"
+                      " to a region filter.".format(shape.name))
+        return None
+
+    return f
+
+
+def _exclude(region_filter, filter_list, exclude_list):
+    if len(exclude_list) == 1:
+        excluded = exclude_list[0]
+    else:
+        excluded = region_filter.RegionOrList(*exclude_list)
+
+    return region_filter.RegionOrList(*filter_list) & ~excluded
+
+
+# the points are indexed by chunks of this many points
+_POINTS_CHUNK_SIZE = 1 << 22
+
+# the grid of the index has about this many points per cell
+_POINTS_PER_CELL = 16
+
+
+def match_points(filter_list, x, y, n_threads=None):
+    """
+    Return the pairs (point, index) of the points inside the filters of
+    filter_list, a list of (index, filter) as returned by
+    `as_region_filter_list`: point is the index of the point in the
+    (flattened) arrays x and y, and index the index of the filter. The
+    pairs are sorted by point and index.
+
+    The points are bucketed on a grid, so that each filter only tests
+    the points of the cells which meet its bounding box.
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    if x.shape != y.shape:
+        raise ValueError("x and y should have the same size")
+
+    boxes = []
+    for i, f in filter_list:
+        x1, y1, x2, y2 = f.bbox()
+        if x1 <= x2 and y1 <= y2:
+            boxes.append((i, f, x1, y1, x2, y2))
+
+    points = []
+    indices = []
+    for start in range(0, len(x), _POINTS_CHUNK_SIZE):
+        stop = min(start + _POINTS_CHUNK_SIZE, len(x))
+        for point, i in _match_chunk(boxes, x[start:stop], y[start:stop],
+                                     n_threads):
+            points.append(point + start)
+            indices.append(np.full(len(point), i, dtype=np.intp))
+
+    if not points:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+    points = np.concatenate(points)
+    indices = np.concatenate(indices)
+    order = np.lexsort((indices, points))
+    return points[order], indices[order]
+
+
+def _match_chunk(boxes, x, y, n_threads):
+    # yield (point, index) for each filter with points of the chunk
+    # inside it; points which are not finite are inside no filter
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if not len(finite) or not boxes:
+        return
+
+    gx1, gx2 = x[finite].min(), x[finite].max()
+    gy1, gy2 = y[finite].min(), y[finite].max()
+    n = max(int(np.sqrt(len(finite) / _POINTS_PER_CELL)), 1)
+    sx = (gx2 - gx1) / n or 1.
+    sy = (gy2 - gy1) / n or 1.
+
+    def cell(v, v1, s):
+        return np.clip(np.floor((v - v1) / s), 0, n - 1).astype(np.intp)
+
+    # the points sorted by cell, a row of the grid after the other
+    cells = cell(y[finite], gy1, sy) * n + cell(x[finite], gx1, sx)
+    order = np.argsort(cells, kind="stable")
+    cells = cells[order]
+    sorted_points = finite[order]
+    offsets = np.searchsorted(cells, np.arange(n * n + 1))
+
+    for i, f, x1, y1, x2, y2 in boxes:
+        if x1 > gx2 or x2 < gx1 or y1 > gy2 or y2 < gy1:
             continue
+        cx1, cx2 = [int(c) for c in cell(np.array([x1, x2]), gx1, sx)]
+        cy1, cy2 = [int(c) for c in cell(np.array([y1, y2]), gy1, sy)]
 
-        if shape.exclude:
-            filter_list = [region_filter.RegionOrList(*filter_list) & ~f]
-        else:
-            filter_list.append(f)
+        rows = np.arange(cy1, cy2 + 1) * n
+        candidates = np.concatenate([sorted_points[a:b] for a, b in
+                                     zip(offsets[rows + cx1],
+                                         offsets[rows + cx2 + 1])])
+        xc, yc = x[candidates], y[candidates]
+        candidates = candidates[(xc >= x1) & (xc <= x2) &
+                                (yc >= y1) & (yc <= y2)]
+        if not len(candidates):
+            continue
 
-    return region_filter.RegionOrList(*filter_list)
+        inside = f.inside_x_y(x[candidates], y[candidates],
+                              n_threads=n_threads)
+        yield candidates[inside], i
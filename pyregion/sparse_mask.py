@@ -0,0 +1,199 @@
+"""
+Helpers for the run-length encoded masks made by
+`pyregion.ShapeList.get_mask_runs` (or the ``mask_runs`` method of the
+region filters).
+
+A mask is given as ``(rows, starts, stops)``, where the run ``k`` is the
+pixels ``starts[k] <= x < stops[k]`` of the row ``rows[k]``. The pixels
+are taken in the order of the runs, which is the order of a boolean
+mask, so that ``take_runs(data, runs)`` is ``data[..., mask]``. The
+helpers work a bounded number of pixels at a time, and only read or
+write the pixels of the runs, so that they can be used on memory-mapped
+arrays larger than the memory.
+"""
+
+import numpy as np
+
+# the helpers work on chunks of runs of about this many pixels
+_RUNS_CHUNK_SIZE = 1 << 20
+
+# the statistics known to reduce_runs
+REDUCE_OPS = ("sum", "count", "mean", "min", "max")
+
+
+def _pixels(runs):
+    # (y, x) of the pixels of the runs
+    rows, starts, stops = (np.asarray(a, dtype=np.intp) for a in runs)
+    lengths = stops - starts
+    y = np.repeat(rows, lengths)
+    # x counts up from the start of each run
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    x = np.repeat(starts, lengths) + (np.arange(len(y)) - offsets)
+    return y, x
+
+
+def _chunks(runs):
+    # the runs split into chunks of about _RUNS_CHUNK_SIZE pixels, with
+    # the indices of their first and last pixels
+    rows, starts, stops = (np.asarray(a, dtype=np.intp) for a in runs)
+    end = np.cumsum(stops - starts)
+
+    k1 = 0
+    while k1 < len(rows):
+        first = end[k1 - 1] if k1 > 0 else 0
+        k2 = max(k1 + 1, np.searchsorted(end, first + _RUNS_CHUNK_SIZE,
+                                         side="right"))
+        yield first, end[k2 - 1], (rows[k1:k2], starts[k1:k2], stops[k1:k2])
+        k1 = k2
+
+
+def runs_to_indices(runs, shape):
+    """Flat indices of the pixels of a run-length encoded mask.
+
+    Parameters
+    ----------
+    runs : tuple of `numpy.array`
+        ``(rows, starts, stops)`` of the runs
+    shape : tuple
+        Image shape
+
+    Returns
+    -------
+    indices : `numpy.array`
+        Indices of the pixels in the flattened image, in order
+    """
+    y, x = _pixels(runs)
+    return np.ravel_multi_index((y, x), shape)
+
+
+def runs_to_mask(runs, shape):
+    """Dense boolean mask of a run-length encoded mask.
+
+    Parameters
+    ----------
+    runs : tuple of `numpy.array`
+        ``(rows, starts, stops)`` of the runs
+    shape : tuple
+        Image shape
+
+    Returns
+    -------
+    mask : `numpy.array`
+        Boolean mask
+    """
+    mask = np.zeros(shape, dtype=bool)
+    put_runs(mask, runs, True)
+    return mask
+
+
+def take_runs(data, runs):
+    """Values of the pixels of a run-length encoded mask.
+
+    Parameters
+    ----------
+    data : `numpy.array`
+        Image, or array of images along its last two axes
+    runs : tuple of `numpy.array`
+        ``(rows, starts, stops)`` of the runs
+
+    Returns
+    -------
+    values : `numpy.array`
+        ``data[..., mask]``
+    """
+    n = int(np.sum(np.asarray(runs[2]) - np.asarray(runs[1])))
+    values = np.empty(data.shape[:-2] + (n,), dtype=data.dtype)
+    for i1, i2, chunk in _chunks(runs):
+        y, x = _pixels(chunk)
+        values[..., i1:i2] = data[..., y, x]
+    return values
+
+
+def put_runs(data, runs, values):
+    """Set the pixels of a run-length encoded mask.
+
+    Parameters
+    ----------
+    data : `numpy.array`
+        Image, or array of images along its last two axes
+    runs : tuple of `numpy.array`
+        ``(rows, starts, stops)`` of the runs
+    values : scalar or `numpy.array`
+        Values of the pixels, as in ``data[..., mask] = values``: a
+        scalar, or an array whose last axis has a value for each pixel
+    """
+    values = np.asarray(values)
+    for i1, i2, chunk in _chunks(runs):
+        y, x = _pixels(chunk)
+        data[..., y, x] = values if values.ndim == 0 else values[..., i1:i2]
+
+
+def reduce_runs(data, runs, ops=REDUCE_OPS):
+    """Statistics of the pixels of a run-length encoded mask.
+
+    The statistics are those of ``data[..., mask]``, computed a chunk
+    of pixels at a time. The sums are accumulated as float64, and NaN
+    values propagate as in numpy. Without pixels, the count and sum are
+    0, and the others NaN.
+
+    Parameters
+    ----------
+    data : `numpy.array`
+        Image, or array of images along its last two axes
+    runs : tuple of `numpy.array`
+        ``(rows, starts, stops)`` of the runs
+    ops : tuple of str
+        Statistics among "sum", "count", "mean", "min" and "max"
+
+    Returns
+    -------
+    statistics : dict
+        The value of each statistic, an array over the leading axes of
+        data if it has more than two
+    """
+    _check_ops(ops)
+
+    shape = data.shape[:-2]
+    total = np.zeros(shape)
+    count = 0
+    low = np.full(shape, np.inf)
+    high = np.full(shape, -np.inf)
+    for i1, i2, chunk in _chunks(runs):
+        y, x = _pixels(chunk)
+        values = data[..., y, x]
+        total += values.sum(axis=-1, dtype=float)
+        low = np.minimum(low, values.min(axis=-1))
+        high = np.maximum(high, values.max(axis=-1))
+        count += i2 - i1
+
+    return _statistics(ops, total, count, low, high)
+
+
+def _check_ops(ops):
+    unknown = [op for op in ops if op not in REDUCE_OPS]
+    if unknown:
+        raise ValueError("unknown statistics {0}: should be among {1}"
+                         .format(", ".join(map(str, unknown)),
+                                 ", ".join(REDUCE_OPS)))
+
+
+def _statistics(ops, total, count, low, high):
+    # the statistics ops given the sum, count, minimum and maximum
+    total, low, high = (np.asarray(a, dtype=float) for a in (total, low, high))
+    if count == 0:
+        low = np.full(low.shape, np.nan)
+        high = np.full(high.shape, np.nan)
+        mean = np.full(total.shape, np.nan)
+    else:
+        mean = total / count
+    values = {"sum": total, "mean": mean, "min": low, "max": high}
+
+    result = {}
+    for op in ops:
+        if op == "count":
+            result[op] = int(count)
+        elif values[op].ndim == 0:
+            result[op] = float(values[op])
+        else:
+            result[op] = values[op]
+    return result
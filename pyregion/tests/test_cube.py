@@ -1,8 +1,10 @@
 import os
 from os.path import join
 
+import numpy as np
 from astropy.io.fits import Header
-from numpy.testing import assert_allclose
+from astropy.wcs import WCS
+from numpy.testing import assert_allclose, assert_array_equal
 
 from pyregion import parse
 
@@ -21,3 +23,43 @@ def test_cube():
     r = parse(region_string).as_imagecoord(header)
 
     assert_allclose(r[0].coord_list, [117, 132, 34.6], atol=0.01)
+
+
+def test_cube_mask():
+    header = demo_header()
+    region = parse('fk5\ncircle(12:04:15.065,+18:26:51.00,17.3")')
+
+    mask = region.get_mask(header=header, shape=(63, 256, 256))
+    assert mask.shape == (63, 256, 256) and not mask.flags.writeable
+    assert mask.strides[0] == 0
+
+    expected = region.get_mask(header=header, shape=(256, 256))
+    assert expected.sum() > 0
+    assert_array_equal(mask[17], expected)
+
+    # the same WCS for all the planes
+    assert_array_equal(region.get_mask(header=header, shape=(63, 256, 256),
+                                       per_plane=True), mask)
+
+
+def test_cube_mask_per_plane():
+    # the celestial position drifts with the channel
+    header = demo_header()
+    for k in ["CROTA1", "CROTA2", "CROTA3"]:
+        del header[k]
+    header["PC1_3"] = 0.5
+    header["PC2_3"] = -0.25
+    region = parse('fk5\ncircle(12:04:15.065,+18:26:51.00,17.3")')
+
+    mask = region.get_mask(header=header, shape=(5, 256, 256), per_plane=True)
+    assert mask.shape == (5, 256, 256) and mask.flags.writeable
+
+    wcs = WCS(header)
+    y, x = np.indices((256, 256))
+    for k in range(5):
+        # the circle is at the pixel of its center in the plane k
+        xc, yc, _ = wcs.all_world2pix(
+            181.062770833, 18.4475, wcs.all_pix2world(0, 0, k, 0)[2], 0)
+        assert mask[k].sum() > 0
+        assert abs(x[mask[k]].mean() - xc) < 0.2
+        assert abs(y[mask[k]].mean() - yc) < 0.2
@@ -1,3 +1,8 @@
+import glob
+import os
+import pytest
+
+import pyregion
 from pyregion.ds9_region_parser import RegionParser, Global
 from pyregion.parser_helper import CoordCommand, Shape
 from pyregion.region_numbers import SimpleNumber, AngularDistance
@@ -66,3 +71,69 @@ def test_space_delimited_region():
     assert isinstance(ss[1], Shape)
     param_types = list(map(type, ss[1].params))
     assert param_types == [SimpleNumber, SimpleNumber, AngularDistance]
+
+
+rootdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def _as_tuples(shape_list):
+    return [(shape.name, shape.coord_format, shape.coord_list, shape.exclude,
+             shape.attr, shape.comment, shape.continued)
+            for shape in shape_list]
+
+
+@pytest.mark.parametrize("reg_name", sorted(
+    os.path.basename(f) for f in glob.glob(os.path.join(rootdir, "*.reg"))))
+def test_fast_engine(reg_name):
+    filename = os.path.join(rootdir, reg_name)
+    shape_list = pyregion.open(filename, engine="fast")
+    assert _as_tuples(shape_list) == _as_tuples(pyregion.open(filename))
+
+
+def test_fast_engine_fallback():
+    # lines out of the tokenized subset are parsed by pyparsing
+    region_string = "\n".join([
+        'global color=green font="helvetica 10 normal" dashlist=8 3',
+        "fk5",
+        "circle 188.5557102 12.0314056 1\" # color=red",
+        "-box(12:30:00, -1d2m3s, 3' 5\", 2', 30) || # tag={a} tag={b}",
+        "wcsa; ellipse(1h2m, +3:4:5, 2r, 1e-3d, 0)",
+        "# composite(1, 2, 0) || width=2",
+        "# text(3, 4) text={a\\tb}",
+        "image; polygon(1, 2, 3, 4, 5, 6) # x=(1)(2) (3) source",
+        "circle(1, 2)",
+    ])
+    with pytest.warns(UserWarning, match="Failed to parse"):
+        reference = pyregion.parse(region_string)
+    with pytest.warns(UserWarning, match="Failed to parse"):
+        shape_list = pyregion.parse(region_string, engine="fast")
+    assert len(shape_list) == 6
+    assert _as_tuples(shape_list) == _as_tuples(reference)
+
+    with pytest.raises(ValueError):
+        pyregion.parse(region_string, engine="regex")
+
+
+@pytest.mark.parametrize("engine", ["pyparsing", "fast"])
+@pytest.mark.parametrize("reg_name", ["test01_mixed.reg", "test_annuli.reg",
+                                      "test_context.reg"])
+def test_iter_open(engine, reg_name):
+    filename = os.path.join(rootdir, reg_name)
+    shapes = list(pyregion.iter_open(filename, engine=engine))
+    assert _as_tuples(shapes) == _as_tuples(pyregion.open(filename))
+
+
+def test_iter_parse_lazy():
+    consumed = []
+
+    def lines():
+        for l in ["global color=red", "fk5", "circle(1, 2, 3\") # width=2",
+                  "image"]:
+            consumed.append(l)
+            yield l + "\n"
+        raise AssertionError("the lines are read ahead")
+
+    shape = next(pyregion.iter_parse(lines(), engine="fast"))
+    assert consumed[-1] == "circle(1, 2, 3\") # width=2"
+    assert shape.coord_format == "fk5" and shape.comment == "width=2"
+    assert shape.attr == ([], {"color": "red", "width": "2"})
@@ -1,9 +1,12 @@
 import os
 import numpy as np
+import pytest
 from os.path import join
+from astropy.io import fits
 from astropy.io.fits import Header
 
 from pyregion import open as pyregion_open
+from pyregion import parse as pyregion_parse
 
 rootdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
@@ -22,3 +25,167 @@ def test_region():
     assert isinstance(mask, np.ndarray) and mask.shape == (100, 100)
 
     # TODO: assert the content of the mask, too
+
+
+@pytest.mark.parametrize("backend", [None, "cython", "numpy"])
+def test_exclude(backend):
+    # an excluded shape only applies to the shapes before it
+    region_string = "\n".join(["image",
+                               "circle(20, 20, 10)",
+                               "-circle(20, 20, 4)",
+                               "-box(25, 20, 6, 6, 0)",
+                               "circle(22, 20, 3)",
+                               "-circle(30, 20, 3)"])
+    mask = pyregion_parse(region_string).get_mask(shape=(40, 40),
+                                                  backend=backend)
+
+    y, x = np.indices((40, 40)) + 1.
+
+    def circle(xc, yc, r):
+        return (x - xc) ** 2 + (y - yc) ** 2 <= r ** 2
+
+    box = (abs(x - 25) <= 3) & (abs(y - 20) <= 3)
+    expected = (((circle(20, 20, 10) & ~circle(20, 20, 4) & ~box)
+                 | circle(22, 20, 3)) & ~circle(30, 20, 3))
+
+    assert np.all(mask == expected)
+
+
+@pytest.mark.parametrize("backend", [None, "numpy"])
+def test_mask_cutout(backend):
+    region = pyregion_parse("image\ncircle(20, 15, 5)\nbox(30, 30, 4, 2, 0)")
+    mask = region.get_mask(shape=(40, 40), backend=backend)
+
+    slices, cutout = region.get_mask_cutout(shape=(40, 40), backend=backend)
+    assert slices == (slice(9, 31), slice(14, 32))
+    assert np.all(cutout == mask[slices]) and cutout.sum() == mask.sum()
+
+    out = np.ones((60, 60), dtype=bool)
+    window = (slice(10, 20), slice(15, None))
+    slices, cutout = region.get_mask_cutout(shape=(40, 40), window=window,
+                                            out=out[:10, :25],
+                                            backend=backend)
+    assert slices == (slice(10, 20), slice(15, 40))
+    assert cutout.base is out
+    assert np.all(out[:10, :25] == mask[10:20, 15:])
+
+
+@pytest.mark.parametrize("backend", [None, "numpy"])
+def test_label_mask(backend):
+    region = pyregion_parse("\n".join(["image",
+                                       "circle(20, 20, 8)",
+                                       "-circle(20, 20, 3)",
+                                       "box(28, 20, 10, 4, 0)",
+                                       "circle(10, 10, 2)",
+                                       "circle(10, 10, 3)"]))
+    shape = (40, 40)
+    label_mask, (pixel, index) = region.get_label_mask(shape=shape,
+                                                       overlaps=True,
+                                                       backend=backend)
+    assert label_mask.dtype == np.int32
+
+    masks = [region[i:i + 1].get_mask(shape=shape) for i in range(5)]
+    masks[0] &= ~pyregion_parse("image\ncircle(20, 20, 3)").get_mask(shape=shape)
+    assert np.all(label_mask[masks[4]] == 4)
+    assert np.all(label_mask[masks[2]] == 2)
+    assert np.all(label_mask[masks[0] & ~masks[2]] == 0)
+    assert np.all(label_mask[~(masks[0] | masks[2] | masks[4])] == -1)
+    assert np.all((label_mask >= 0) == region.get_mask(shape=shape))
+
+    count = masks[0].astype(int) + masks[2] + masks[3] + masks[4]
+    for i in (0, 2, 3, 4):
+        expected = np.flatnonzero(masks[i] & (count > 1))
+        assert np.all(np.sort(pixel[index == i]) == expected)
+    assert np.all(np.diff(pixel) >= 0)
+
+    assert np.all(region.get_label_mask(shape=shape, backend=backend)
+                  == label_mask)
+
+
+@pytest.mark.parametrize("tile_shape", [(7, 10), (16, None), (None, None)])
+def test_mask_tiles(tile_shape):
+    region = pyregion_parse("image\ncircle(20, 15, 5)\nbox(30, 30, 4, 2, 0)")
+    mask = region.get_mask(shape=(40, 45))
+
+    tiled = np.zeros((40, 45), dtype=bool)
+    for slices, tile in region.get_mask_tiles(shape=(40, 45),
+                                              tile_shape=tile_shape):
+        assert tile.any() and not tiled[slices].any()
+        tiled[slices] = tile
+    assert np.all(tiled == mask)
+
+    tiles = list(region.get_mask_tiles(shape=(40, 45), tile_shape=(7, 10),
+                                       skip_empty=False))
+    assert len(tiles) == 6 * 5
+
+
+def test_apply_mask_tiles(tmp_path):
+    region = pyregion_parse("image\ncircle(20, 15, 5)\nbox(30, 30, 4, 2, 0)")
+    data = np.arange(40 * 45, dtype=float).reshape(40, 45)
+    mask = region.get_mask(shape=data.shape)
+
+    filename = str(tmp_path / "image.fits")
+    fits.PrimaryHDU(data).writeto(filename)
+
+    with fits.open(filename, mode="update", memmap=True) as hdul:
+        sums = region.apply_mask_tiles(lambda d, m: d[m].sum(), hdu=hdul[0],
+                                       tile_shape=(8, 8))
+        assert sum(sums) == data[mask].sum()
+        region.apply_mask_tiles(lambda d, m: np.copyto(d, np.nan, where=m),
+                                hdu=hdul[0], tile_shape=(8, 8))
+
+    expected = data.copy()
+    expected[mask] = np.nan
+    assert np.array_equal(fits.getdata(filename), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("backend", [None, "numpy"])
+def test_reduce(tmp_path, backend):
+    region = pyregion_parse("image\ncircle(20, 15, 5)\n-box(20, 15, 2, 20, 0)\n"
+                            "box(30, 30, 4, 2, 0)")
+    data = np.random.RandomState(0).normal(size=(40, 45)).astype(np.float32)
+    label_mask = region.get_label_mask(shape=data.shape)
+
+    filename = str(tmp_path / "image.fits")
+    fits.PrimaryHDU(data).writeto(filename)
+
+    with fits.open(filename, memmap=True) as hdul:
+        stats = region.reduce(hdu=hdul[0], ops=("sum", "count", "max"),
+                              backend=backend)
+
+    assert list(stats["index"]) == [0, 2]
+    for k, i in enumerate(stats["index"]):
+        values = data[label_mask == i]
+        assert stats["count"][k] == len(values)
+        assert stats["sum"][k] == pytest.approx(values.sum(dtype=float))
+        assert stats["max"][k] == values.max()
+
+
+@pytest.mark.parametrize("backend", [None, "numpy"])
+@pytest.mark.parametrize("chunk_size", [None, 100])
+def test_match_points(monkeypatch, backend, chunk_size):
+    from pyregion import region_to_filter
+    if chunk_size:
+        monkeypatch.setattr(region_to_filter, "_POINTS_CHUNK_SIZE", chunk_size)
+
+    region = pyregion_parse("\n".join(["image",
+                                       "circle(20, 20, 8)",
+                                       "-circle(20, 20, 3)",
+                                       "box(28, 20, 10, 4, 30)",
+                                       "polygon(5, 5, 15, 8, 8, 15)",
+                                       "circle(60, 60, 2)"]))
+    rs = np.random.RandomState(0)
+    x, y = rs.uniform(-5, 45, size=(2, 1000))
+    x[:3] = [np.nan, np.inf, 19]
+    y[:3] = [20, 20, 20]
+
+    point, index = region.match_points(x, y, n_threads=2, backend=backend)
+
+    filter_list = region_to_filter.as_region_filter_list(region)
+    inside = np.array([f.inside_x_y(x, y) for _, f in filter_list])
+    expected_index, expected_point = inside.nonzero()
+    order = np.lexsort((expected_index, expected_point))
+    assert np.all(point == expected_point[order])
+    assert np.all(index == np.array([i for i, _ in filter_list])[
+        expected_index[order]])
+    assert 2 not in point and set(index) == {0, 2, 3}
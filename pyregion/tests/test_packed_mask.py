@@ -0,0 +1,41 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from pyregion import parse
+from pyregion import packed_mask
+
+shape = (40, 45)
+
+
+def _masks():
+    r1 = parse("image\ncircle(20, 15, 7)\nbox(35, 30, 20, 6, 30)")
+    r2 = parse("image\npolygon(5, 5, 44, 12, 30, 38)\n-circle(25, 15, 4)")
+    return [(r.get_mask(shape=shape), r.get_mask_packed(shape=shape))
+            for r in (r1, r2)]
+
+
+def test_get_mask_packed():
+    for mask, packed in _masks():
+        assert packed.dtype == np.uint8 and packed.shape == (40, 6)
+        assert_array_equal(packed, packed_mask.pack_mask(mask))
+        assert_array_equal(packed_mask.unpack_mask(packed, shape[1]), mask)
+        assert packed_mask.mask_count(packed) == mask.sum()
+
+
+def test_combine():
+    (m1, p1), (m2, p2) = _masks()
+    nx = shape[1]
+
+    assert_array_equal(packed_mask.unpack_mask(packed_mask.mask_and(p1, p2), nx),
+                       m1 & m2)
+    assert_array_equal(packed_mask.unpack_mask(packed_mask.mask_or(p1, p2), nx),
+                       m1 | m2)
+    assert_array_equal(packed_mask.unpack_mask(packed_mask.mask_xor(p1, p2), nx),
+                       m1 ^ m2)
+
+    inverted = packed_mask.mask_not(p1, nx)
+    assert_array_equal(inverted, packed_mask.pack_mask(~m1))
+    assert packed_mask.mask_count(inverted) == (~m1).sum()
+
+    # the inputs are left alone
+    assert_array_equal(p1, packed_mask.pack_mask(m1))
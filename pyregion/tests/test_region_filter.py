@@ -0,0 +1,346 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from pyregion import _region_filter as region_filter
+from pyregion import _region_filter_numpy
+
+
+def _inside_grid(f, shape):
+    # reference mask, testing every pixel center
+    ny, nx = shape
+    y, x = np.indices(shape)
+    return f.inside_x_y(x.ravel().astype(float),
+                        y.ravel().astype(float)).reshape(shape)
+
+
+def _filters(region_filter=region_filter):
+    circle = region_filter.Circle(20, 15, 7.5)
+    ellipse = region_filter.Ellipse(30, 22, 12, 4.5)
+    box = region_filter.Box(10, 30, 11, 6)
+    polygon = region_filter.Polygon([3, 25, 40, 12, 8], [2, 5, 30, 36, 20])
+    return [
+        circle,
+        ellipse,
+        box,
+        polygon,
+        region_filter.Rotated(ellipse, 33, 30, 22),
+        region_filter.Rotated(box, -70, 10, 30),
+        region_filter.Translated(polygon, 4.5, -3.2),
+        region_filter.Circle(20, 15, 12) & ~region_filter.Circle(20, 15, 5),
+        (circle | box) & region_filter.AngleRange(20, 15, 30, 250),
+        circle | ~polygon,
+        region_filter.Rotated(ellipse & ~region_filter.Ellipse(30, 22, 6, 2),
+                              -20, 30, 22),
+        region_filter.Translated(~circle | box, 3, 2),
+        region_filter.AngleRange(20, 15, 200, 30) & circle,
+        region_filter.RegionOrList(),
+        region_filter.Circle(-30, -30, 5),
+        region_filter.Circle(20, 15, -6),
+        # edges on the pixel centers, rotated by multiples of 90 degrees
+        region_filter.Rotated(region_filter.Box(6, 6, 4, 2), 180, 6, 6),
+        region_filter.Rotated(region_filter.Box(5, 5, 2, 2), 270, 5, 5),
+        region_filter.Rotated(region_filter.Box(30, 20, 8, 6), 90, 30, 20),
+        region_filter.Rotated(region_filter.Polygon([10, 20, 20, 10],
+                                                    [10, 10, 16, 18]),
+                              -90, 15, 15),
+        region_filter.Rotated(region_filter.Polygon([10, 20, 20, 10],
+                                                    [10, 10, 16, 18]),
+                              180, 20, 20),
+    ]
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_mask_matches_inside(f):
+    shape = (40, 47)
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+
+@pytest.mark.parametrize("f", [
+    region_filter.Ellipse(5, 5, 0, 0),
+    region_filter.Ellipse(5, 5, 0, 2),
+    region_filter.Ellipse(5, 5, 3, 0),
+], ids=repr)
+def test_mask_degenerate_ellipse(f):
+    # a zero radius does not bound the other axis
+    shape = (12, 12)
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+
+@pytest.mark.parametrize(("x", "y"), [
+    # horizontal edges and vertices at pixel centers
+    ([2, 20, 20, 10, 10, 2], [3, 3, 30, 30, 12, 12]),
+    # self-intersecting
+    ([5, 40, 8, 22, 30], [5, 20, 30, 0, 35]),
+    # degenerate
+    ([10, 20, 30], [10, 10, 10]),
+])
+def test_polygon_mask(x, y):
+    shape = (40, 47)
+    f = region_filter.Polygon(x, y)
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+
+def test_polygon_inside_indexed():
+    # enough vertices for the edges to be indexed for point queries
+    theta = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+    r = 15 + 6 * np.sin(5 * theta)
+    x, y = 23 + r * np.cos(theta), 20 + r * np.sin(theta)
+    x[::7], y[::7] = np.round(x[::7]), np.round(y[::7])
+
+    shape = (40, 47)
+    f = region_filter.Polygon(x, y)
+    assert_array_equal(_inside_grid(f, shape), f.mask(shape))
+    assert f.inside1(x[0], y[0])
+    assert not f.inside1(23, -100)
+
+
+def test_bbox():
+    assert region_filter.Circle(20, 15, 7.5).bbox() == (12.5, 7.5, 27.5, 22.5)
+    assert region_filter.Box(10, 30, 11, 6).bbox() == (4.5, 27, 15.5, 33)
+
+    x1, y1, x2, y2 = (~region_filter.Circle(20, 15, 7.5)).bbox()
+    assert np.isinf([x1, y1, x2, y2]).all()
+
+    x1, y1, x2, y2 = region_filter.RegionOrList().bbox()
+    assert x1 > x2 and y1 > y2
+
+
+def test_span():
+    c = region_filter.Circle(20, 15, 5)
+    assert c.span(15) == (15, 25)
+    assert c.span(21) is None
+
+    r = region_filter.Rotated(region_filter.Box(0, 0, 4, 2), 90, 0, 0)
+    assert r.span(0) == pytest.approx((-1, 1))
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_mask_threads(f):
+    shape = (400, 47)
+    assert_array_equal(f.mask(shape, n_threads=3), f.mask(shape))
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_mask_cutout(f):
+    shape = (40, 47)
+    mask = f.mask(shape)
+
+    slices, cutout = f.mask_cutout(shape)
+    assert_array_equal(cutout, mask[slices])
+    assert cutout.sum() == mask.sum()
+    if mask.any():
+        assert cutout[0].any() and cutout[-1].any()
+        assert cutout[:, 0].any() and cutout[:, -1].any()
+
+    window = (slice(5, 100), slice(-30, -2))
+    slices, cutout = f.mask_cutout(shape, window=window, n_threads=3)
+    assert slices == (slice(5, 40), slice(17, 45))
+    assert_array_equal(cutout, mask[slices])
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_mask_runs(f):
+    shape = (400, 47)
+    mask = f.mask(shape)
+
+    rows, starts, stops = f.mask_runs(shape)
+    expected = np.zeros(shape, dtype=bool)
+    for y, x1, x2 in zip(rows, starts, stops):
+        assert x1 < x2 and not expected[y, x1 - 1:x2 + 1].any()
+        expected[y, x1:x2] = True
+    assert_array_equal(expected, mask)
+    assert np.all(np.diff(rows * shape[1] + starts) > 0)
+
+    for a, b in zip(f.mask_runs(shape, n_threads=3), (rows, starts, stops)):
+        assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_mask_packed(f):
+    for shape in [(40, 47), (400, 48), (30, 5)]:
+        expected = np.packbits(f.mask(shape), axis=1)
+        assert_array_equal(f.mask_packed(shape), expected)
+        assert_array_equal(f.mask_packed(shape, n_threads=3), expected)
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_reduce(f):
+    shape = (400, 47)
+    mask = f.mask(shape)
+    data = np.random.RandomState(0).normal(size=shape)
+
+    for a in [data, data.astype(">f4"), data[:, ::-1], (data * 10).astype(int)]:
+        values = a[mask].astype(float)
+        result = f.reduce(a)
+        assert result["count"] == mask.sum()
+        assert result["sum"] == pytest.approx(values.sum())
+        if mask.any():
+            assert result["mean"] == pytest.approx(values.mean())
+            assert result["min"] == values.min()
+            assert result["max"] == values.max()
+        else:
+            assert np.isnan([result["mean"], result["min"], result["max"]]).all()
+        assert f.reduce(a, n_threads=3) == pytest.approx(result, nan_ok=True)
+
+    cube = np.stack([data, 2 * data])
+    result = f.reduce(cube, ops=("sum", "count"))
+    assert result["sum"] == pytest.approx([data[mask].sum(), 2 * data[mask].sum()])
+
+    if mask.any():
+        data[mask.nonzero()[0][0], mask.nonzero()[1][0]] = np.nan
+        assert np.isnan(f.reduce(data, ops=("max",))["max"])
+
+    with pytest.raises(ValueError):
+        f.reduce(data, ops=("median",))
+
+
+def test_inside_threads():
+    f = _filters()[9]
+    x, y = np.random.RandomState(0).uniform(-5, 50, (2, 300000))
+    expected = f.inside_x_y(x, y)
+    assert_array_equal(f.inside_x_y(x, y, n_threads=3), expected)
+    assert_array_equal(f.inside_xy(np.column_stack([x, y]), n_threads=3),
+                       expected)
+
+    with pytest.raises(ValueError):
+        f.mask((40, 47), n_threads=0)
+
+
+def test_inside_nested():
+    # nested the way as_region_filter builds excluded shapes, with
+    # transforms and double negations
+    circles = [region_filter.Circle(3 * i, 2 * i, 4) for i in range(15)]
+    f = region_filter.RegionOrList(region_filter.Box(20, 15, 30, 20))
+    for i, c in enumerate(circles):
+        if i % 3 == 0:
+            c = ~~region_filter.Rotated(c, 20 * i, 10, 10)
+        elif i % 3 == 1:
+            c = region_filter.Translated(c, 1.5, -2)
+        f = region_filter.RegionOrList(f & ~c)
+
+    x, y = np.random.RandomState(0).uniform(-5, 50, (2, 2000))
+    expected = [f.inside1(xi, yi) for xi, yi in zip(x, y)]
+    assert_array_equal(f.inside_x_y(x, y), expected)
+
+    shape = (40, 47)
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+
+def test_mask_transformed_list_changed():
+    # the transform pushed down to the children follows the changes of
+    # the list
+    children = region_filter.RegionOrList(region_filter.Circle(20, 15, 5))
+    f = region_filter.Rotated(children, 30, 20, 15)
+    shape = (40, 47)
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+    children.asList().append(region_filter.Box(30, 20, 10, 4))
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+    children[0] = ~region_filter.Circle(10, 10, 6)
+    assert_array_equal(f.mask(shape), _inside_grid(f, shape))
+
+
+def test_mask_shared_filter():
+    # a composite transformed filter, made masks of by several threads
+    circles = [region_filter.Circle(3 * i, 2 * i, 4) for i in range(30)]
+    f = region_filter.Rotated(region_filter.RegionOrList(*circles) &
+                              ~region_filter.Box(40, 30, 20, 10), 25, 40, 30)
+    shape = (1000, 97)
+    expected = f.mask(shape)
+
+    with ThreadPoolExecutor(4) as executor:
+        masks = list(executor.map(lambda i: f.mask(shape, n_threads=2),
+                                  range(100)))
+    for m in masks:
+        assert_array_equal(m, expected)
+
+
+@pytest.mark.parametrize("i", range(len(_filters())))
+def test_numpy(i):
+    f = _filters()[i]
+    f_numpy = _filters(_region_filter_numpy)[i]
+
+    shape = (40, 47)
+    assert_array_equal(f_numpy.mask(shape), f.mask(shape))
+
+    x, y = np.random.RandomState(0).uniform(-5, 50, (2, 2000))
+    assert_array_equal(f_numpy.inside_x_y(x, y), f.inside_x_y(x, y))
+    assert_array_equal(f_numpy.inside_xy(np.column_stack([x, y])),
+                       f.inside_x_y(x, y))
+    assert f_numpy.inside1(x[0], y[0]) == f.inside1(x[0], y[0])
+
+    # the points may round differently on the grid of the extension
+    assert np.abs(f_numpy.mask(shape, mode="subsample", subsample=4) -
+                  f.mask(shape, mode="subsample", subsample=4)).max() <= 1 / 16.
+    slices, cutout = f.mask_cutout(shape)
+    assert f_numpy.mask_cutout(shape)[0] == slices
+    assert_array_equal(f_numpy.mask_cutout(shape)[1], cutout)
+
+    for a, b in zip(f_numpy.mask_runs(shape), f.mask_runs(shape)):
+        assert_array_equal(a, b)
+
+    assert_array_equal(f_numpy.mask_packed(shape), f.mask_packed(shape))
+
+    data = np.random.RandomState(0).normal(size=shape)
+    assert (f_numpy.reduce(data) ==
+            pytest.approx(f.reduce(data), nan_ok=True))
+
+    with pytest.raises(_region_filter_numpy.NotYetImplemented):
+        f_numpy.mask(shape, mode="exact")
+
+
+@pytest.mark.parametrize("f", _filters(), ids=repr)
+def test_mask_exact(f):
+    shape = (40, 47)
+    exact = f.mask(shape, mode="exact")
+    assert exact.dtype == np.float32
+    assert ((0 <= exact) & (exact <= 1)).all()
+
+    # a finely subsampled mask is close to the area
+    subsampled = f.mask(shape, mode="subsample", subsample=32)
+    assert np.abs(exact - subsampled).max() < 0.05
+
+    assert_array_equal(f.mask(shape, mode="exact", n_threads=3), exact)
+    assert_array_equal(f.mask(shape, mode="subsample", subsample=32,
+                              n_threads=3), subsampled)
+
+
+@pytest.mark.parametrize("f", [
+    region_filter.AngleRange(-300, 18, -2, 3),
+    region_filter.Rotated(region_filter.AngleRange(20, 500, 265, 275),
+                          10, 20, 15),
+], ids=repr)
+def test_mask_exact_angle_range(f):
+    # the rays from a center far from the image
+    shape = (40, 47)
+    exact = f.mask(shape, mode="exact")
+    subsampled = f.mask(shape, mode="subsample", subsample=32)
+    assert np.abs(exact - subsampled).max() < 0.05
+    assert exact.sum() == pytest.approx(subsampled.sum(), rel=1e-3)
+
+
+def test_mask_area():
+    shape = (40, 47)
+    circle = region_filter.Circle(20.3, 15.1, 7.5)
+    assert circle.mask(shape, mode="exact").sum() == pytest.approx(
+        np.pi * 7.5 ** 2, rel=1e-5)
+
+    # the edges of the box are between pixels
+    box = region_filter.Box(10, 20, 7, 5)
+    assert_array_equal(box.mask(shape, mode="exact"), box.mask(shape))
+    assert_array_equal(box.mask(shape, mode="subsample"), box.mask(shape))
+
+    x, y = np.array([3.2, 25, 40, 12, 8]), np.array([2, 5.7, 30, 36, 20])
+    area = 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+    polygon = region_filter.Polygon(x, y)
+    assert polygon.mask(shape, mode="exact").sum() == pytest.approx(area,
+                                                                    rel=1e-5)
+
+    with pytest.raises(ValueError):
+        box.mask(shape, mode="area")
+    with pytest.raises(ValueError):
+        box.mask(shape, mode="subsample", subsample=0)
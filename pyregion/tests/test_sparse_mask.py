@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from pyregion import parse
+from pyregion import sparse_mask
+
+region_string = "image\ncircle(20, 15, 7)\n-box(20, 15, 4, 30, 0)\npolygon(30, 30, 45, 32, 35, 38)"
+shape = (40, 47)
+
+
+@pytest.fixture(params=[1, 5, 1 << 20])
+def chunk_size(request, monkeypatch):
+    monkeypatch.setattr(sparse_mask, "_RUNS_CHUNK_SIZE", request.param)
+
+
+def test_runs(chunk_size):
+    region = parse(region_string)
+    mask = region.get_mask(shape=shape)
+    runs = region.get_mask_runs(shape=shape)
+
+    assert_array_equal(sparse_mask.runs_to_mask(runs, shape), mask)
+    assert_array_equal(sparse_mask.runs_to_indices(runs, shape),
+                       np.flatnonzero(mask))
+
+    data = np.random.RandomState(0).uniform(size=(3,) + shape)
+    assert_array_equal(sparse_mask.take_runs(data, runs), data[..., mask])
+
+    expected = data.copy()
+    expected[..., mask] = 2 * data[..., mask]
+    sparse_mask.put_runs(data, runs, 2 * sparse_mask.take_runs(data, runs))
+    assert_array_equal(data, expected)
+
+
+def test_runs_memmap(tmp_path):
+    region = parse(region_string)
+    mask = region.get_mask(shape=shape)
+    runs = region.get_mask_runs(shape=shape)
+
+    data = np.memmap(str(tmp_path / "data.dat"), dtype=np.float32,
+                     mode="w+", shape=shape)
+    sparse_mask.put_runs(data, runs, 1.5)
+    data.flush()
+
+    data = np.memmap(str(tmp_path / "data.dat"), dtype=np.float32,
+                     mode="r", shape=shape)
+    assert_array_equal(data, np.where(mask, 1.5, 0))
+    assert_array_equal(sparse_mask.take_runs(data, runs), 1.5)
+
+
+def test_runs_empty():
+    runs = parse("image\ncircle(-20, -20, 3)").get_mask_runs(shape=shape)
+    assert len(runs[0]) == 0
+    assert not sparse_mask.runs_to_mask(runs, shape).any()
+    assert sparse_mask.take_runs(np.ones(shape), runs).shape == (0,)
+
+
+def test_reduce_runs(chunk_size):
+    region = parse(region_string)
+    mask = region.get_mask(shape=shape)
+    runs = region.get_mask_runs(shape=shape)
+
+    data = np.random.RandomState(0).uniform(size=(2,) + shape)
+    result = sparse_mask.reduce_runs(data, runs)
+    assert result["count"] == mask.sum()
+    assert result["sum"] == pytest.approx(data[..., mask].sum(axis=-1))
+    assert result["mean"] == pytest.approx(data[..., mask].mean(axis=-1))
+    assert np.all(result["min"] == data[..., mask].min(axis=-1))
+    assert np.all(result["max"] == data[..., mask].max(axis=-1))
+
+    with pytest.raises(ValueError):
+        sparse_mask.reduce_runs(data, runs, ops=("sum", "std"))
@@ -1,10 +1,15 @@
 import pytest
 import os.path
+import numpy as np
 from numpy.testing import assert_allclose
+from astropy.coordinates import SkyCoord
 from astropy.io.fits import Header
+from astropy.wcs import WCS
+import pyregion
 from pyregion.ds9_region_parser import ds9_shape_defs
 from pyregion.region_numbers import CoordOdd, CoordEven
-from pyregion import wcs_converter
+from pyregion import wcs_converter, wcs_helper
+from pyregion.physical_coordinate import PhysicalCoordinate
 from pyregion.wcs_helper import _calculate_rotation_angle
 
 
@@ -41,3 +46,199 @@ def test_calculate_rotation_angle(region_frame, header_name, rot_angle):
         _calculate_rotation_angle(region_frame, header), rot_angle,
         atol=0.001
     )
+
+
+def _random_sky(n):
+    rs = np.random.RandomState(0)
+    ra = rs.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rs.uniform(-1, 1, n)))
+    return ra, dec
+
+
+@pytest.mark.parametrize("backend", [None, "numpy"])
+def test_contains_sky(backend):
+    # around the pole, across ra = 0, and with an excluded shape
+    region = pyregion.parse("fk5\ncircle(10, 89.5, 2)\n"
+                            "circle(359.9, 0, 1.5)\n-circle(0, 0, 0.5)")
+    ra, dec = _random_sky(100000)
+    inside = region.contains_sky(ra, dec, frame="icrs", backend=backend)
+
+    c = SkyCoord(ra, dec, unit="degree", frame="icrs")
+
+    def circle(lon, lat, r):
+        return c.separation(SkyCoord(lon, lat, unit="degree",
+                                     frame="fk5")).degree < r
+
+    expected = (circle(10, 89.5, 2) |
+                (circle(359.9, 0, 1.5) & ~circle(0, 0, 0.5)))
+    assert expected.sum() > 50
+    assert np.all(inside == expected)
+
+    inside = region.contains_sky(ra.reshape(100, -1), dec.reshape(100, -1),
+                                 frame="icrs", backend=backend)
+    assert np.all(inside == expected.reshape(100, -1))
+
+
+@pytest.mark.parametrize("shape", ["box(100, 30, 3, 1, 30)",
+                                   "ellipse(50, -60, 2, 1, 45)",
+                                   "polygon(200, -10, 210, -10, 205, 0)"])
+def test_contains_sky_header(shape):
+    # the same as with a header tangent near the shape
+    region = pyregion.parse("galactic\n" + shape)
+    ra, dec = _random_sky(100000)
+
+    c = SkyCoord(ra, dec, unit="degree", frame="fk5").galactic
+    lon, lat = [float(v) for v in shape.split("(")[1].split(",")[:2]]
+    header = Header()
+    header.update(NAXIS=2, NAXIS1=2000, NAXIS2=2000,
+                  CTYPE1="GLON-TAN", CTYPE2="GLAT-TAN",
+                  CRVAL1=lon, CRVAL2=lat, CRPIX1=1000, CRPIX2=1000,
+                  CDELT1=-0.01, CDELT2=0.01)
+    x, y = WCS(header).all_world2pix(c.l.degree, c.b.degree, 1)
+    expected = region.get_filter(header=header).inside_x_y(x - 1, y - 1)
+
+    inside = region.contains_sky(ra, dec)
+    assert expected.sum() > 5
+    assert np.all(inside == expected)
+
+
+def test_contains_sky_image():
+    region = pyregion.parse("image\ncircle(10, 10, 2)")
+    with pytest.raises(ValueError):
+        region.contains_sky([10.], [10.])
+
+
+def test_convert_list_to_imagecoord():
+    # the pairs of shapes of several frames are scattered back in order
+    header = Header.fromtextfile(os.path.join(rootdir, "sample_fits01.header"))
+    shape_list = pyregion.parse(
+        "fk5\ncircle(171.1, 19.9, 0.01)\n"
+        "galactic\nbox(231.9, 71.2, 0.02, 0.01, 30)\n"
+        "image\ncircle(10, 10, 3)\n"
+        "fk5\npolygon(171.1, 19.9, 171.12, 19.9, 171.1, 19.92)\n"
+        "galactic\nellipse(231.9, 71.2, 0.02, 0.01, 45)")
+
+    sky_shapes = [s for s in shape_list if s.coord_format != "image"]
+    coord_lists = wcs_converter.convert_list_to_imagecoord(sky_shapes, header)
+    for shape, coord_list in zip(sky_shapes, coord_lists):
+        assert_allclose(coord_list,
+                        wcs_converter.convert_to_imagecoord(shape, header))
+
+    converted = shape_list.as_imagecoord(header)
+    assert [s.coord_list for i, s in enumerate(converted)
+            if i != 2] == coord_lists
+    assert converted[2].coord_list == [10, 10, 3]
+
+
+def test_header_wcs_cache(monkeypatch):
+    monkeypatch.setattr(wcs_helper, "_WCS_CACHE_SIZE", 2)
+    monkeypatch.setattr(wcs_helper, "_wcs_cache", wcs_helper.OrderedDict())
+
+    header = Header.fromtextfile(os.path.join(rootdir, "sample_fits01.header"))
+    header_wcs = wcs_helper._header_wcs(header)
+    assert wcs_helper._header_wcs(header.copy()) is header_wcs
+    assert_allclose(header_wcs.rotation_angle("galactic"), -19.2328,
+                    rtol=1e-4)
+    assert "galactic" in header_wcs._rotations
+    assert_allclose(wcs_helper._estimate_angle(30, "galactic", header),
+                    30 - header_wcs.rotation_angle("galactic"))
+
+    # the cache follows the content of the header, and only keeps the
+    # last headers
+    changed = header.copy()
+    for k in range(2):
+        changed["CRVAL1"] = header["CRVAL1"] + 1 + k
+        assert wcs_helper._header_wcs(changed) is not header_wcs
+        assert wcs_helper._header_wcs(changed.copy()) is \
+            wcs_helper._header_wcs(changed)
+    assert wcs_helper._header_wcs(header) is not header_wcs
+
+
+def _wide_header():
+    header = Header()
+    header.update(NAXIS=2, NAXIS1=2000, NAXIS2=2000,
+                  CTYPE1="RA---TAN", CTYPE2="DEC--TAN",
+                  CRVAL1=30., CRVAL2=60., CRPIX1=1000.5, CRPIX2=1000.5,
+                  CDELT1=-0.02, CDELT2=0.02)
+    return header
+
+
+def test_local_angle():
+    header = _wide_header()
+    region = pyregion.parse("fk5\nellipse(30, 60, 1, 0.5, 20)\n"
+                            "ellipse(60, 70, 1, 0.5, 20)\n"
+                            "galactic\nbox(135, 0, 1, 0.5, 20)\n"
+                            "fk5\ncircle(60, 70, 1)")
+    shapes = region.as_imagecoord(header)
+    local_shapes = region.as_imagecoord(header, local=True)
+
+    # the rotation of the north axis at the center of each shape, as
+    # if the image was centered there
+    wcs = WCS(header)
+    for shape, local_shape in zip(region[:3], local_shapes[:3]):
+        x, y = local_shape.coord_list[:2]
+        rotation = _calculate_rotation_angle(
+            shape.coord_format, {"NAXIS1": 2 * x, "NAXIS2": 2 * y}, wcs)
+        assert_allclose(local_shape.coord_list[-1], 20 - rotation,
+                        atol=1e-6)
+
+    # about the same near the center of the image, but not in the corner
+    assert_allclose(local_shapes[0].coord_list[-1], shapes[0].coord_list[-1],
+                    atol=0.05)
+    assert abs(local_shapes[1].coord_list[-1] - shapes[1].coord_list[-1]) > 5
+    assert local_shapes[3].coord_list[:2] == shapes[3].coord_list[:2]
+
+
+def test_local_angle_near_pole():
+    # less than a pixel from the pole, where the north is measured to
+    # the south
+    header = _wide_header()
+    region = pyregion.parse("fk5\nellipse(30, 89.99, 1, 0.5, 20)\n"
+                            "ellipse(120, 89.99, 1, 0.5, 20)\n"
+                            "ellipse(120, 89.9, 1, 0.5, 20)")
+    local_shapes = region.as_imagecoord(header, local=True)
+
+    assert_allclose(local_shapes[0].coord_list[-1], 20, atol=1e-4)
+    assert_allclose(local_shapes[1].coord_list[-1], -70, atol=1e-4)
+    assert_allclose(local_shapes[1].coord_list[-1],
+                    local_shapes[2].coord_list[-1], atol=1e-4)
+
+
+def test_local_pixel_scales():
+    # the pixels of a gnomonic projection cover cos(t) ** 2 less sky along
+    # the radius and cos(t) less across it, at an angle t from the
+    # tangent point
+    header = _wide_header()
+    region = pyregion.parse("fk5\ncircle(30, 60, 0.1)\ncircle(30, 80, 0.1)\n"
+                            "ellipse(30, 80, 0.2, 0.1, 0)")
+    shapes = region.as_imagecoord(header)
+    local_shapes = region.as_imagecoord(header, local=True)
+
+    t = np.radians(20)
+    assert_allclose(local_shapes[0].coord_list[2], 5, rtol=1e-4)
+    assert_allclose(local_shapes[1].coord_list[2], 5 / np.cos(t) ** 1.5,
+                    rtol=1e-4)
+    assert_allclose(local_shapes[2].coord_list[2:4],
+                    [10 / np.cos(t), 5 / np.cos(t) ** 2], rtol=1e-4)
+    assert_allclose(shapes[1].coord_list[2], 5)
+
+
+def test_physical_coordinate_arrays():
+    header = Header.fromtextfile(os.path.join(rootdir, "sample_fits01.header"))
+    pc = PhysicalCoordinate(header)
+
+    x, y = np.array([4053.9922, 4267.9987]), np.array([4121.9905, 4214.0083])
+    imx, imy = pc.to_image(x, y)
+    for k in range(2):
+        assert_allclose(pc.to_image(x[k], y[k]), (imx[k], imy[k]))
+    assert_allclose(pc.to_physical(imx, imy), (x, y))
+
+    shape_list = pyregion.open(os.path.join(rootdir,
+                                            "test01_ds9_physical.reg"))
+    coord_lists = wcs_converter.convert_physical_list_to_imagecoord(
+        shape_list, header)
+    assert len(coord_lists) == len(shape_list)
+    for shape, coord_list in zip(shape_list, coord_lists):
+        assert coord_list == wcs_converter.convert_physical_to_imagecoord(
+            shape, header)
+        assert coord_list[:2] == list(pc.to_image(*shape.coord_list[:2]))
@@ -1,10 +1,8 @@
 import copy
 
 from astropy.coordinates import SkyCoord
-from astropy.wcs import WCS
-from astropy.wcs.utils import proj_plane_pixel_area, proj_plane_pixel_scales
 import numpy as np
-from .wcs_helper import _estimate_angle
+from .wcs_helper import _header_wcs, _tangent_plane, _unit_vector
 from .region_numbers import CoordOdd, Distance, Angle
 from .parser_helper import Shape, CoordCommand
 from .region_numbers import SimpleNumber, SimpleInteger
@@ -55,7 +53,20 @@ def _generate_arg_types(coordlist_length, shape_name):
     return arg_types
 
 
-def convert_to_imagecoord(shape, header):
+def _arg_types_list(shape_list):
+    # the coordinate types of each shape, found once for each kind of
+    # shape, since the shapes of a list are mostly of a few kinds
+    arg_types_cache = {}
+    arg_types_list = []
+    for shape in shape_list:
+        key = len(shape.coord_list), shape.name
+        if key not in arg_types_cache:
+            arg_types_cache[key] = _generate_arg_types(*key)
+        arg_types_list.append(arg_types_cache[key])
+    return arg_types_list
+
+
+def convert_to_imagecoord(shape, header, local=False):
     """Convert the coordlist of `shape` to image coordinates
 
     Parameters
@@ -66,76 +77,255 @@ def convert_to_imagecoord(shape, header):
     header : `~astropy.io.fits.Header`
         Specifies what WCS transformations to use.
 
+    local : bool
+        See `convert_list_to_imagecoord`
+
     Returns
     -------
     new_coordlist : list
         A list of image coordinates defining the shape.
 
     """
+    return convert_list_to_imagecoord([shape], header, local=local)[0]
+
+
+def convert_list_to_imagecoord(shape_list, header, local=False):
+    """Convert the coordlists of many shapes to image coordinates
+
+    The coordinate pairs of all the shapes in the same frame are
+    converted at once, and the WCS of the header and the rotation of
+    the north axis of each frame are cached (see
+    `pyregion.wcs_helper._header_wcs`), so that converting a long list
+    of shapes is about as fast as converting a few of them.
+
+    Parameters
+    ----------
+    shape_list : list of `pyregion.parser_helper.Shape`
+        The shapes to convert coordinates
+
+    header : `~astropy.io.fits.Header`
+        Specifies what WCS transformations to use.
+
+    local : bool
+        If True, the angles and distances are converted with the
+        rotation of the north axis and the pixel scales at the center of
+        each shape (its first coordinate pair), measured for all the
+        shapes at once, rather than with the rotation at the center of
+        the image (as DS9 does) and the scales at the reference pixel.
+
+    Returns
+    -------
+    new_coordlist_list : list
+        A list of image coordinates defining each shape.
+
+    """
+    arg_types_list = _arg_types_list(shape_list)
+
+    header_wcs = _header_wcs(header)
+    new_wcs = header_wcs.wcs
+
+    # the coordinate pairs of the shapes, by frame, and the centers of
+    # the shapes with angles or distances
+    pairs = {}
+    centers = {}
+    for shape, arg_types in zip(shape_list, arg_types_list):
+        lon_list, lat_list = pairs.setdefault(shape.coord_format, ([], []))
+        for i, coordinate_type in enumerate(arg_types):
+            if coordinate_type == CoordOdd:
+                lon_list.append(shape.coord_list[i])
+                lat_list.append(shape.coord_list[i + 1])
+        if local and (Angle in arg_types or Distance in arg_types):
+            centers.setdefault(shape.coord_format, ([], []))
+            centers[shape.coord_format][0].append(shape.coord_list[0])
+            centers[shape.coord_format][1].append(shape.coord_list[1])
+
+    pixels = {}
+    for frame, (lon_list, lat_list) in pairs.items():
+        if not lon_list:
+            continue
+        old_coordinate = SkyCoord(np.array(lon_list), np.array(lat_list),
+                                  frame=frame, unit='degree',
+                                  obstime='J2000')
+        x, y = old_coordinate.to_pixel(new_wcs, origin=1)
+        pixels[frame] = iter(zip(x.tolist(), y.tolist()))
+
+    local_wcs = {}
+    for frame, (lon_list, lat_list) in centers.items():
+        lon, lat = np.array(lon_list), np.array(lat_list)
+        rotations = header_wcs.rotation_angles(frame, lon, lat)
+        scales, area_scales = header_wcs.local_pixel_scales(frame, lon, lat)
+        local_wcs[frame] = iter(zip(rotations.tolist(), scales.tolist(),
+                                    area_scales.tolist()))
+
+    new_coordlist_list = []
+    for shape, arg_types in zip(shape_list, arg_types_list):
+        new_coordlist = []
+        is_even_distance = True
+        if local and (Angle in arg_types or Distance in arg_types):
+            rotation, pixel_scales, pixel_area_scale = next(
+                local_wcs[shape.coord_format])
+        else:
+            rotation = None
+            pixel_scales = header_wcs.pixel_scales
+            pixel_area_scale = None
+        coord_list_iter = iter(zip(shape.coord_list, arg_types))
+
+        for coordinate, coordinate_type in coord_list_iter:
+            if coordinate_type == CoordOdd:
+                next(coord_list_iter)
+                new_coordlist.extend(next(pixels[shape.coord_format]))
+
+            elif coordinate_type == Distance:
+                if arg_types[-1] == Angle:
+                    degree_per_pixel = pixel_scales[0 if is_even_distance else 1]
+
+                    is_even_distance = not is_even_distance
+                else:
+                    if pixel_area_scale is None:
+                        pixel_area_scale = header_wcs.pixel_area_scale
+                    degree_per_pixel = pixel_area_scale
+
+                new_coordlist.append(coordinate / degree_per_pixel)
+
+            elif coordinate_type == Angle:
+                if rotation is None:
+                    rotation = header_wcs.rotation_angle(shape.coord_format)
+                new_coordlist.append(coordinate - rotation)
+
+            else:
+                new_coordlist.append(coordinate)
+
+        new_coordlist_list.append(new_coordlist)
+
+    return new_coordlist_list
+
+
+def convert_to_tangent_plane(shape):
+    """Convert the coordlist of `shape` to a plane tangent to the sky
+
+    The plane is tangent at the center of the shape (the mean position
+    of its coordinates), and oriented as described in
+    `pyregion.wcs_helper._tangent_plane`. The distances are those of
+    the gnomonic projection from the tangent point, so that a circle
+    on the sky around the tangent point is a circle on the plane.
+
+    Parameters
+    ----------
+    shape : `pyregion.parser_helper.Shape`
+        The `Shape` to convert coordinates, in sky coordinates
+
+    Returns
+    -------
+    center : tuple
+        Longitude and latitude of the tangent point, in degrees, in the
+        frame of the shape
+
+    new_coordlist : list
+        A list of the coordinates on the plane defining the shape.
+    """
     arg_types = _generate_arg_types(len(shape.coord_list), shape.name)
 
+    lon = [c for c, t in zip(shape.coord_list, arg_types) if t == CoordOdd]
+    lat = [shape.coord_list[i + 1] for i, t in enumerate(arg_types)
+           if t == CoordOdd]
+    xyz = _unit_vector(np.array(lon), np.array(lat)).sum(axis=0)
+    lon0 = np.degrees(np.arctan2(xyz[1], xyz[0])).item()
+    lat0 = np.degrees(np.arctan2(xyz[2], np.hypot(xyz[0], xyz[1]))).item()
+
     new_coordlist = []
-    is_even_distance = True
     coord_list_iter = iter(zip(shape.coord_list, arg_types))
 
-    new_wcs = WCS(header)
-    pixel_scales = proj_plane_pixel_scales(new_wcs)
-
     for coordinate, coordinate_type in coord_list_iter:
         if coordinate_type == CoordOdd:
             even_coordinate = next(coord_list_iter)[0]
-
-            old_coordinate = SkyCoord(coordinate, even_coordinate,
-                                      frame=shape.coord_format, unit='degree',
-                                      obstime='J2000')
             new_coordlist.extend(
                 x.item()
-                for x in old_coordinate.to_pixel(new_wcs, origin=1)
+                for x in _tangent_plane(coordinate, even_coordinate,
+                                        lon0, lat0)
             )
 
         elif coordinate_type == Distance:
-            if arg_types[-1] == Angle:
-                degree_per_pixel = pixel_scales[0 if is_even_distance else 1]
-
-                is_even_distance = not is_even_distance
-            else:
-                degree_per_pixel = np.sqrt(proj_plane_pixel_area(new_wcs))
-
-            new_coordlist.append(coordinate / degree_per_pixel)
-
-        elif coordinate_type == Angle:
-            new_angle = _estimate_angle(coordinate,
-                                        shape.coord_format,
-                                        header)
-            new_coordlist.append(new_angle)
+            new_coordlist.append(np.degrees(np.tan(np.radians(coordinate))))
 
         else:
             new_coordlist.append(coordinate)
 
-    return new_coordlist
+    return (lon0, lat0), new_coordlist
 
 
 def convert_physical_to_imagecoord(shape, header):
-    arg_types = _generate_arg_types(len(shape.coord_list), shape.name)
+    """Convert the coordlist of `shape` from physical to image coordinates
 
-    new_coordlist = []
-    coord_list_iter = iter(zip(shape.coord_list, arg_types))
+    Parameters
+    ----------
+    shape : `pyregion.parser_helper.Shape`
+        The `Shape` to convert coordinates
+
+    header : `~astropy.io.fits.Header`
+        Specifies what physical coordinates to use.
+
+    Returns
+    -------
+    new_coordlist : list
+        A list of image coordinates defining the shape.
+
+    """
+    return convert_physical_list_to_imagecoord([shape], header)[0]
+
+
+def convert_physical_list_to_imagecoord(shape_list, header):
+    """Convert the coordlists of many shapes from physical to image coordinates
+
+    The physical coordinates of the header are read once, and the
+    coordinate pairs of all the shapes are converted at once.
+
+    Parameters
+    ----------
+    shape_list : list of `pyregion.parser_helper.Shape`
+        The shapes to convert coordinates
+
+    header : `~astropy.io.fits.Header`
+        Specifies what physical coordinates to use.
+
+    Returns
+    -------
+    new_coordlist_list : list
+        A list of image coordinates defining each shape.
+
+    """
+    arg_types_list = _arg_types_list(shape_list)
 
     from .physical_coordinate import PhysicalCoordinate
     pc = PhysicalCoordinate(header)
 
-    for coordinate, coordinate_type in coord_list_iter:
-        if coordinate_type == CoordOdd:
-            even_coordinate = next(coord_list_iter)[0]
+    x_list, y_list = [], []
+    for shape, arg_types in zip(shape_list, arg_types_list):
+        for i, coordinate_type in enumerate(arg_types):
+            if coordinate_type == CoordOdd:
+                x_list.append(shape.coord_list[i])
+                y_list.append(shape.coord_list[i + 1])
+
+    x, y = pc.to_image(np.array(x_list, dtype=float),
+                       np.array(y_list, dtype=float))
+    pixels = iter(zip(x.tolist(), y.tolist()))
+
+    new_coordlist_list = []
+    for shape, arg_types in zip(shape_list, arg_types_list):
+        new_coordlist = []
+        coord_list_iter = iter(zip(shape.coord_list, arg_types))
+
+        for coordinate, coordinate_type in coord_list_iter:
+            if coordinate_type == CoordOdd:
+                next(coord_list_iter)
+                new_coordlist.extend(next(pixels))
+            elif coordinate_type == Distance:
+                new_coordlist.append(pc.to_image_distance(coordinate))
+            else:
+                new_coordlist.append(coordinate)
 
-            xy0 = pc.to_image(coordinate, even_coordinate)
-            new_coordlist.extend(xy0)
-        elif coordinate_type == Distance:
-            new_coordlist.append(pc.to_image_distance(coordinate))
-        else:
-            new_coordlist.append(coordinate)
+        new_coordlist_list.append(new_coordlist)
 
-    return new_coordlist
+    return new_coordlist_list
 
 
 def check_wcs_and_convert(args, all_dms=False):
@@ -1,7 +1,14 @@
+from collections import OrderedDict
+
 import numpy as np
 from astropy.coordinates import SkyCoord
 from astropy.wcs import WCS
-from astropy.wcs.utils import proj_plane_pixel_scales
+from astropy.wcs.utils import proj_plane_pixel_area, proj_plane_pixel_scales
+
+# the number of headers whose WCS is kept by `_header_wcs`
+_WCS_CACHE_SIZE = 16
+
+_wcs_cache = OrderedDict()
 
 
 def _estimate_angle(angle, reg_coordinate_frame, header):
@@ -23,11 +30,11 @@ def _estimate_angle(angle, reg_coordinate_frame, header):
     angle : float
         The angle, measured from the Y axis in the WCS defined by ``header'`
     """
-    y_axis_rot = _calculate_rotation_angle(reg_coordinate_frame, header)
+    y_axis_rot = _header_wcs(header).rotation_angle(reg_coordinate_frame)
     return angle - y_axis_rot
 
 
-def _calculate_rotation_angle(reg_coordinate_frame, header):
+def _calculate_rotation_angle(reg_coordinate_frame, header, new_wcs=None):
     """Calculates the rotation angle from the region to the header's frame
 
     This attempts to be compatible with the implementation used by SAOImage
@@ -44,13 +51,17 @@ def _calculate_rotation_angle(reg_coordinate_frame, header):
     header : `~astropy.io.fits.Header` instance
         Header describing the image
 
+    new_wcs : `~astropy.wcs.WCS` instance, optional
+        WCS of the header, if it is already known
+
     Returns
     -------
     y_axis_rot : float
         Degrees by which the north axis in the region's frame is rotated when
         transformed to pixel coordinates
     """
-    new_wcs = WCS(header)
+    if new_wcs is None:
+        new_wcs = WCS(header)
     region_frame = SkyCoord(
         '0d 0d',
         frame=reg_coordinate_frame,
@@ -67,23 +78,340 @@ def _calculate_rotation_angle(reg_coordinate_frame, header):
         wcs=new_wcs,
         origin=1).transform_to(region_frame)
 
+    return _north_rotation(origin, new_wcs)
+
+
+def _calculate_rotation_angles(reg_coordinate_frame, lon, lat, header,
+                               new_wcs=None):
+    """Calculates the rotation angles from the region to the header's frame
+    at many positions
+
+    Unlike `_calculate_rotation_angle`, which measures the rotation of the
+    north axis at the center of the image, this measures it at each of
+    the positions, at once, which is more accurate for the shapes far
+    from the center of a wide-field image.
+
+    Parameters
+    ----------
+    reg_coordinate_frame : str
+        Coordinate frame used by the region file
+
+    lon, lat : `numpy.array`
+        Positions in the region's frame, in degrees
+
+    header : `~astropy.io.fits.Header` instance
+        Header describing the image
+
+    new_wcs : `~astropy.wcs.WCS` instance, optional
+        WCS of the header, if it is already known
+
+    Returns
+    -------
+    y_axis_rot : `numpy.array`
+        Degrees by which the north axis in the region's frame is rotated when
+        transformed to pixel coordinates, at each position
+    """
+    if new_wcs is None:
+        new_wcs = WCS(header)
+    origin = SkyCoord(lon, lat, unit='degree', frame=reg_coordinate_frame,
+                      obstime='J2000')
+
+    return _north_rotation(origin, new_wcs)
+
+
+def _calculate_pixel_scales(reg_coordinate_frame, lon, lat, header,
+                            new_wcs=None):
+    """Calculates the pixel scales of the image at many positions
+
+    The scales are those of the local Jacobian of the WCS, measured at
+    all the positions at once, distortions included, rather than the
+    scales at the reference pixel given by
+    `~astropy.wcs.utils.proj_plane_pixel_scales`.
+
+    Parameters
+    ----------
+    reg_coordinate_frame : str
+        Coordinate frame used by the region file
+
+    lon, lat : `numpy.array`
+        Positions in the region's frame, in degrees
+
+    header : `~astropy.io.fits.Header` instance
+        Header describing the image
+
+    new_wcs : `~astropy.wcs.WCS` instance, optional
+        WCS of the header, if it is already known
+
+    Returns
+    -------
+    pixel_scales : `numpy.array`
+        Degrees per pixel along each axis of the image, of shape (n, 2)
+
+    pixel_area_scale : `numpy.array`
+        Square root of the area of a pixel, in degrees, of shape (n,)
+    """
+    if new_wcs is None:
+        new_wcs = WCS(header)
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    n = len(lon)
+
+    # central differences over about a pixel to the east and to the
+    # north, without passing a pole
+    offset = proj_plane_pixel_scales(new_wcs)[1]
+    east = offset / np.maximum(np.cos(np.radians(lat)), 1e-8)
+    north = np.clip(lat + offset / 2, -90 + offset, 90)
+    south = north - offset
+
+    points = SkyCoord(np.concatenate([lon - east / 2, lon + east / 2,
+                                      lon, lon]),
+                      np.concatenate([lat, lat, south, north]),
+                      unit='degree', frame=reg_coordinate_frame,
+                      obstime='J2000')
+    x, y = points.to_pixel(new_wcs, origin=1)
+    x = x.reshape(4, n)
+    y = y.reshape(4, n)
+
+    # the pixels per degree on the sky, and its inverse
+    jacobian = np.empty((n, 2, 2))
+    jacobian[:, 0, 0] = (x[1] - x[0]) / offset
+    jacobian[:, 1, 0] = (y[1] - y[0]) / offset
+    jacobian[:, 0, 1] = (x[3] - x[2]) / offset
+    jacobian[:, 1, 1] = (y[3] - y[2]) / offset
+    matrix = np.linalg.inv(jacobian)
+
+    pixel_scales = np.sqrt((matrix ** 2).sum(axis=1))
+    pixel_area_scale = np.sqrt(np.abs(np.linalg.det(matrix)))
+    return pixel_scales, pixel_area_scale
+
+
+def _north_rotation(origin, new_wcs):
+    # the rotation of the north axis at the positions of origin, a
+    # SkyCoord in the region's frame
     offset = proj_plane_pixel_scales(new_wcs)[1]
 
     origin_x, origin_y = origin.to_pixel(new_wcs, origin=1)
     origin_lon = origin.data.lon.degree
     origin_lat = origin.data.lat.degree
 
+    # a step of about a pixel to the north, or to the south where it
+    # would pass the pole
+    step = np.where(origin_lat + offset > 90, -offset, offset)
     offset_point = SkyCoord(
-        origin_lon, origin_lat + offset, unit='degree',
+        origin_lon, origin_lat + step, unit='degree',
         frame=origin.frame.name, obstime='J2000')
     offset_x, offset_y = offset_point.to_pixel(new_wcs, origin=1)
 
     north_rot = np.arctan2(
-        offset_y - origin_y,
-        offset_x - origin_x) / np.pi * 180.
+        np.sign(step) * (offset_y - origin_y),
+        np.sign(step) * (offset_x - origin_x)) / np.pi * 180.
 
     cdelt = new_wcs.wcs.get_cdelt()
     if (cdelt > 0).all() or (cdelt < 0).all():
         return north_rot - 90
     else:
         return -(north_rot - 90)
+
+
+class _HeaderWCS(object):
+    """The WCS of a header, and the quantities derived from it
+
+    Parameters
+    ----------
+    header : `~astropy.io.fits.Header` instance
+        Header describing the image
+    """
+
+    def __init__(self, header):
+        self.header = header
+        self.wcs = WCS(header)
+        self._pixel_scales = None
+        self._pixel_area_scale = None
+        self._rotations = {}
+
+    @property
+    def pixel_scales(self):
+        """The pixel scales of the celestial axes, in degrees"""
+        if self._pixel_scales is None:
+            self._pixel_scales = proj_plane_pixel_scales(self.wcs)
+        return self._pixel_scales
+
+    @property
+    def pixel_area_scale(self):
+        """The square root of the pixel area of the celestial axes, in
+        degrees"""
+        if self._pixel_area_scale is None:
+            self._pixel_area_scale = np.sqrt(proj_plane_pixel_area(self.wcs))
+        return self._pixel_area_scale
+
+    def rotation_angle(self, reg_coordinate_frame):
+        """The rotation of the north axis of a frame, see
+        `_calculate_rotation_angle`, calculated once for each frame"""
+        if reg_coordinate_frame not in self._rotations:
+            self._rotations[reg_coordinate_frame] = _calculate_rotation_angle(
+                reg_coordinate_frame, self.header, self.wcs)
+        return self._rotations[reg_coordinate_frame]
+
+    def rotation_angles(self, reg_coordinate_frame, lon, lat):
+        """The rotation of the north axis of a frame at many positions,
+        see `_calculate_rotation_angles`"""
+        return _calculate_rotation_angles(reg_coordinate_frame, lon, lat,
+                                          self.header, self.wcs)
+
+    def local_pixel_scales(self, reg_coordinate_frame, lon, lat):
+        """The pixel scales at many positions, see
+        `_calculate_pixel_scales`"""
+        return _calculate_pixel_scales(reg_coordinate_frame, lon, lat,
+                                       self.header, self.wcs)
+
+
+def _header_wcs(header):
+    """The `_HeaderWCS` of a header, cached by the content of the header
+
+    The last `_WCS_CACHE_SIZE` headers are kept, so that converting many
+    region files (or the same one many times) with the same header only
+    parses it once.
+
+    Parameters
+    ----------
+    header : `~astropy.io.fits.Header` instance
+        Header describing the image
+
+    Returns
+    -------
+    header_wcs : `_HeaderWCS` instance
+    """
+    try:
+        key = header.tostring()
+    except AttributeError:
+        # not a Header, whose content may change without notice
+        return _HeaderWCS(header)
+
+    header_wcs = _wcs_cache.pop(key, None)
+    if header_wcs is None:
+        header_wcs = _HeaderWCS(header.copy())
+    _wcs_cache[key] = header_wcs
+    while len(_wcs_cache) > _WCS_CACHE_SIZE:
+        _wcs_cache.popitem(last=False)
+    return header_wcs
+
+
+def _plane_header(header, index):
+    """2-d header of a plane of an image with more than two axes
+
+    The celestial axes are the first two of the header. If they are
+    coupled to the other axes by the linear transformation, the position
+    on the plane changes the reference pixel of the plane.
+
+    Parameters
+    ----------
+    header : `~astropy.io.fits.Header` instance
+        Header describing the image
+
+    index : tuple of int
+        0-based index of the plane along the other axes, in the order of
+        the numpy array (the last axis of the header first)
+
+    Returns
+    -------
+    header : `~astropy.io.fits.Header` instance
+        Header describing the plane
+    """
+    wcs = _header_wcs(header).wcs
+
+    # the part of the intermediate coordinates of the celestial axes
+    # given by the other axes, in pixels of the celestial axes
+    pc = wcs.wcs.get_pc()
+    pixel = np.array(index[::-1], dtype=float) + 1
+    offset = pc[:2, 2:].dot(pixel - wcs.wcs.crpix[2:])
+    shift = np.linalg.solve(pc[:2, :2], offset)
+
+    # the axes are uncoupled before they are separated
+    uncoupled = wcs.deepcopy()
+    if uncoupled.wcs.has_cd():
+        matrix = uncoupled.wcs.cd.copy()
+    else:
+        matrix = pc.copy()
+    matrix[:2, 2:] = 0
+    matrix[2:, :2] = 0
+    if uncoupled.wcs.has_cd():
+        uncoupled.wcs.cd = matrix
+    else:
+        uncoupled.wcs.pc = matrix
+
+    plane_wcs = uncoupled.sub([1, 2])
+    plane_wcs.wcs.crpix = wcs.wcs.crpix[:2] - shift
+
+    plane_header = plane_wcs.to_header()
+    plane_header["NAXIS1"] = header["NAXIS1"]
+    plane_header["NAXIS2"] = header["NAXIS2"]
+    return plane_header
+
+
+def _is_plane_invariant(header):
+    """Whether all the planes of an image have the same celestial WCS
+
+    Parameters
+    ----------
+    header : `~astropy.io.fits.Header` instance
+        Header describing the image
+    """
+    wcs = _header_wcs(header).wcs
+    return not wcs.wcs.get_pc()[:2, 2:].any()
+
+
+def _unit_vector(lon, lat):
+    """Unit vectors of positions on the sphere
+
+    Parameters
+    ----------
+    lon, lat : float or `numpy.array`
+        Longitude and latitude, in degrees
+
+    Returns
+    -------
+    xyz : `numpy.array`
+        Cartesian coordinates, along the last axis
+    """
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    return np.stack([np.cos(lat) * np.cos(lon),
+                     np.cos(lat) * np.sin(lon),
+                     np.sin(lat)], axis=-1)
+
+
+def _tangent_plane(lon, lat, lon0, lat0):
+    """Gnomonic projection of positions on the plane tangent at a point
+
+    The plane is oriented as an image of the sky, with the latitude
+    increasing along y and the longitude decreasing along x, so that
+    the angles of regions in the frame of the positions are unchanged.
+    Positions further than 90 degrees from the tangent point have no
+    projection, and are given as NaN.
+
+    Parameters
+    ----------
+    lon, lat : float or `numpy.array`
+        Longitude and latitude of the positions, in degrees
+
+    lon0, lat0 : float
+        Longitude and latitude of the tangent point, in degrees
+
+    Returns
+    -------
+    x, y : `numpy.array`
+        Coordinates on the plane, in degrees at the tangent point
+    """
+    lon = np.radians(lon) - np.radians(lon0)
+    lat = np.radians(lat)
+    lat0 = np.radians(lat0)
+
+    cos_lat = np.cos(lat)
+    cos_c = (np.sin(lat0) * np.sin(lat) +
+             np.cos(lat0) * cos_lat * np.cos(lon))
+    cos_c = np.where(cos_c > 0, cos_c, np.nan)
+
+    x = -cos_lat * np.sin(lon) / cos_c
+    y = (np.cos(lat0) * np.sin(lat) -
+         np.sin(lat0) * cos_lat * np.cos(lon)) / cos_c
+    return np.degrees(x), np.degrees(y)